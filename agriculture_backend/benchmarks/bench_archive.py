@@ -0,0 +1,137 @@
+"""
+Cold storage benchmark: ReadingArchive blobs built from simulator data.
+
+Generates --days days of readings for the simulator's plots and sensors with
+its signal model (diurnal temperature, irrigation cycles, scenario anomalies,
+values rounded to 2 decimals, one reading per SEND_EVERY_SECONDS), packs each
+plot × sensor × day the way archive_readings does, and reports:
+  - bytes per reading: SensorReading row + indexes (when the configured
+    database has readings), plain zlib of the fixed-width rows, archive blob
+  - pack and unpack/decode throughput in readings per second
+
+Nothing is written to the database.
+
+Usage:
+    python agriculture_backend/benchmarks/bench_archive.py
+    python agriculture_backend/benchmarks/bench_archive.py --days 7 --repeat 5
+"""
+import argparse
+import os
+import struct
+import sys
+import time
+import zlib
+from datetime import datetime, timedelta, timezone
+
+import django
+
+# --- Django setup (standalone script) ---
+PROJECT_ROOT = os.path.abspath(
+    os.path.join(os.path.dirname(__file__), "..", "..")
+)
+sys.path.insert(0, PROJECT_ROOT)
+
+os.environ.setdefault(
+    "DJANGO_SETTINGS_MODULE",
+    "agriculture_backend.settings"
+)
+
+django.setup()
+
+from agriculture_backend.simulator import simulator as sim
+from monitoring.archive import decode, pack, unpack
+from monitoring.models import ReadingArchive
+from monitoring.retention import reading_bytes_per_row
+
+SENSOR_TYPES = ["moisture", "temperature", "humidity"]
+# timestamp, device timestamp, value, plot, sensor type, source
+ROW = struct.Struct("<qqdqHH")
+
+
+def simulator_days(days):
+    """{(plot_id, sensor_type, day): [(timestamp, value, source_code, device_timestamp)]}"""
+    start = datetime(2026, 1, 1, tzinfo=timezone.utc)
+    moisture = {pid: sim.MOISTURE_BASE for pid in sim.PLOT_IDS}
+    series = {}
+
+    for step in range(int(days * 86400 / sim.SEND_EVERY_SECONDS)):
+        device_ts = start + timedelta(seconds=step * sim.SEND_EVERY_SECONDS)
+        elapsed_min = step * sim.SEND_EVERY_SECONDS / 60.0
+        hour = device_ts.hour + device_ts.minute / 60.0
+
+        for plot_id in sim.PLOT_IDS:
+            temperature = sim.diurnal_temperature(hour) + sim.rng.normal(0, 0.5)
+            moisture[plot_id] = sim.moisture_change(moisture[plot_id], device_ts)
+            humidity = sim.humidity_from_temperature(temperature)
+            values = {"moisture": moisture[plot_id], "temperature": temperature, "humidity": humidity}
+
+            # the server stamps the reading after the HTTP round trip
+            received = device_ts + timedelta(microseconds=int(sim.rng.uniform(2000, 60000)))
+            for sensor_type in SENSOR_TYPES:
+                value, _ = sim.apply_scenarios(values[sensor_type], elapsed_min, plot_id, sensor_type)
+                key = (plot_id, sensor_type, device_ts.date())
+                series.setdefault(key, []).append((received, round(float(value), 2), 1, device_ts))
+
+    return series
+
+
+def best_of(func, repeat):
+    best = None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - t0
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--days", type=int, default=3)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    series = simulator_days(args.days)
+    total = sum(len(rows) for rows in series.values())
+    print(f"{total} simulator readings in {len(series)} plot-days "
+          f"({args.days} days, one reading per {sim.SEND_EVERY_SECONDS}s)")
+
+    pack_s, blobs = best_of(lambda: [pack(rows) for rows in series.values()], args.repeat)
+    unpack_s, _ = best_of(lambda: [unpack(blob) for blob in blobs], args.repeat)
+    archives = [ReadingArchive(plot_id=plot_id, sensor_type=sensor_type, day=day, data=blob)
+                for (plot_id, sensor_type, day), blob in zip(series, blobs)]
+    decode_s, decoded = best_of(lambda: [decode(a) for a in archives], args.repeat)
+
+    # lossless: decode gives back what was packed
+    for (key, rows), readings in zip(series.items(), decoded):
+        assert [(ts, value, dts) for ts, value, _, dts in rows] == [(ts, value, dts) for ts, value, _, dts in readings], key
+
+    fixed = b"".join(
+        ROW.pack(int(ts.timestamp() * 1e6), int(dts.timestamp() * 1e6), value, plot_id, 1, 1)
+        for (plot_id, _, _), rows in series.items() for ts, value, _, dts in rows
+    )
+    archive_bytes = sum(len(blob) for blob in blobs)
+
+    sizes = []
+    per_row = reading_bytes_per_row()
+    if per_row:
+        sizes.append(("SensorReading row + indexes (configured db)", per_row))
+    sizes += [
+        (f"fixed-width row ({ROW.size} bytes)", ROW.size),
+        ("fixed-width rows + zlib", len(zlib.compress(fixed, 6)) / total),
+        ("archive blob", archive_bytes / total),
+    ]
+    print("bytes per reading:")
+    for label, size in sizes:
+        print(f"  {label:<45}: {size:8.1f}")
+    if per_row:
+        print(f"  archive is x{per_row * total / archive_bytes:.0f} smaller than the table")
+
+    print("throughput:")
+    print(f"  pack            : {total / pack_s:>12,.0f} readings/s")
+    print(f"  unpack (arrays) : {total / unpack_s:>12,.0f} readings/s")
+    print(f"  decode (rows)   : {total / decode_s:>12,.0f} readings/s")
+
+
+if __name__ == "__main__":
+    main()
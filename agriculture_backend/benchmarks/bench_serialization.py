@@ -0,0 +1,86 @@
+"""
+List serialization benchmark: ModelSerializer + JSONRenderer vs the
+values_list + RowEncoder fast path used by GET /api/sensor-readings/.
+
+Both paths render the same rows from the configured database; the script
+checks the bytes are identical and reports rows per second.
+
+Usage:
+    python agriculture_backend/benchmarks/bench_serialization.py
+    python agriculture_backend/benchmarks/bench_serialization.py --rows 10000 --repeat 5
+"""
+import argparse
+import os
+import sys
+import time
+
+import django
+
+# --- Django setup (standalone script) ---
+PROJECT_ROOT = os.path.abspath(
+    os.path.join(os.path.dirname(__file__), "..", "..")
+)
+sys.path.insert(0, PROJECT_ROOT)
+
+os.environ.setdefault(
+    "DJANGO_SETTINGS_MODULE",
+    "agriculture_backend.settings"
+)
+
+django.setup()
+
+from rest_framework.renderers import JSONRenderer
+
+from monitoring.fast_serializers import RowEncoder
+from monitoring.models import SensorReading, AnomalyEvent
+from monitoring.serializers import SensorReadingSerializer, AnomalyEventSerializer
+
+
+def model_serializer_path(serializer_class, queryset):
+    return JSONRenderer().render(serializer_class(queryset, many=True).data)
+
+
+def fast_path(serializer_class, queryset):
+    encoder = RowEncoder(serializer_class)
+    return bytes(encoder.encode_json(queryset.values_list(*encoder.columns)))
+
+
+def best_of(func, repeat):
+    best = None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        body = func()
+        elapsed = time.perf_counter() - t0
+        best = elapsed if best is None else min(best, elapsed)
+    return best, body
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    cases = [
+        ("sensor readings", SensorReadingSerializer, SensorReading.objects.order_by("-timestamp")),
+        ("anomaly events", AnomalyEventSerializer, AnomalyEvent.objects.order_by("-timestamp")),
+    ]
+
+    for label, serializer_class, queryset in cases:
+        rows = list(queryset.values_list("id", flat=True)[:args.rows])
+        if not rows:
+            print(f"{label}: no rows, skipped")
+            continue
+        qs = queryset.filter(id__in=rows)
+
+        slow, slow_body = best_of(lambda: model_serializer_path(serializer_class, qs), args.repeat)
+        fast, fast_body = best_of(lambda: fast_path(serializer_class, qs), args.repeat)
+
+        print(f"{label} ({len(rows)} rows, {len(fast_body) / 1024:.0f} KB)")
+        print(f"  ModelSerializer : {slow * 1000:8.1f} ms  {len(rows) / slow:>10.0f} rows/s")
+        print(f"  RowEncoder      : {fast * 1000:8.1f} ms  {len(rows) / fast:>10.0f} rows/s")
+        print(f"  speedup x{slow / fast:.1f}, identical output: {slow_body == fast_body}")
+
+
+if __name__ == "__main__":
+    main()
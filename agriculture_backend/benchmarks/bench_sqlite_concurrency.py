@@ -0,0 +1,174 @@
+"""
+SQLite concurrency benchmark: simultaneous ingest writes and dashboard reads.
+
+Each database profile runs in a fresh interpreter on a fresh temporary
+database (AGRI_DB_PATH), never on db.sqlite3:
+  - dev:        stock SQLite settings
+  - production: AGRI_DB_PROFILE=production (WAL, pragmas, IMMEDIATE, persistent)
+  - prod+read:  production plus the query-only "read" alias for the readers
+
+Writer threads store single readings the way POST /api/sensor-readings/ does
+(reading + latest-value upsert in one transaction); reader threads run the
+reading list and stats queries. Reported: operations per second, p95
+latency and "database is locked" failures.
+
+Usage:
+    python agriculture_backend/benchmarks/bench_sqlite_concurrency.py
+    python agriculture_backend/benchmarks/bench_sqlite_concurrency.py --writers 4 --readers 8 --seconds 10
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+PROJECT_ROOT = os.path.abspath(
+    os.path.join(os.path.dirname(__file__), "..", "..")
+)
+
+PROFILES = {
+    "dev": {"AGRI_DB_PROFILE": "dev"},
+    "production": {"AGRI_DB_PROFILE": "production"},
+    "prod+read": {"AGRI_DB_PROFILE": "production", "AGRI_DB_READ_ALIAS": "1"},
+}
+
+CHILD = r"""
+import json, os, random, sys, threading, time
+from datetime import timedelta
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "agriculture_backend.settings")
+import django
+django.setup()
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import OperationalError, connections, transaction
+from django.utils import timezone
+
+from monitoring.db import read_alias
+from monitoring.ingest import update_latest_readings
+from monitoring.models import FarmProfile, FieldPlot, SensorReading
+from monitoring.stats import reading_stats
+
+writers, readers, seconds = int(sys.argv[1]), int(sys.argv[2]), float(sys.argv[3])
+
+call_command("migrate", verbosity=0)
+owner = User.objects.create(username="bench")
+farm = FarmProfile.objects.create(owner=owner, name="bench", location="bench", size_hectares=1, crop_type="x")
+plot_ids = [FieldPlot.objects.create(farm=farm, name=f"plot {i}", crop_variety="x").id for i in range(3)]
+
+# some history for the readers
+SensorReading.objects.bulk_create([
+    SensorReading(plot_id=random.choice(plot_ids), sensor_type=random.choice(["moisture", "temperature", "humidity"]),
+                  value=random.uniform(10, 60), source="bench")
+    for _ in range(20000)
+])
+
+stop = threading.Event()
+results = {"write": [], "read": []}
+errors = {"write": 0, "read": 0}
+lock = threading.Lock()
+
+
+def write_one():
+    with transaction.atomic():
+        reading = SensorReading.objects.create(
+            plot_id=random.choice(plot_ids), sensor_type="moisture",
+            value=random.uniform(10, 60), source="bench",
+        )
+        update_latest_readings([reading])
+
+
+def read_one():
+    db = read_alias()
+    list(
+        SensorReading.objects.using(db).filter(plot_id=random.choice(plot_ids))
+        .order_by("-timestamp").values_list("id", "timestamp", "sensor_type", "value")[:200]
+    )
+    end = timezone.now()
+    reading_stats(plot_ids, [], end - timedelta(hours=1), end, "minute", using=db)
+
+
+def loop(kind, func):
+    latencies = []
+    failed = 0
+    while not stop.is_set():
+        t0 = time.perf_counter()
+        try:
+            func()
+        except OperationalError as e:
+            if "locked" not in str(e):
+                raise
+            failed += 1
+            continue
+        latencies.append(time.perf_counter() - t0)
+    connections.close_all()
+    with lock:
+        results[kind].extend(latencies)
+        errors[kind] += failed
+
+
+threads = [threading.Thread(target=loop, args=("write", write_one)) for _ in range(writers)]
+threads += [threading.Thread(target=loop, args=("read", read_one)) for _ in range(readers)]
+for t in threads:
+    t.start()
+time.sleep(seconds)
+stop.set()
+for t in threads:
+    t.join()
+
+
+def summary(kind):
+    lat = sorted(results[kind])
+    p95 = lat[int(len(lat) * 0.95)] * 1000 if lat else 0.0
+    return {"ops_s": len(lat) / seconds, "p95_ms": p95, "locked": errors[kind]}
+
+
+with connections["default"].cursor() as cursor:
+    cursor.execute("PRAGMA journal_mode")
+    journal = cursor.fetchone()[0]
+
+print(json.dumps({"journal": journal, "write": summary("write"), "read": summary("read")}))
+"""
+
+
+def run_profile(name, args):
+    with tempfile.TemporaryDirectory() as tmp:
+        env = {k: v for k, v in os.environ.items()
+               if k not in ("AGRI_DB_READ_ALIAS", "DJANGO_SETTINGS_MODULE")}
+        env.update(
+            AGRI_DB_PATH=os.path.join(tmp, "bench.sqlite3"),
+            AGRI_ML_WARMUP="0",
+            AGRI_INGEST_WRITE_BEHIND="0",
+            **PROFILES[name],
+        )
+        out = subprocess.run(
+            [sys.executable, "-c", CHILD, str(args.writers), str(args.readers), str(args.seconds)],
+            cwd=PROJECT_ROOT, env=env, capture_output=True, text=True,
+        )
+        if out.returncode != 0:
+            raise SystemExit(f"{name} failed:\n{out.stderr}")
+        return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--writers", type=int, default=4)
+    parser.add_argument("--readers", type=int, default=4)
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument("--profile", choices=list(PROFILES), action="append")
+    args = parser.parse_args()
+
+    print(f"{args.writers} writers, {args.readers} readers, {args.seconds:.0f}s per profile")
+    print(f"{'profile':<12}{'journal':<9}{'writes/s':>10}{'p95 ms':>9}{'locked':>8}"
+          f"{'reads/s':>10}{'p95 ms':>9}{'locked':>8}")
+    for name in args.profile or list(PROFILES):
+        r = run_profile(name, args)
+        w, rd = r["write"], r["read"]
+        print(f"{name:<12}{r['journal']:<9}{w['ops_s']:>10.0f}{w['p95_ms']:>9.1f}{w['locked']:>8}"
+              f"{rd['ops_s']:>10.1f}{rd['p95_ms']:>9.1f}{rd['locked']:>8}")
+
+
+if __name__ == "__main__":
+    main()
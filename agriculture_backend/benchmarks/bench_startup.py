@@ -0,0 +1,75 @@
+"""
+Startup benchmark: import time and RSS of a worker process.
+
+Each configuration runs in a fresh interpreter:
+  - api: django.setup() + the URLconf (every view module imported)
+  - ml:  same, plus iris_service.warmup() (pandas, sklearn and all models)
+
+Usage:
+    python agriculture_backend/benchmarks/bench_startup.py
+    python agriculture_backend/benchmarks/bench_startup.py --runs 5
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+PROJECT_ROOT = os.path.abspath(
+    os.path.join(os.path.dirname(__file__), "..", "..")
+)
+
+CHILD = r"""
+import json, os, resource, sys, time
+t0 = time.perf_counter()
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "agriculture_backend.settings")
+import django
+django.setup()
+from django.urls import get_resolver
+get_resolver().url_patterns
+t1 = time.perf_counter()
+models = []
+if sys.argv[1] == "ml":
+    from mlmodule.iris_service import warmup
+    models = warmup()
+t2 = time.perf_counter()
+print(json.dumps({
+    "setup_ms": (t1 - t0) * 1000,
+    "total_ms": (t2 - t0) * 1000,
+    "rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    "pandas_loaded": "pandas" in sys.modules,
+    "models": models,
+}))
+"""
+
+
+def run_once(config):
+    env = dict(os.environ, AGRI_ML_WARMUP="0")
+    out = subprocess.run(
+        [sys.executable, "-c", CHILD, config],
+        cwd=PROJECT_ROOT, env=env, capture_output=True, text=True, check=True,
+    )
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'config':<6} {'startup ms':>11} {'total ms':>9} {'max RSS MB':>11}  pandas  models")
+    for config in ("api", "ml"):
+        runs = [run_once(config) for _ in range(args.runs)]
+        last = runs[-1]
+        print(
+            f"{config:<6} "
+            f"{statistics.median(r['setup_ms'] for r in runs):>11.0f} "
+            f"{statistics.median(r['total_ms'] for r in runs):>9.0f} "
+            f"{statistics.median(r['rss_mb'] for r in runs):>11.1f}  "
+            f"{str(last['pandas_loaded']):<6}  {last['models']}"
+        )
+
+
+if __name__ == "__main__":
+    main()
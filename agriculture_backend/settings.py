@@ -1,5 +1,5 @@
 
-
+import os
 from pathlib import Path
 from datetime import timedelta
 
@@ -34,6 +34,7 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'monitoring.middleware.CompressionMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -68,10 +69,58 @@ WSGI_APPLICATION = 'agriculture_backend.wsgi.application'
 DATABASES = {
     "default": {
         "ENGINE": "django.db.backends.sqlite3",
-        "NAME": BASE_DIR / "db.sqlite3",
+        "NAME": os.environ.get("AGRI_DB_PATH") or BASE_DIR / "db.sqlite3",
     }
 }
 
+# SQLite production profile: AGRI_DB_PROFILE=production
+# - WAL journal so dashboard reads never block ingest writes (and vice versa)
+# - synchronous=NORMAL: durable across application crashes; a power loss may
+#   drop the last commits but never corrupts the database in WAL mode
+# - 64 MB page cache, 256 MB memory-mapped reads, 5 s busy timeout
+# - IMMEDIATE transactions take the write lock up front, so writers wait for
+#   each other (busy_timeout) instead of failing with "database is locked"
+# - persistent connections (CONN_MAX_AGE)
+# AGRI_DB_READ_ALIAS=1 also adds a "read" alias (same file, query_only) used
+# by the GET endpoints (monitoring/db.py).
+DB_PROFILE = os.environ.get("AGRI_DB_PROFILE", "dev")
+
+SQLITE_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "cache_size": -64000,
+    "mmap_size": 268435456,
+    "busy_timeout": 5000,
+    "temp_store": "MEMORY",
+}
+
+
+def _sqlite_init_command(pragmas):
+    return "; ".join(f"PRAGMA {name}={value}" for name, value in pragmas.items())
+
+
+if DB_PROFILE == "production":
+    DATABASES["default"].update({
+        "CONN_MAX_AGE": 600,
+        "CONN_HEALTH_CHECKS": True,
+        "OPTIONS": {
+            "init_command": _sqlite_init_command(SQLITE_PRAGMAS),
+            "transaction_mode": "IMMEDIATE",
+            "timeout": 5,
+        },
+    })
+
+    if os.environ.get("AGRI_DB_READ_ALIAS") == "1":
+        DATABASES["read"] = {
+            **DATABASES["default"],
+            "OPTIONS": {
+                "init_command": _sqlite_init_command({**SQLITE_PRAGMAS, "query_only": "ON"}),
+                "timeout": 5,
+            },
+            # same database file: tests must not create a second one
+            "TEST": {"MIRROR": "default"},
+        }
+
 # Password validation
 # https://docs.djangoproject.com/en/5.0/ref/settings/#auth-password-validators
 
@@ -119,7 +168,7 @@ REST_FRAMEWORK = {
     "DEFAULT_AUTHENTICATION_CLASSES": (
         "rest_framework.authentication.SessionAuthentication",
         "rest_framework.authentication.BasicAuthentication",
-        "rest_framework_simplejwt.authentication.JWTAuthentication",
+        "monitoring.authentication.RoleJWTAuthentication",
     ),
     "DEFAULT_PERMISSION_CLASSES": (
         "rest_framework.permissions.IsAuthenticated",
@@ -128,4 +177,189 @@ REST_FRAMEWORK = {
 
 SIMPLE_JWT = {
     "ACCESS_TOKEN_LIFETIME": timedelta(minutes=60),
+    # adds the "role" claim read by monitoring.permissions
+    "TOKEN_OBTAIN_SERIALIZER": "monitoring.serializers.RoleTokenObtainPairSerializer",
+    # re-reads the role (and rejects inactive users) on every refresh
+    "TOKEN_REFRESH_SERIALIZER": "monitoring.serializers.RoleTokenRefreshSerializer",
+}
+
+# Role lookups for session/basic auth (monitoring/permissions.py) are cached
+# this long; JWT requests read the role claim instead. Role changes reach
+# existing access tokens when they expire.
+ROLE_CACHE_SECONDS = 60
+
+# Device API keys (monitoring/authentication.py) are cached in each worker
+# for this long; revoking a key takes effect in other workers within it.
+DEVICE_KEY_CACHE_SECONDS = 60
+
+# Ingestion backpressure (monitoring/throttling.py)
+# Each device (or user) may post RATE readings per second per plot, in
+# bursts of up to BURST (429 + Retry-After beyond that). A larger batch is
+# accepted from a full bucket and throttles the next uploads until it is paid
+# back. At most MAX_PENDING_WRITES uploads are written at once (503 +
+# Retry-After beyond).
+INGEST_THROTTLE = {
+    "RATE": 5.0,
+    "BURST": 30,
+    "MAX_BUCKETS": 10000,
+    "MAX_PENDING_WRITES": 64,
+    "SHED_RETRY_AFTER": 1,
+}
+
+# Largest list accepted by a batch POST /api/sensor-readings/
+INGEST_MAX_BATCH = 1000
+
+# Write-behind ingestion (monitoring/ingest.py), off by default.
+# When enabled, POSTs answer 202 once the readings are buffered in memory and
+# a background thread commits them every BATCH_SIZE readings or FLUSH_SECONDS.
+# Up to MAX_QUEUE accepted readings (normally < FLUSH_SECONDS worth) are lost
+# if the process is killed; a normal shutdown flushes them. A full buffer
+# answers 503 + Retry-After.
+INGEST_WRITE_BEHIND = {
+    "ENABLED": os.environ.get("AGRI_INGEST_WRITE_BEHIND") == "1",
+    "BATCH_SIZE": 500,
+    "FLUSH_SECONDS": 0.5,
+    "MAX_QUEUE": 10000,
+    "RETRIES": 3,
+}
+
+# Ring buffers of recent vectors (monitoring/ringbuffer.py)
+# Ingest writes every reading into a memory-mapped file per plot holding its
+# last SLOTS vectors (one per second with data); detection reads recent
+# windows from there. DIR defaults to a temp directory per database.
+READING_RING = {
+    "ENABLED": os.environ.get("AGRI_READING_RING", "1") == "1",
+    "DIR": os.environ.get("AGRI_READING_RING_DIR"),
+    "SLOTS": 8192,
 }
+
+# Reading retention (monitoring/retention.py, python manage.py apply_retention)
+# Raw readings older than RAW_DAYS are rolled into ROLLUP ("hour"/"day")
+# aggregates and deleted, CHUNK_SIZE rows per transaction with PAUSE_SECONDS
+# between chunks. ROLLUP_DAYS = None keeps rollups forever. These are the
+# defaults; RetentionPolicy rows override them per farm and sensor type.
+READING_RETENTION = {
+    "RAW_DAYS": 90,
+    "ROLLUP": "hour",
+    "ROLLUP_DAYS": None,
+    "CHUNK_SIZE": 2000,
+    "PAUSE_SECONDS": 0.05,
+    "INTERVAL_SECONDS": 3600,
+}
+
+# Cold storage (monitoring/archive.py, python manage.py archive_readings)
+# Whole days of readings older than AFTER_DAYS are packed into one compressed
+# ReadingArchive row per plot and sensor type; export and stats still read them.
+# Retention policies still apply: archived days past a policy's cutoff are
+# rolled up and deleted by apply_retention.
+READING_ARCHIVE = {
+    "AFTER_DAYS": 30,
+    "ZLIB_LEVEL": 6,
+}
+
+# AgriBot recommendation pipeline (mlmodule/recommendation_pipeline.py)
+# New anomaly events are queued on commit and turned into recommendations
+# by a background worker, BATCH_SIZE events at a time.
+AGRIBOT_PIPELINE = {
+    "ENABLED": True,
+    "BATCH_SIZE": 50,
+    "BATCH_WAIT_SECONDS": 1.0,
+    "TEMPLATE": "farmer_friendly",
+}
+
+# Anomaly episodes (mlmodule/iris_service.py)
+# Anomalous vectors of the same plot less than this many seconds apart are
+# merged into one AnomalyEvent (and one recommendation). 0 = one event per vector.
+ANOMALY_EPISODE_GAP_SECONDS = 120
+
+# Trend statistics (mlmodule/trends.py)
+# Per-plot EWMAs updated with every vector detection scores: the level
+# (FAST_SECONDS), its recent reference (WINDOW_SECONDS) and its baseline
+# (BASELINE_SECONDS). They give AgriBot's moisture_trend (% change against the
+# reference) and temp_trend (°C of the reference above the baseline). A plot is warmed up from
+# its last WARMUP_MINUTES of vectors the first time a process sees it.
+TREND_STATS = {
+    "FAST_SECONDS": 120,
+    "WINDOW_SECONDS": 1800,
+    "BASELINE_SECONDS": 86400,
+    "WARMUP_MINUTES": 360,
+}
+
+# POST /api/anomalies/run-ml/ result cache (mlmodule/iris_service.py)
+# Identical requests share one detection run; the result is reused for this
+# many seconds while no new reading is ingested.
+RUN_ML_CACHE_SECONDS = 10
+
+# ML models (mlmodule/iris_service.py)
+ML_MODELS_DIR = BASE_DIR / "agriculture_backend" / "MLmodels" / "models"
+
+# Shared models for groups of plots (mlmodule/model_groups.py,
+# python manage.py train_model_groups). MODE "plot" uses per-plot models only,
+# "fallback" a plot's group model when it has no model of its own (new plots),
+# "group" group models only. Plots are grouped BY "variety" (crop variety) or
+# "stats" (k-means over baseline statistics, at most GROUPS groups).
+# Running workers pick up new group (and per-plot) models on restart.
+ML_MODEL_GROUPS = {
+    "MODE": os.environ.get("AGRI_ML_MODEL_MODE", "fallback"),
+    "BY": "variety",
+    "GROUPS": 8,
+    "N_ESTIMATORS": 200,
+    "CONTAMINATION": 0.02,
+}
+
+# Model training (mlmodule/training.py, python manage.py train_models)
+# Each plot's model is fitted on its last DAYS of vectors from the database
+# (at most MAX_VECTORS, the most recent; anomaly episodes and EXCLUDE_SOURCES
+# readings left out) in WORKERS processes (None = one per core), keeping the
+# vectors and models in flight under MEMORY_MB.
+# train_models --refresh fits REFRESH_FRACTION of each model's trees on the
+# vectors since its last training, replacing the oldest ones (REFRESH_MODE
+# "replace") or adding to them ("add", up to MAX_TREES). A plot is left for
+# a full retrain when more than REFRESH_MAX_FLAGGED of its new vectors are
+# anomalous to the current model or a sensor mean moved more than
+# REFRESH_MAX_SHIFT baseline deviations.
+# The simulator sends normal and scenario readings alike as
+# "simulator_scenarios"; its anomalous spans are left out through their
+# anomaly episodes, so that source is not in EXCLUDE_SOURCES.
+ML_TRAINING = {
+    "DAYS": 30,
+    "MAX_VECTORS": 50000,
+    "MIN_VECTORS": 50,
+    "WORKERS": None,
+    "MEMORY_MB": 512,
+    "EXCLUDE_SOURCES": ["test"],
+    "N_ESTIMATORS": 200,
+    "CONTAMINATION": 0.02,
+    "CHUNK_SIZE": 5000,
+    "REFRESH_FRACTION": 0.25,
+    "REFRESH_MODE": "replace",
+    "REFRESH_MAX_FLAGGED": 0.2,
+    "REFRESH_MAX_SHIFT": 3.0,
+    "MAX_TREES": 400,
+}
+
+# pandas/sklearn and the models are loaded lazily on the first detection.
+# Set AGRI_ML_WARMUP=1 on ML workers to load everything at startup instead.
+ML_WARMUP = os.environ.get("AGRI_ML_WARMUP") == "1"
+
+# Local inference server (python manage.py run_inference_server)
+# When set, detection scores through this Unix socket and falls back to the
+# in-process models if the server is unreachable.
+ML_INFERENCE_SOCKET = os.environ.get("AGRI_INFERENCE_SOCKET")
+ML_INFERENCE_TIMEOUT = 2.0
+ML_INFERENCE_RETRY_SECONDS = 30
+
+# Response compression (monitoring/middleware.py)
+# Bulk API responses (paths and content types below) of at least
+# MIN_BYTES are sent zstd- or gzip-compressed when the client's
+# Accept-Encoding allows it. Only list those that carry no secrets: HTML
+# pages with CSRF tokens must stay uncompressed (BREACH).
+RESPONSE_COMPRESSION_MIN_BYTES = 1024
+RESPONSE_COMPRESSION_ZSTD_LEVEL = 3
+RESPONSE_COMPRESSION_PATHS = ["/api/sensor-readings/", "/api/anomalies/"]
+RESPONSE_COMPRESSION_TYPES = [
+    "application/json",
+    "application/msgpack",
+    "application/vnd.apache.arrow.stream",
+    "application/x-npz",
+]
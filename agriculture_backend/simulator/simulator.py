@@ -1,40 +1,59 @@
+import os
 import time
 import numpy as np
-import requests
 from datetime import datetime, timezone, timedelta
 
 # -----------------------------
-# Get JWT token
+# Authentication
 # -----------------------------
+# With a device key (python manage.py create_device_key ...) the simulator
+# posts as a device: AGRI_DEVICE_KEY=<key> python simulator.py
+# Otherwise it logs in with a user account and uses JWT.
 TOKEN_URL = "http://127.0.0.1:8000/api/token/"  # adjust if your endpoint differs
 USERNAME = "syrin"
 PASSWORD = "cyrine"
+DEVICE_KEY = os.environ.get("AGRI_DEVICE_KEY")
 
-token_resp = requests.post(TOKEN_URL, json={"username": USERNAME, "password": PASSWORD})
-if token_resp.status_code != 200:
-    raise Exception(f"Failed to get token: {token_resp.status_code} → {token_resp.text}")
+HEADERS = {"Content-Type": "application/json"}
 
-access_token = token_resp.json()["access"]
 
-HEADERS = {
-    "Content-Type": "application/json",
-    "Authorization": f"Bearer {access_token}",
-}
+def authenticate():
+    # imported here: mlmodule/evaluation.py imports this module for its signal
+    # model on servers without requests
+    import requests
+
+    if DEVICE_KEY:
+        HEADERS["Authorization"] = f"Api-Key {DEVICE_KEY}"
+        print("Using device API key\n")
+        return
+
+    token_resp = requests.post(TOKEN_URL, json={"username": USERNAME, "password": PASSWORD})
+    if token_resp.status_code != 200:
+        raise Exception(f"Failed to get token: {token_resp.status_code} → {token_resp.text}")
+
+    HEADERS["Authorization"] = f"Bearer {token_resp.json()['access']}"
+    show_profiles()
+
 
 # -----------------------------
 # Test user profile & permissions (optional)
 # -----------------------------
 PROFILE_URL = "http://127.0.0.1:8000/api/user-profiles/"
-profile_response = requests.get(PROFILE_URL, headers=HEADERS)
-if profile_response.status_code == 200:
-    profiles = profile_response.json()
-    print("=== User Profiles & Roles ===")
-    for profile in profiles:
-        # adjust keys if your API returns different field names
-        print(f"ID: {profile.get('id')}, User: {profile.get('user')}, Role: {profile.get('role')}")
-    print("=============================\n")
-else:
-    print(f"Failed to fetch profiles: {profile_response.status_code} → {profile_response.text}\n")
+
+
+def show_profiles():
+    import requests
+
+    profile_response = requests.get(PROFILE_URL, headers=HEADERS)
+    if profile_response.status_code == 200:
+        profiles = profile_response.json()
+        print("=== User Profiles & Roles ===")
+        for profile in profiles:
+            # adjust keys if your API returns different field names
+            print(f"ID: {profile.get('id')}, User: {profile.get('user')}, Role: {profile.get('role')}")
+        print("=============================\n")
+    else:
+        print(f"Failed to fetch profiles: {profile_response.status_code} → {profile_response.text}\n")
 
 # -----------------------------
 # API setup - send sensor readings only
@@ -146,8 +165,12 @@ def apply_scenarios(value: float, elapsed_min: float, plot_id: int, sensor_type:
 # Send readings to API
 # -----------------------------
 def send_reading(timestamp: datetime, plot_id: int, sensor_type: str, value: float):
+    import requests
+
+    # device_timestamp makes retries safe: the server stores each
+    # (source, plot, sensor_type, device_timestamp) reading once
     payload = {
-        "timestamp": timestamp.isoformat(),
+        "device_timestamp": timestamp.isoformat(),
         "plot": plot_id,
         "sensor_type": sensor_type,
         "value": round(float(value), 2),
@@ -159,16 +182,12 @@ def send_reading(timestamp: datetime, plot_id: int, sensor_type: str, value: flo
     if resp.status_code not in (200, 201):
         print("Response body:", resp.text)
 
-
-    resp = requests.post(SENSOR_API_URL, json=payload, headers=HEADERS)
-    print(f"[PLOT {plot_id}] {sensor_type}={payload['value']} → status {resp.status_code}")
-    if resp.status_code not in (200, 201):
-        print("Response body:", resp.text)
-
 # -----------------------------
 # Main loop
 # -----------------------------
 def main():
+    authenticate()
+
     print("Starting sensor simulator with continuous anomaly generation")
     print(f"Monitoring plots: {PLOT_IDS}")
     print(f"Update interval: {SEND_EVERY_SECONDS}s (~{SEND_EVERY_SECONDS/60:.1f} min)")
@@ -8,6 +8,9 @@ urlpatterns = [
     # API Monitoring
     path("api/", include("monitoring.urls")),
     path("api-auth/", include("rest_framework.urls")),
+
+    # ML Module (Iris + AgriBot)
+    path("ml/", include("mlmodule.urls")),
     
 
     # JWT Auth
@@ -397,11 +397,14 @@ def generate_recommendation(anomaly_event, template_type='summary'):
     readings = _parse_sensor_values(anomaly_event.anomaly_type)
     
     # Apply rules to analyze the situation
-    rule_result = AgriBotRules.analyze_conditions(
+    rule_result = AgriBotRules.analyze_with_trends(
         temperature=readings['temperature'],
         humidity=readings['humidity'],
         moisture=readings['moisture'],
-        severity=anomaly_event.severity
+        severity=anomaly_event.severity,
+        # plot trends detection stored on the event (mlmodule/trends.py)
+        moisture_trend=getattr(anomaly_event, 'moisture_trend', None),
+        temp_trend=getattr(anomaly_event, 'temp_trend', None),
     )
     
     # Calculate confidence based on urgency and severity
@@ -460,6 +463,8 @@ def create_recommendation_record(anomaly_event, template_type='farmer_friendly')
         existing.recommended_action = recommendation['recommended_action']
         existing.explanation_text = recommendation['explanation_text']
         existing.confidence = recommendation['confidence']
+        existing.urgency = recommendation['urgency']
+        existing.category = recommendation['category']
         existing.save()
         print(f"Updated recommendation for anomaly {anomaly_event.id}")
         return existing
@@ -469,7 +474,9 @@ def create_recommendation_record(anomaly_event, template_type='farmer_friendly')
             anomaly_event=anomaly_event,
             recommended_action=recommendation['recommended_action'],
             explanation_text=recommendation['explanation_text'],
-            confidence=recommendation['confidence']
+            confidence=recommendation['confidence'],
+            urgency=recommendation['urgency'],
+            category=recommendation['category']
         )
         print(f"Created recommendation for anomaly {anomaly_event.id}")
         return rec
@@ -4,3 +4,14 @@ from django.apps import AppConfig
 class MlmoduleConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'mlmodule'
+
+    def ready(self):
+        from django.conf import settings
+
+        # registers the recommendation queue-depth gauge
+        from . import recommendation_pipeline  # noqa: F401
+
+        # ML workers opt in to loading pandas/sklearn and all models up front
+        if getattr(settings, "ML_WARMUP", False):
+            from .iris_service import warmup
+            warmup()
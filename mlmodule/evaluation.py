@@ -0,0 +1,210 @@
+"""
+Labeled evaluation of the Iris models with the simulator's scenarios
+(python manage.py evaluate_models).
+
+scenario_vectors() runs the simulator's signal model (diurnal temperature,
+irrigation cycles, humidity from temperature, SCENARIOS repeating every
+CYCLE_DURATION minutes) offline, one vector per SEND_EVERY_SECONDS and plot,
+and labels each vector with the scenario active for it (None = normal). The
+labeled vectors can be saved to a CSV and replayed, so model changes are
+compared on the same data.
+
+evaluate() scores them per plot through iris_service.score_vectors() (the
+inference server when configured, else the in-process model, own or group),
+flags score < 0 as detection does, and reports precision, recall and F1 per
+plot and scenario, scoring throughput and memory.
+"""
+import csv
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+FEATURES = ["temperature", "humidity", "moisture"]
+CSV_COLUMNS = ["timestamp", "plot_id"] + FEATURES + ["scenario"]
+
+
+def scenario_vectors(hours, seed=42, plot_ids=None, start=None):
+    """
+    [(timestamp, plot_id, temperature, humidity, moisture, scenario label or None)]
+    of `hours` of simulated data, in time order.
+    """
+    import numpy as np
+
+    from agriculture_backend.simulator import simulator as sim
+
+    # reproducible runs: the simulator keeps its random state and irrigation clock in globals
+    sim.rng = np.random.default_rng(seed=seed)
+    start = start or datetime(2026, 1, 1, tzinfo=dt_timezone.utc)
+    sim.last_irrigation = start - timedelta(hours=6)
+    plot_ids = plot_ids or sim.PLOT_IDS
+    moisture = {pid: sim.MOISTURE_BASE for pid in plot_ids}
+
+    rows = []
+    for step in range(int(hours * 3600 / sim.SEND_EVERY_SECONDS)):
+        now = start + timedelta(seconds=step * sim.SEND_EVERY_SECONDS)
+        elapsed_min = step * sim.SEND_EVERY_SECONDS / 60.0
+        hour = now.hour + now.minute / 60.0
+
+        # same order of random draws as simulator.main()
+        for plot_id in plot_ids:
+            temperature = sim.diurnal_temperature(hour) + sim.rng.normal(0, 0.5)
+            moisture[plot_id] = sim.moisture_change(moisture[plot_id], now)
+            humidity = sim.humidity_from_temperature(temperature)
+
+            m, m_events = sim.apply_scenarios(moisture[plot_id], elapsed_min, plot_id, "moisture")
+            t, t_events = sim.apply_scenarios(temperature, elapsed_min, plot_id, "temperature")
+            h, h_events = sim.apply_scenarios(humidity, elapsed_min, plot_id, "humidity")
+
+            events = m_events + t_events + h_events
+            # values as the simulator sends them
+            rows.append((
+                now, plot_id, round(float(t), 2), round(float(h), 2), round(float(m), 2),
+                events[0]["label"] if events else None,
+            ))
+    return rows
+
+
+def save_csv(rows, path):
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(CSV_COLUMNS)
+        for ts, plot_id, t, h, m, scenario in rows:
+            writer.writerow([ts.isoformat(), plot_id, t, h, m, scenario or ""])
+
+
+def load_csv(path, plot_ids=None):
+    rows = []
+    with open(path, newline="") as f:
+        for record in csv.DictReader(f):
+            plot_id = int(record["plot_id"])
+            if plot_ids and plot_id not in plot_ids:
+                continue
+            rows.append((
+                datetime.fromisoformat(record["timestamp"]), plot_id,
+                float(record["temperature"]), float(record["humidity"]), float(record["moisture"]),
+                record["scenario"] or None,
+            ))
+    return rows
+
+
+def _counts():
+    return {"tp": 0, "fp": 0, "fn": 0, "tn": 0}
+
+
+def _metrics(counts):
+    tp, fp, fn = counts["tp"], counts["fp"], counts["fn"]
+    precision = tp / (tp + fp) if tp + fp else 0.0
+    recall = tp / (tp + fn) if tp + fn else 0.0
+    f1 = 2 * precision * recall / (precision + recall) if precision + recall else 0.0
+    return {**counts, "precision": precision, "recall": recall, "f1": f1}
+
+
+def evaluate(rows, repeat=3):
+    """
+    Score labeled vectors per plot and compare the flags with the labels.
+
+    Returns {"by_plot": {plot_id: metrics}, "by_scenario": {(plot_id, label): metrics},
+    "total": metrics, "performance": {...}}. Metrics have tp, fp, fn, tn,
+    precision, recall and f1; a scenario's precision counts the plot's false
+    positives. Plots without a model are listed in "no_model".
+    """
+    import numpy as np
+    # imported before tracing: memory is measured for the models and scoring only
+    import pandas  # noqa: F401
+    import sklearn.ensemble  # noqa: F401
+
+    from . import iris_service
+    from .model_groups import model_bytes
+
+    by_plot_rows = {}
+    for row in rows:
+        by_plot_rows.setdefault(row[1], []).append(row)
+
+    by_plot, by_scenario, no_model = {}, {}, []
+    load_seconds, score_seconds, scored = 0.0, 0.0, 0
+    sizes = {}
+
+    plots = []
+    # traced: model loading and one scoring pass per plot
+    tracemalloc.start()
+    for plot_id, plot_rows in sorted(by_plot_rows.items()):
+        X = np.array([row[2:5] for row in plot_rows], dtype=float)
+
+        # first call loads the model (or connects to the inference server)
+        t0 = time.perf_counter()
+        scores = iris_service.score_vectors(plot_id, X[:1])
+        load_seconds += time.perf_counter() - t0
+        if scores is None:
+            no_model.append(plot_id)
+            continue
+
+        plots.append((plot_id, X, [row[5] for row in plot_rows], iris_service.score_vectors(plot_id, X)))
+
+        model = iris_service._model_cache.get(plot_id)
+        if model is not None:
+            key = getattr(model, "group", None) or f"plot_{plot_id}"
+            sizes[key] = model_bytes(getattr(model, "forest", model))
+
+    _, traced_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    for plot_id, X, labels, scores in plots:
+        # timed untraced, best of `repeat`
+        best = None
+        for _ in range(repeat):
+            t0 = time.perf_counter()
+            iris_service.score_vectors(plot_id, X)
+            elapsed = time.perf_counter() - t0
+            best = elapsed if best is None else min(best, elapsed)
+        score_seconds += best
+        scored += len(X)
+
+        flags = np.asarray(scores) < 0
+        plot_counts = _counts()
+        for flagged, label in zip(flags, labels):
+            if label is None:
+                plot_counts["fp" if flagged else "tn"] += 1
+                continue
+            plot_counts["tp" if flagged else "fn"] += 1
+            scenario = by_scenario.setdefault((plot_id, label), _counts())
+            scenario["tp" if flagged else "fn"] += 1
+
+        by_plot[plot_id] = plot_counts
+        for (pid, _), counts in by_scenario.items():
+            if pid == plot_id:
+                counts["fp"] = plot_counts["fp"]
+                counts["tn"] = plot_counts["tn"]
+
+    max_rss = None
+    if resource is not None:
+        # ru_maxrss is in KiB on Linux, bytes on macOS
+        max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * (1 if sys.platform == "darwin" else 1024)
+
+    total = _counts()
+    for counts in by_plot.values():
+        for key in ("tp", "fp", "fn", "tn"):
+            total[key] += counts[key]
+
+    return {
+        "by_plot": {pid: _metrics(c) for pid, c in by_plot.items()},
+        "by_scenario": {key: _metrics(c) for key, c in sorted(by_scenario.items())},
+        "total": _metrics(total),
+        "no_model": no_model,
+        # traced_peak_bytes: Python/NumPy allocations while loading the models and scoring once
+        "performance": {
+            "vectors": scored,
+            "score_seconds": score_seconds,
+            "vectors_per_second": scored / score_seconds if score_seconds else 0.0,
+            "load_seconds": load_seconds,
+            "model_bytes": sum(sizes.values()),
+            "models": len(sizes),
+            "traced_peak_bytes": traced_peak,
+            "max_rss_bytes": max_rss,
+        },
+    }
@@ -0,0 +1,197 @@
+"""
+Local inference server for Iris.
+
+One process per host holds pandas/sklearn and every plot model, and web
+workers send it batches of vectors over a Unix domain socket instead of
+loading their own copies.
+
+Framing (little-endian):
+    request:  b"IF" | version u8 | op u8 | plot_id u32 | n u32 | n*3 float64
+              (temperature, humidity, moisture per row)
+    response: b"IF" | status u8 | n u32 | payload
+              status 0 -> payload is n float64 decision scores
+              status 1 -> model not found for plot_id (n = 0)
+              status 2 -> payload is an n-byte utf-8 error message
+
+Start it with:
+    python manage.py run_inference_server
+
+and point the web workers at it with AGRI_INFERENCE_SOCKET (settings.ML_INFERENCE_SOCKET).
+"""
+import logging
+import os
+import socket
+import socketserver
+import struct
+import threading
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"IF"
+VERSION = 1
+
+OP_SCORE = 1
+OP_PING = 2
+
+STATUS_OK = 0
+STATUS_NO_MODEL = 1
+STATUS_ERROR = 2
+
+REQUEST_HEADER = struct.Struct("<2sBBII")
+RESPONSE_HEADER = struct.Struct("<2sBI")
+N_FEATURES = 3
+FLOAT_SIZE = 8
+
+
+class ModelNotFound(Exception):
+    pass
+
+
+def _recv_exact(sock, size):
+    buf = bytearray(size)
+    view = memoryview(buf)
+    got = 0
+    while got < size:
+        n = sock.recv_into(view[got:], size - got)
+        if n == 0:
+            raise ConnectionError("inference socket closed")
+        got += n
+    return bytes(buf)
+
+
+# -----------------------------------------------------------------------------
+# Server
+# -----------------------------------------------------------------------------
+class _Handler(socketserver.BaseRequestHandler):
+    """One persistent client connection; frames are handled one after another."""
+
+    def handle(self):
+        import numpy as np
+        from .iris_service import score_local
+
+        sock = self.request
+        while True:
+            try:
+                header = _recv_exact(sock, REQUEST_HEADER.size)
+            except ConnectionError:
+                return
+
+            magic, version, op, plot_id, n = REQUEST_HEADER.unpack(header)
+            if magic != MAGIC or version != VERSION:
+                logger.warning("Dropping client with bad frame header %r", header)
+                return
+
+            payload = _recv_exact(sock, n * N_FEATURES * FLOAT_SIZE) if n else b""
+
+            if op == OP_PING:
+                sock.sendall(RESPONSE_HEADER.pack(MAGIC, STATUS_OK, 0))
+                continue
+
+            try:
+                X = np.frombuffer(payload, dtype="<f8").reshape(n, N_FEATURES)
+                scores = score_local(plot_id, X)
+            except Exception as e:
+                logger.exception("Scoring %d vectors for plot %s failed", n, plot_id)
+                message = str(e).encode("utf-8")
+                sock.sendall(RESPONSE_HEADER.pack(MAGIC, STATUS_ERROR, len(message)) + message)
+                continue
+
+            if scores is None:
+                sock.sendall(RESPONSE_HEADER.pack(MAGIC, STATUS_NO_MODEL, 0))
+                continue
+
+            body = np.asarray(scores, dtype="<f8").tobytes()
+            sock.sendall(RESPONSE_HEADER.pack(MAGIC, STATUS_OK, len(scores)) + body)
+
+
+class InferenceServer(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, socket_path):
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+        super().__init__(socket_path, _Handler)
+        os.chmod(socket_path, 0o660)
+        self.socket_path = socket_path
+
+    def server_close(self):
+        super().server_close()
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+
+
+# -----------------------------------------------------------------------------
+# Client
+# -----------------------------------------------------------------------------
+class InferenceClient:
+    """
+    Thread-safe client keeping one connection per thread.
+
+    score() raises OSError/ConnectionError when the server is unreachable so
+    the caller can fall back to in-process scoring.
+    """
+
+    def __init__(self, socket_path, timeout=2.0):
+        self.socket_path = socket_path
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        sock.connect(self.socket_path)
+        self._local.sock = sock
+        return sock
+
+    def close(self):
+        sock = getattr(self._local, "sock", None)
+        if sock is not None:
+            sock.close()
+            self._local.sock = None
+
+    def _request(self, op, plot_id, X=None):
+        import numpy as np
+
+        if X is None:
+            n, payload = 0, b""
+        else:
+            X = np.ascontiguousarray(X, dtype="<f8").reshape(-1, N_FEATURES)
+            n, payload = len(X), X.tobytes()
+
+        frame = REQUEST_HEADER.pack(MAGIC, VERSION, op, plot_id, n) + payload
+
+        # one retry on a fresh connection: the server may have restarted
+        for attempt in (0, 1):
+            sock = getattr(self._local, "sock", None) or self._connect()
+            try:
+                sock.sendall(frame)
+                magic, status, count = RESPONSE_HEADER.unpack(
+                    _recv_exact(sock, RESPONSE_HEADER.size)
+                )
+                if magic != MAGIC:
+                    raise ConnectionError("bad response from inference server")
+                size = count * FLOAT_SIZE if status == STATUS_OK else count
+                body = _recv_exact(sock, size) if size else b""
+                return status, body
+            except OSError:
+                self.close()
+                if attempt:
+                    raise
+
+    def ping(self):
+        status, _body = self._request(OP_PING, 0)
+        return status == STATUS_OK
+
+    def score(self, plot_id, X):
+        """
+        Decision scores for the rows of X (n x 3: temperature, humidity, moisture).
+        Raises ModelNotFound if the server has no model for the plot.
+        """
+        import numpy as np
+
+        status, body = self._request(OP_SCORE, int(plot_id), X)
+        if status == STATUS_NO_MODEL:
+            raise ModelNotFound(plot_id)
+        if status == STATUS_ERROR:
+            raise RuntimeError(body.decode("utf-8", "replace"))
+        return np.frombuffer(body, dtype="<f8")
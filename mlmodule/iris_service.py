@@ -1,54 +1,109 @@
+import glob
+import math
 import os
 import re
-import pandas as pd
-import joblib
-from datetime import timedelta
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+from typing import TYPE_CHECKING
+from django.conf import settings
+from django.core.cache import cache
 from django.utils import timezone
+from monitoring import metrics, ringbuffer
 from monitoring.models import SensorReading, AnomalyEvent, FieldPlot
+from . import model_groups, trends
+from .recommendation_pipeline import enqueue_on_commit
+from .singleflight import SingleFlight
 
+# pandas / joblib / sklearn are imported on first use so that API workers
+# that never run detection don't pay for them (see warmup()).
+if TYPE_CHECKING:
+    import pandas as pd
 
-MODELS_DIR = os.path.join(
-    os.path.dirname(__file__),
-    ".", "agriculture_backend", "MLmodels", "models"
-)
+
+MODELS_DIR = str(getattr(
+    settings, "ML_MODELS_DIR",
+    os.path.join(settings.BASE_DIR, "agriculture_backend", "MLmodels", "models"),
+))
 
 REQUIRED_SENSORS = ["temperature", "humidity", "moisture"]
 DEFAULT_TIME_WINDOW_MINUTES = 5
 
 _model_cache = {}
+_detection_flight = SingleFlight()
 
 
-def load_model(plot_id: int):
-    
-    if plot_id in _model_cache:
-        return _model_cache[plot_id]
-
+def load_plot_model(plot_id: int):
     model_path = os.path.join(MODELS_DIR, f"isoforest_plot_{plot_id}.joblib")
     if not os.path.exists(model_path):
         return None
 
     try:
-        model = joblib.load(model_path)
-        _model_cache[plot_id] = model
-        return model
+        import joblib
+
+        return joblib.load(model_path)
     except Exception:
         return None
 
 
-def get_sensor_data(plot_id=None, minutes=DEFAULT_TIME_WINDOW_MINUTES):
-   
+def load_model(plot_id: int):
+    """
+    The plot's model: its own forest or its group's shared one, per
+    settings.ML_MODEL_GROUPS["MODE"] (mlmodule/model_groups.py). None if neither exists.
+    """
+    if plot_id in _model_cache:
+        return _model_cache[plot_id]
+
+    mode = model_groups.mode()
+    model = load_plot_model(plot_id) if mode != "group" else None
+    if model is None and mode != "plot":
+        model = model_groups.group_model(plot_id)
+        if model is not None:
+            metrics.incr("detection.group_models")
+
+    if model is not None:
+        _model_cache[plot_id] = model
+    return model
+
+
+def warmup():
+    """
+    Import the ML stack and load the model of every plot with a model file
+    or a group model entry into the cache.
+
+    Opt-in for ML workers (settings.ML_WARMUP, called from MlmoduleConfig.ready)
+    so the first detection request doesn't pay the import and load time.
+    Returns the plot ids whose model was loaded.
+    """
+    import pandas  # noqa: F401
+    import sklearn.ensemble  # noqa: F401
+
+    plot_ids = set(model_groups.grouped_plot_ids())
+    for path in glob.glob(os.path.join(MODELS_DIR, "isoforest_plot_*.joblib")):
+        match = re.search(r"isoforest_plot_(\d+)\.joblib$", path)
+        if match:
+            plot_ids.add(int(match.group(1)))
+    return [plot_id for plot_id in sorted(plot_ids) if load_model(plot_id) is not None]
+
+
+def get_sensor_data(plot_id=None, minutes=DEFAULT_TIME_WINDOW_MINUTES, end=None):
+    import pandas as pd
+
     cutoff_time = timezone.now() - timedelta(minutes=minutes)
     query = SensorReading.objects.filter(timestamp__gte=cutoff_time)
 
     if plot_id is not None:
         query = query.filter(plot_id=plot_id)
+    if end is not None:
+        query = query.filter(timestamp__lt=end)
 
     data = list(query.values("plot_id", "timestamp", "sensor_type", "value"))
     return pd.DataFrame(data) if data else pd.DataFrame()
 
 
-def prepare_vectors(df: pd.DataFrame):
+def prepare_vectors(df: "pd.DataFrame"):
     #Prepare sensor vectors from raw readings taatina dataframe with plot_id, timestamp, sensor_type, value
+    import pandas as pd
+
     if df.empty:
         return pd.DataFrame()
 
@@ -66,16 +121,131 @@ def prepare_vectors(df: pd.DataFrame):
         .reset_index()
         .rename(columns={"second": "timestamp"})
     )
+    # a window may hold only some sensor types (e.g. the database part
+    # before a ring buffer's coverage): no complete vectors then
+    for name in REQUIRED_SENSORS:
+        if name not in vectors:
+            vectors[name] = float("nan")
 
     return vectors.dropna(subset=REQUIRED_SENSORS)
 
 
+def get_vectors(plot_id=None, minutes=DEFAULT_TIME_WINDOW_MINUTES):
+    """
+    prepare_vectors() of the last `minutes`, read from the per-plot ring
+    buffers (monitoring/ringbuffer.py); only the part of the window a ring
+    does not cover (older than its oldest slot, or no ring) comes from the
+    database.
+    """
+    import pandas as pd
+
+    if not ringbuffer.enabled():
+        return prepare_vectors(get_sensor_data(plot_id, minutes))
+
+    since = math.floor((timezone.now() - timedelta(minutes=minutes)).timestamp())
+    plot_ids = [plot_id] if plot_id is not None else list(FieldPlot.objects.values_list("id", flat=True))
+
+    frames = []
+    for pid in plot_ids:
+        vectors, covered = ringbuffer.recent_vectors(pid, since)
+        if covered > since:
+            # older part (or everything) from the database
+            end = None if math.isinf(covered) else datetime.fromtimestamp(covered, dt_timezone.utc)
+            frames.append(prepare_vectors(get_sensor_data(pid, minutes, end=end)))
+            metrics.incr("detection.db_windows")
+        if vectors is not None and len(vectors):
+            frame = pd.DataFrame({
+                "plot_id": pid,
+                "timestamp": pd.to_datetime(vectors["t"], unit="s", utc=True),
+                **{name: vectors[name] for name in REQUIRED_SENSORS},
+            })
+            frames.append(frame.dropna(subset=REQUIRED_SENSORS))
+            metrics.incr("detection.ring_vectors", len(vectors))
+
+    frames = [frame for frame in frames if not frame.empty]
+    if not frames:
+        return pd.DataFrame()
+    return pd.concat(frames, ignore_index=True).sort_values(["plot_id", "timestamp"], ignore_index=True)
+
+
+def score_local(plot_id, X):
+    """Decision scores for the rows of X with the in-process model, or None if there is no model."""
+    import pandas as pd
+
+    model = load_model(plot_id)
+    if model is None:
+        return None
+
+    # the models were fitted on a DataFrame, keep the feature names
+    return model.decision_function(pd.DataFrame(X, columns=REQUIRED_SENSORS))
+
+
+_inference_client = None
+_inference_down_until = 0.0
+
+
+def get_inference_client():
+    global _inference_client
+
+    socket_path = getattr(settings, "ML_INFERENCE_SOCKET", None)
+    if not socket_path:
+        return None
+
+    if _inference_client is None or _inference_client.socket_path != socket_path:
+        from .inference_server import InferenceClient
+        _inference_client = InferenceClient(
+            socket_path, timeout=getattr(settings, "ML_INFERENCE_TIMEOUT", 2.0)
+        )
+    return _inference_client
+
+
+def score_vectors(plot_id, X):
+    """
+    Decision scores (lower = more anomalous) for the rows of X
+    (temperature, humidity, moisture), or None if the plot has no model.
+
+    Goes through the local inference server when ML_INFERENCE_SOCKET is set
+    and falls back to the in-process model if the server is unreachable or
+    answers with an error.
+    """
+    global _inference_down_until
+
+    client = get_inference_client()
+    if client is not None and time.monotonic() >= _inference_down_until:
+        from .inference_server import ModelNotFound
+
+        try:
+            scores = client.score(plot_id, X)
+            metrics.incr("inference.remote")
+            return scores
+        except ModelNotFound:
+            return None
+        except OSError:
+            # don't retry the socket on every call while the server is down
+            _inference_down_until = time.monotonic() + getattr(settings, "ML_INFERENCE_RETRY_SECONDS", 30)
+            metrics.incr("inference.fallbacks")
+        except RuntimeError:
+            # error frame from the server (logged there); the socket is fine
+            metrics.incr("inference.fallbacks")
+
+    metrics.incr("inference.local")
+    return score_local(plot_id, X)
+
+
+def severity_for_score(score):
+    if score < -0.5:
+        return "high"
+    if score < -0.3:
+        return "medium"
+    return "low"
+
+
 def detect_anomaly(plot_id, temperature, humidity, moisture):
     #Detect anomaly for one vector.
     #trajeelna score w isanomaly w severity
-    
-    model = load_model(plot_id)
-    if model is None:
+
+    scores = score_vectors(plot_id, [[temperature, humidity, moisture]])
+    if scores is None:
         return {
             "is_anomaly": False,
             "score": 0.0,
@@ -83,65 +253,134 @@ def detect_anomaly(plot_id, temperature, humidity, moisture):
             "error": "Model not found",
         }
 
-    X = [[temperature, humidity, moisture]]
-    prediction = model.predict(X)[0]  # 1 normal, -1 anomaly
-    score = model.decision_function(X)[0]  # lower = more anomalous
-
-    severity = "low"
-    if score < -0.5:
-        severity = "high"
-    elif score < -0.3:
-        severity = "medium"
+    score = float(scores[0])  # lower = more anomalous
 
     return {
-        "is_anomaly": prediction == -1,
-        "score": float(score),
-        "severity": severity,
+        "is_anomaly": score < 0,  # same threshold as IsolationForest.predict
+        "score": score,
+        "severity": severity_for_score(score),
     }
 
 
+SEVERITY_RANK = {"unknown": 0, "low": 1, "medium": 2, "high": 3}
+
+EPISODE_UPDATE_FIELDS = [
+    "started_at", "ended_at", "vector_count", "min_score",
+    "model_confidence", "severity", "anomaly_type",
+    "moisture_trend", "temp_trend",
+]
+
+
+def get_episode_gap():
+    # anomalous vectors closer than this belong to the same episode (0 = one event per vector)
+    seconds = getattr(settings, "ANOMALY_EPISODE_GAP_SECONDS", 0)
+    return timedelta(seconds=seconds)
+
+
+def describe_vector(temperature, humidity, moisture):
+    description = f"Unusual sensor combo: T={temperature:.1f}, H={humidity:.1f}, M={moisture:.1f}"
+    return description[:100]
+
+
 def anomaly_event_exists(plot_id, timestamp):
-    return AnomalyEvent.objects.filter(plot_id=plot_id, timestamp=timestamp).exists()
+    return AnomalyEvent.objects.filter(
+        plot_id=plot_id, started_at__lte=timestamp, ended_at__gte=timestamp
+    ).exists()
 
 
-def create_anomaly_event(plot_id, timestamp, temperature, humidity, moisture, score, severity, no_duplicates=True):
+def create_anomaly_event(plot_id, timestamp, temperature, humidity, moisture, score, severity, no_duplicates=True, trend=None):
    
 
     try:
         if no_duplicates and anomaly_event_exists(plot_id, timestamp):
             existing = (
-                AnomalyEvent.objects.filter(plot_id=plot_id, timestamp=timestamp)
+                AnomalyEvent.objects.filter(
+                    plot_id=plot_id, started_at__lte=timestamp, ended_at__gte=timestamp
+                )
                 .only("id")
                 .first()
             )
             return existing, False
 
         plot = FieldPlot.objects.get(id=plot_id)
-        description = f"Unusual sensor combo: T={temperature:.1f}, H={humidity:.1f}, M={moisture:.1f}"
 
         event = AnomalyEvent.objects.create(
             plot=plot,
             timestamp=timestamp,
-            anomaly_type=description[:100],
+            anomaly_type=describe_vector(temperature, humidity, moisture),
             severity=severity,
             model_confidence=abs(score),
+            started_at=timestamp,
+            ended_at=timestamp,
+            min_score=score,
+            **(trend or {}),
         )
+        # AgriBot picks it up in the background once the row is committed
+        enqueue_on_commit(event.id)
         return event, True
 
     except Exception:
         return None, False
 
 
+def find_open_episode(plot_id, timestamp, gap=None):
+    """
+    Latest episode of the plot that a vector at `timestamp` can be merged into,
+    or None if there is none within the episode gap.
+    """
+    gap = get_episode_gap() if gap is None else gap
+    if not gap:
+        return None
+
+    return (
+        AnomalyEvent.objects
+        .filter(
+            plot_id=plot_id,
+            ended_at__gte=timestamp - gap,
+            started_at__lte=timestamp + gap,
+        )
+        .order_by("-ended_at")
+        .first()
+    )
+
+
+def episode_covers(event, timestamp, gap):
+    return event.started_at - gap <= timestamp <= event.ended_at + gap
+
+
+def extend_episode(event, timestamp, temperature, humidity, moisture, score, severity, trend=None):
+    """
+    Merge one anomalous vector into an episode, in memory.
+
+    Keeps the time span, vector count, lowest score, peak severity and the
+    latest plot trends up to date; the caller saves with
+    update_fields=EPISODE_UPDATE_FIELDS.
+    """
+    if trend and timestamp >= event.ended_at:
+        event.moisture_trend = trend["moisture_trend"]
+        event.temp_trend = trend["temp_trend"]
+
+    event.started_at = min(event.started_at, timestamp)
+    event.ended_at = max(event.ended_at, timestamp)
+    event.vector_count += 1
+
+    if event.min_score is None or score < event.min_score:
+        event.min_score = score
+        event.model_confidence = abs(score)
+
+    if SEVERITY_RANK.get(severity, 0) > SEVERITY_RANK.get(event.severity, 0):
+        event.severity = severity
+        event.anomaly_type = describe_vector(temperature, humidity, moisture)
+
+    return event
+
+
 # -----------------------------------------------------------------------------
 # Main function nrunniw batch detection for 3 plots 
 # -----------------------------------------------------------------------------
 def run_batch_detection(plot_id=None, minutes=DEFAULT_TIME_WINDOW_MINUTES, create_events=True, no_duplicates=True):
    
-    df = get_sensor_data(plot_id, minutes)
-    if df.empty:
-        return {"success": False, "message": "No data found"}
-
-    vectors = prepare_vectors(df)
+    vectors = get_vectors(plot_id, minutes)
     if vectors.empty:
         return {"success": False, "message": "No complete vectors"}
 
@@ -149,48 +388,98 @@ def run_batch_detection(plot_id=None, minutes=DEFAULT_TIME_WINDOW_MINUTES, creat
     total_analyzed = 0
     anomalies_found = 0
     events_created = 0
+    episodes_extended = 0
     duplicates_skipped = 0
+    gap = get_episode_gap()
 
     # we loop over vectors per plot
     for pid in vectors["plot_id"].unique():
         pid = int(pid)
         plot_vectors = vectors[vectors["plot_id"] == pid]
 
+        # one batched model call per plot instead of one per vector
+        scores = score_vectors(pid, plot_vectors[REQUIRED_SENSORS].to_numpy(dtype=float))
+
         plot_analyzed = 0
         plot_anomalies = 0
         plot_events_created = 0
+        plot_extended = 0
         plot_duplicates = 0
 
-        for _, row in plot_vectors.iterrows():
+        # open episode of this plot; extended in memory, saved once we move past it
+        episode = None
+        episode_dirty = False
+
+        for i, (_, row) in enumerate(plot_vectors.iterrows()):
             plot_analyzed += 1
             total_analyzed += 1
 
-            res = detect_anomaly(pid, row["temperature"], row["humidity"], row["moisture"])
+            # O(1) per vector; windows overlapping earlier runs are skipped
+            ts = row["timestamp"].to_pydatetime()
+            trends.observe(pid, ts.timestamp(), row["temperature"], row["humidity"], row["moisture"])
+
+            if scores is None:
+                continue  # no model for this plot
+
+            score = float(scores[i])
+            res = {"score": score, "severity": severity_for_score(score)}
 
-            if res.get("is_anomaly"):
+            if score < 0:
                 plot_anomalies += 1
                 anomalies_found += 1
 
-                if create_events:
-                    event, created = create_anomaly_event(
-                        pid,
-                        row["timestamp"],
-                        row["temperature"],
-                        row["humidity"],
-                        row["moisture"],
-                        res["score"],
-                        res["severity"],
-                        no_duplicates=no_duplicates,
-                    )
+                if not create_events:
+                    continue
+
+                trend = trends.trend_features(pid)
+
+                if gap and (episode is None or not episode_covers(episode, ts, gap)):
+                    if episode_dirty:
+                        episode.save(update_fields=EPISODE_UPDATE_FIELDS)
+                        episode_dirty = False
+                    episode = find_open_episode(pid, ts, gap)
 
-                    if created:
-                        plot_events_created += 1
-                        events_created += 1
-                    else:
-                        # only count as duplicate if it existed (not if None due to error)
-                        if event is not None:
-                            plot_duplicates += 1
-                            duplicates_skipped += 1
+                if episode is not None:
+                    if no_duplicates and episode.started_at <= ts <= episode.ended_at:
+                        plot_duplicates += 1
+                        duplicates_skipped += 1
+                        continue
+
+                    extend_episode(
+                        episode, ts,
+                        row["temperature"], row["humidity"], row["moisture"],
+                        res["score"], res["severity"], trend=trend,
+                    )
+                    episode_dirty = True
+                    plot_extended += 1
+                    episodes_extended += 1
+                    continue
+
+                event, created = create_anomaly_event(
+                    pid,
+                    ts,
+                    row["temperature"],
+                    row["humidity"],
+                    row["moisture"],
+                    res["score"],
+                    res["severity"],
+                    no_duplicates=no_duplicates,
+                    trend=trend,
+                )
+
+                if created:
+                    plot_events_created += 1
+                    events_created += 1
+                    if gap:
+                        episode = event
+                else:
+                    # only count as duplicate if it existed (not if None due to error)
+                    if event is not None:
+                        plot_duplicates += 1
+                        duplicates_skipped += 1
+
+        if episode_dirty:
+            episode.save(update_fields=EPISODE_UPDATE_FIELDS)
 
         plot_rate = (plot_anomalies / plot_analyzed) if plot_analyzed else 0.0
 
@@ -199,7 +488,9 @@ def run_batch_detection(plot_id=None, minutes=DEFAULT_TIME_WINDOW_MINUTES, creat
             "anomalies": plot_anomalies,
             "anomaly_rate": plot_rate,
             "events_created": plot_events_created,
+            "episodes_extended": plot_extended,
             "duplicates_skipped": plot_duplicates,
+            **trends.trend_features(pid),
         }
 
     anomaly_rate = (anomalies_found / total_analyzed) if total_analyzed else 0.0
@@ -211,25 +502,74 @@ def run_batch_detection(plot_id=None, minutes=DEFAULT_TIME_WINDOW_MINUTES, creat
         "anomalies_found": anomalies_found,
         "anomaly_rate": anomaly_rate,
         "events_created": events_created,
+        "episodes_extended": episodes_extended,
+        "duplicates_skipped": duplicates_skipped,
         "by_plot": results_by_plot,
     }
 
 
+def run_batch_detection_cached(plot_id=None, minutes=DEFAULT_TIME_WINDOW_MINUTES, create_events=True, no_duplicates=True):
+    """
+    run_batch_detection with single-flight and a short result cache.
+
+    Identical concurrent calls share one computation, and a finished result
+    is reused for RUN_ML_CACHE_SECONDS as long as no new reading was ingested
+    (the key includes the latest SensorReading id).
+
+    Returns (results, cache_status) with cache_status "hit", "shared" or "miss".
+    """
+    latest_id = SensorReading.objects.order_by("-id").values_list("id", flat=True).first()
+    key = f"run-ml:{plot_id}:{minutes}:{int(bool(create_events))}:{int(bool(no_duplicates))}:{latest_id}"
+
+    results = cache.get(key)
+    if results is not None:
+        metrics.incr("run_ml.cache_hits")
+        return results, "hit"
+
+    def compute():
+        results = run_batch_detection(
+            plot_id=plot_id,
+            minutes=minutes,
+            create_events=create_events,
+            no_duplicates=no_duplicates,
+        )
+        cache.set(key, results, getattr(settings, "RUN_ML_CACHE_SECONDS", 10))
+        return results
+
+    results, shared = _detection_flight.do(key, compute)
+    metrics.incr("run_ml.shared" if shared else "run_ml.computed")
+    return results, ("shared" if shared else "miss")
+
+
 def check_single_reading(plot_id, temperature, humidity, moisture, create_event=True):
     #ma nesthakouhouch for now , it does detection for one reading and create event if needed
     result = detect_anomaly(plot_id, temperature, humidity, moisture)
+    now = timezone.now()
 
     if result["is_anomaly"] and create_event:
-        event, _created = create_anomaly_event(
-            plot_id,
-            timezone.now(),
-            temperature,
-            humidity,
-            moisture,
-            result["score"],
-            result["severity"],
-            no_duplicates=False,  # single reading is "now", duplication usually not an issue
-        )
+        # hypothetical values are not fed to the trends: they would move the
+        # plot's clock to now and hide the next batch window's vectors
+        trend = trends.trend_features(plot_id, refresh=True)
+        event = find_open_episode(plot_id, now)
+
+        if event is not None:
+            extend_episode(
+                event, now, temperature, humidity, moisture,
+                result["score"], result["severity"], trend=trend,
+            )
+            event.save(update_fields=EPISODE_UPDATE_FIELDS)
+        else:
+            event, _created = create_anomaly_event(
+                plot_id,
+                now,
+                temperature,
+                humidity,
+                moisture,
+                result["score"],
+                result["severity"],
+                no_duplicates=False,  # single reading is "now", duplication usually not an issue
+                trend=trend,
+            )
         result["event_id"] = event.id if event else None
 
     return result
@@ -0,0 +1,81 @@
+"""
+Evaluate the Iris models on labeled simulator scenarios (mlmodule/evaluation.py).
+
+Usage:
+    python manage.py evaluate_models
+    python manage.py evaluate_models --hours 72 --seed 7 --plot 1
+    python manage.py evaluate_models --save scenarios.csv
+    python manage.py evaluate_models --replay scenarios.csv
+
+Replaces test_iforest_from_db.py: the vectors carry ground truth (the
+scenario active when each was generated) and are scored through the
+production path, so the report has precision/recall/F1 per plot and
+scenario, vectors per second and memory.
+"""
+from django.core.management.base import BaseCommand, CommandError
+
+from mlmodule import evaluation
+
+
+class Command(BaseCommand):
+    help = "Score labeled simulator scenario data and report detection quality and speed"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hours', type=float, default=48, help='Hours of simulated data (default: 48)')
+        parser.add_argument('--seed', type=int, default=42, help='Simulator random seed (default: 42)')
+        parser.add_argument('--plot', type=int, action='append', help='Plot ID to evaluate (repeatable; default: all)')
+        parser.add_argument('--save', help='Write the labeled vectors to this CSV')
+        parser.add_argument('--replay', help='Evaluate labeled vectors from this CSV instead of generating them')
+        parser.add_argument('--repeat', type=int, default=3, help='Timed scoring runs per plot, best kept (default: 3)')
+
+    def handle(self, *args, **options):
+        if options['replay']:
+            try:
+                rows = evaluation.load_csv(options['replay'], options['plot'])
+            except OSError as e:
+                raise CommandError(f"Cannot read {options['replay']}: {e}")
+        else:
+            rows = evaluation.scenario_vectors(options['hours'], seed=options['seed'], plot_ids=options['plot'])
+        if not rows:
+            raise CommandError("No vectors to evaluate")
+
+        if options['save']:
+            evaluation.save_csv(rows, options['save'])
+            self.stdout.write(f"Saved {len(rows)} labeled vectors to {options['save']}")
+
+        labeled = sum(1 for row in rows if row[5] is not None)
+        self.stdout.write(f"{len(rows)} vectors, {labeled} in scenarios")
+
+        result = evaluation.evaluate(rows, repeat=options['repeat'])
+        for plot_id in result["no_model"]:
+            self.stdout.write(self.style.WARNING(f"plot {plot_id}: no model, not scored"))
+
+        header = f"{'':<46}{'TP':>6}{'FP':>6}{'FN':>6}{'precision':>11}{'recall':>8}{'F1':>7}"
+        self.stdout.write("")
+        self.stdout.write(header)
+        for plot_id, m in result["by_plot"].items():
+            self.stdout.write(self.row(f"plot {plot_id}", m))
+            for (pid, label), s in result["by_scenario"].items():
+                if pid == plot_id:
+                    self.stdout.write(self.row(f"  {label}"[:46], s))
+        self.stdout.write(self.row("total", result["total"]))
+
+        perf = result["performance"]
+        self.stdout.write("")
+        self.stdout.write(
+            f"scoring: {perf['vectors']} vectors in {perf['score_seconds'] * 1000:.1f} ms "
+            f"= {perf['vectors_per_second']:,.0f} vectors/s (first call incl. model load: {perf['load_seconds'] * 1000:.0f} ms)"
+        )
+        memory = (
+            f"memory: {perf['models']} models, {perf['model_bytes'] / 1024 / 1024:.1f} MiB pickled; "
+            f"traced peak {perf['traced_peak_bytes'] / 1024 / 1024:.1f} MiB"
+        )
+        if perf['max_rss_bytes']:
+            memory += f"; max RSS {perf['max_rss_bytes'] / 1024 / 1024:.0f} MiB"
+        self.stdout.write(memory)
+
+    def row(self, name, m):
+        return (
+            f"{name:<46}{m['tp']:>6}{m['fp']:>6}{m['fn']:>6}"
+            f"{m['precision']:>11.3f}{m['recall']:>8.3f}{m['f1']:>7.3f}"
+        )
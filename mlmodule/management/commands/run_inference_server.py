@@ -0,0 +1,41 @@
+"""
+Run the local Iris inference server.
+
+Usage:
+    python manage.py run_inference_server
+    python manage.py run_inference_server --socket /run/agri/inference.sock
+
+Web workers use it when AGRI_INFERENCE_SOCKET points at the same path.
+"""
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from mlmodule.inference_server import InferenceServer
+from mlmodule.iris_service import warmup
+
+
+class Command(BaseCommand):
+    help = "Serve Iris model scoring over a Unix domain socket"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--socket',
+            default=getattr(settings, "ML_INFERENCE_SOCKET", None) or "/tmp/agri_inference.sock",
+            help='Unix socket path (default: settings.ML_INFERENCE_SOCKET)'
+        )
+
+    def handle(self, *args, **options):
+        socket_path = options['socket']
+
+        plots = warmup()
+        self.stdout.write(f"Loaded models for plots: {plots}")
+
+        server = InferenceServer(socket_path)
+        self.stdout.write(self.style.SUCCESS(f"Inference server listening on {socket_path}"))
+
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
@@ -0,0 +1,110 @@
+"""
+Train shared IsolationForest models for groups of plots (mlmodule/model_groups.py).
+
+Usage:
+    python manage.py train_model_groups
+    python manage.py train_model_groups --by stats --groups 4
+    python manage.py train_model_groups --compare --dry-run
+    python manage.py train_model_groups --csv MLmodels/data/baseline_plot_specific.csv
+
+Trains on the same baseline vectors from the database as train_models
+(mlmodule/training.py: last DAYS, anomaly episodes and EXCLUDE_SOURCES left
+out), so group and per-plot models see the same data. --csv reads the
+synthetic_baseline rows of a baseline CSV instead. --compare also fits
+per-plot models on the same data and reports model memory and detection
+quality (false positives on held-out baseline vectors, recall on shifted
+copies of them) for both.
+
+Running workers pick up the new group models on restart.
+"""
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from mlmodule import model_groups, training
+
+
+def load_baseline_csv(path):
+    import pandas as pd
+
+    if not os.path.exists(path):
+        raise CommandError(f"CSV not found: {path}")
+
+    df = pd.read_csv(path)
+    missing = [c for c in ["plot_id", "source"] + model_groups.FEATURES if c not in df.columns]
+    if missing:
+        raise CommandError(f"Missing columns in CSV: {missing}")
+
+    # train ONLY on synthetic baseline rows
+    df = df[df["source"] == "synthetic_baseline"]
+    df = df.assign(plot_id=pd.to_numeric(df["plot_id"], errors="coerce")).dropna(subset=["plot_id"])
+    return df.astype({"plot_id": int})[["plot_id"] + model_groups.FEATURES]
+
+
+class Command(BaseCommand):
+    help = "Train one shared IsolationForest per group of plots"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--plot', type=int, action='append', help='Plot ID to include (repeatable; default: all)')
+        parser.add_argument('--days', type=int, help='Days of history to train on (default: ML_TRAINING["DAYS"])')
+        parser.add_argument('--max-vectors', type=int, help='Most recent vectors kept per plot')
+        parser.add_argument('--exclude-source', action='append', help='Reading source to leave out (repeatable)')
+        parser.add_argument('--include-anomalies', action='store_true', help='Keep vectors inside anomaly episodes')
+        parser.add_argument('--csv', help='Train on the synthetic_baseline rows of this CSV instead of the database')
+        parser.add_argument('--by', choices=["variety", "stats"], help='Group by crop variety or baseline statistics')
+        parser.add_argument('--groups', type=int, help='Number of groups for --by stats')
+        parser.add_argument('--compare', action='store_true', help='Report memory and detection quality against per-plot models')
+        parser.add_argument('--holdout', type=float, default=0.2, help='Fraction of each plot held out by --compare (default: 0.2)')
+        parser.add_argument('--shift', type=float, default=4.0, help='Synthetic anomaly size in plot deviations (default: 4)')
+        parser.add_argument('--dry-run', action='store_true', help='Do not write models')
+
+    def handle(self, *args, **options):
+        if options['csv']:
+            frame = load_baseline_csv(options['csv'])
+        else:
+            frame = training.baseline_frame(
+                plot_ids=options['plot'],
+                days=options['days'],
+                exclude_sources=options['exclude_source'],
+                exclude_anomalies=not options['include_anomalies'],
+                max_vectors=options['max_vectors'],
+            )
+        if frame.empty:
+            raise CommandError("No baseline rows")
+
+        if not options['dry_run']:
+            manifest, forests, timings = model_groups.train_groups(frame, by=options['by'], n_groups=options['groups'])
+            model_groups.save_groups(manifest, forests)
+            for key, group in manifest["groups"].items():
+                self.stdout.write(
+                    f"{key:<20} plots={group['plots']} rows={group['rows']} "
+                    f"fit={timings[key]:.2f}s size={model_groups.model_bytes(forests[key]) / 1024:.0f} KiB"
+                )
+            self.stdout.write(self.style.SUCCESS(
+                f"Saved {len(forests)} group models for {len(manifest['plots'])} plots to {model_groups.models_dir()}"
+            ))
+
+        if options['compare']:
+            self.report(model_groups.compare_with_plot_models(
+                frame, by=options['by'], n_groups=options['groups'],
+                holdout=options['holdout'], shift=options['shift'],
+            ))
+
+    def report(self, result):
+        self.stdout.write("")
+        self.stdout.write(f"{'':<8}{'models':>8}{'KiB':>10}{'KiB/plot':>10}{'fit s':>8}{'FP rate':>9}{'recall':>8}")
+        for kind in ("plot", "group"):
+            row = result[kind]
+            self.stdout.write(
+                f"{kind:<8}{row['models']:>8}{row['bytes'] / 1024:>10.0f}{row['bytes_per_plot'] / 1024:>10.0f}"
+                f"{row['fit_seconds']:>8.2f}{row['false_positive_rate']:>9.3f}{row['recall']:>8.3f}"
+            )
+        self.stdout.write(f"flag agreement: {result['agreement']:.3f}")
+
+        self.stdout.write("")
+        for pid, row in result["by_plot"].items():
+            cells = "  ".join(
+                f"{kind}: FP {row[kind]['false_positives']}/{row['normal']} detected {row[kind]['detected']}/{row['shifted']}"
+                for kind in ("plot", "group")
+            )
+            self.stdout.write(f"plot {pid:<6} group={row['model_group']:<16} {cells}")
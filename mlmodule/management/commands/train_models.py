@@ -0,0 +1,109 @@
+"""
+Train the per-plot Iris models from the database (mlmodule/training.py).
+
+Usage:
+    python manage.py train_models
+    python manage.py train_models --plot 1 --plot 2 --days 14
+    python manage.py train_models --workers 4 --memory-mb 1024
+    python manage.py train_models --dry-run
+    python manage.py train_models --refresh
+    python manage.py train_models --refresh --compare --retrain-on-drift
+
+Replaces the CSV pipeline (make_plot_specific_baseline.py +
+train_isolation_forest.py). Models are written atomically into ML_MODELS_DIR,
+with manifest.json; running workers pick them up on restart.
+
+--refresh updates existing models with the vectors since their last training
+(warm_start) instead of refitting them; --compare also fits full models in
+memory and reports both.
+"""
+import time
+
+from django.core.management.base import BaseCommand
+
+from mlmodule.training import train_models
+
+
+class Command(BaseCommand):
+    help = "Train one IsolationForest per plot on baseline vectors from the database"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--plot', type=int, action='append', help='Plot ID to train (repeatable; default: all)')
+        parser.add_argument('--days', type=int, help='Days of history to train on (default: ML_TRAINING["DAYS"])')
+        parser.add_argument('--workers', type=int, help='Parallel fitting processes (default: one per core)')
+        parser.add_argument('--memory-mb', type=int, help='Memory budget for vectors and models in flight')
+        parser.add_argument('--max-vectors', type=int, help='Most recent vectors kept per plot')
+        parser.add_argument('--exclude-source', action='append', help='Reading source to leave out (repeatable)')
+        parser.add_argument('--include-anomalies', action='store_true', help='Keep vectors inside anomaly episodes')
+        parser.add_argument('--dry-run', action='store_true', help='Load the vectors but do not fit or write')
+        parser.add_argument('--refresh', action='store_true', help='Update existing models with new vectors only (warm_start)')
+        parser.add_argument('--compare', action='store_true', help='With --refresh: compare against a full retrain')
+        parser.add_argument('--retrain-on-drift', action='store_true', help='With --refresh: fully retrain plots that fail a drift guard')
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"{'plot':>6}{'vectors':>10}{'load s':>9}{'fit s':>8}{'write s':>9}{'KiB':>8}")
+
+        comparisons = {}
+
+        def report(plot_id, entry):
+            problem = entry.get('error') or entry.get('drift') or entry.get('skipped')
+            if problem:
+                style = self.style.WARNING if "skipped" in entry else self.style.ERROR
+                if "drift" in entry:
+                    action = "retraining in full" if options['retrain_on_drift'] else "model kept (full retrain needed)"
+                    problem = f"drift: {problem}, {action}"
+                self.stdout.write(style(
+                    f"{plot_id:>6}{entry.get('rows', 0):>10}{entry['load_seconds']:>9.2f}  {problem}"
+                ))
+                return
+            line = (
+                f"{plot_id:>6}{entry.get('refresh_rows', entry['rows']):>10}{entry['load_seconds']:>9.2f}"
+                f"{entry['fit_seconds']:>8.2f}{entry['write_seconds']:>9.2f}{entry['bytes'] / 1024:>8.0f}"
+            )
+            if options['refresh'] and 'refresh_rows' in entry:
+                line += f"  refreshed: {entry['trees_replaced']} trees replaced, {entry['trees_added']} added"
+            self.stdout.write(line)
+            if 'compare' in entry:
+                comparisons[plot_id] = entry['compare']
+
+        t0 = time.perf_counter()
+        manifest = train_models(
+            plot_ids=options['plot'],
+            days=options['days'],
+            workers=options['workers'],
+            memory_mb=options['memory_mb'],
+            max_vectors=options['max_vectors'],
+            exclude_sources=options['exclude_source'],
+            exclude_anomalies=not options['include_anomalies'],
+            dry_run=options['dry_run'],
+            refresh=options['refresh'],
+            compare=options['compare'],
+            retrain_on_drift=options['retrain_on_drift'],
+            report=report,
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"Done in {time.perf_counter() - t0:.2f}s ({len(manifest['plots'])} plots in the manifest)"
+        ))
+        if comparisons:
+            self.report_comparison(comparisons)
+
+    def report_comparison(self, comparisons):
+        self.stdout.write("")
+        self.stdout.write(
+            "refresh vs full retrain (FP rate on the newest new vectors, held out of both fits; "
+            "recall on shifted copies of them)"
+        )
+        self.stdout.write(
+            f"{'plot':>6}{'rows':>14}{'held out':>10}{'fit s':>14}{'FP rate':>16}{'recall':>16}{'agree':>8}"
+        )
+        for plot_id, c in comparisons.items():
+            if 'skipped' in c:
+                self.stdout.write(self.style.WARNING(f"{plot_id:>6}  {c['skipped']}"))
+                continue
+            self.stdout.write(
+                f"{plot_id:>6}{c['refresh_rows']:>7}/{c['full_rows']:<6}{c['holdout_rows']:>10}"
+                f"{c['refresh_seconds']:>7.2f}/{c['full_seconds']:<6.2f}"
+                f"{c['refresh_false_positive_rate']:>8.3f}/{c['full_false_positive_rate']:<7.3f}"
+                f"{c['refresh_recall']:>8.3f}/{c['full_recall']:<7.3f}"
+                f"{c['agreement']:>8.3f}"
+            )
@@ -0,0 +1,415 @@
+"""
+Shared IsolationForest models for groups of plots.
+
+Instead of one forest per plot, plots are clustered into a few groups and
+each group gets one forest, fitted on the vectors of all its plots after
+per-plot normalization: every plot's vectors are standardized with that
+plot's own baseline mean and standard deviation, so plots of one group may
+sit at different levels and the forest learns what a deviation looks like.
+
+Groups are made by crop variety (BY="variety", FieldPlot.crop_variety) or by
+k-means over the plots' baseline means and deviations (BY="stats", at most
+GROUPS clusters).
+
+MODELS_DIR then holds, next to the per-plot isoforest_plot_<id>.joblib:
+
+    isoforest_group_<key>.joblib   one forest per group
+    model_groups.json              groups, their plots and varieties, the
+                                   per-plot and pooled per-group normalization
+
+iris_service.load_model() uses them according to MODE:
+
+    "plot"      per-plot models only
+    "fallback"  the per-plot model, else the plot's group model
+    "group"     group models only
+
+A plot missing from the manifest (added after training) uses the group of
+its crop variety, else the largest group, with that group's pooled
+normalization.
+
+python manage.py train_model_groups trains them on the same baseline vectors
+as train_models (training.baseline_frame()); --compare reports memory and
+detection quality against per-plot models. Like per-plot models
+(train_models), new group models are picked up by running workers on
+restart: the manifest is read once per process, and iris_service caches
+each plot's model.
+"""
+import json
+import os
+import pickle
+import threading
+import time
+
+from django.conf import settings
+from django.utils.text import slugify
+
+from .training import atomic_write, fit_full, fit_params
+
+FEATURES = ["temperature", "humidity", "moisture"]
+MANIFEST = "model_groups.json"
+MANIFEST_VERSION = 1
+# standard deviation floor, so a constant sensor does not divide by zero
+MIN_SCALE = 1e-3
+
+DEFAULTS = {
+    "MODE": "fallback",
+    "BY": "variety",
+    "GROUPS": 8,
+    "N_ESTIMATORS": 200,
+    "CONTAMINATION": 0.02,
+}
+
+
+def _config(name):
+    return getattr(settings, "ML_MODEL_GROUPS", {}).get(name, DEFAULTS[name])
+
+
+def mode():
+    return _config("MODE")
+
+
+def models_dir():
+    from .iris_service import MODELS_DIR
+    return MODELS_DIR
+
+
+def group_filename(key):
+    return f"isoforest_group_{key}.joblib"
+
+
+# -----------------------------------------------------------------------------
+# Scoring
+# -----------------------------------------------------------------------------
+class GroupedModel:
+    """A group's shared forest with one plot's normalization; used like a per-plot model."""
+    __slots__ = ("forest", "group", "mean", "scale")
+
+    def __init__(self, forest, group, mean, scale):
+        import numpy as np
+
+        self.forest = forest
+        self.group = group
+        self.mean = np.asarray(mean, dtype=float)
+        self.scale = np.asarray(scale, dtype=float)
+
+    def _normalize(self, X):
+        import numpy as np
+        import pandas as pd
+
+        X = np.asarray(X, dtype=float)
+        return pd.DataFrame((X - self.mean) / self.scale, columns=FEATURES)
+
+    def decision_function(self, X):
+        return self.forest.decision_function(self._normalize(X))
+
+    def predict(self, X):
+        return self.forest.predict(self._normalize(X))
+
+
+# manifest path -> manifest (None: no group models)
+_manifests = {}
+_forests = {}
+_lock = threading.Lock()
+
+
+def load_manifest(directory=None):
+    """The groups manifest of the model directory, or None. Read once per process."""
+    path = os.path.join(directory or models_dir(), MANIFEST)
+    with _lock:
+        if path not in _manifests:
+            try:
+                with open(path) as f:
+                    _manifests[path] = json.load(f)
+            except FileNotFoundError:
+                _manifests[path] = None
+        return _manifests[path]
+
+
+def _forest(directory, key, entry):
+    # one forest per group, shared by the GroupedModel of every plot in it
+    forest = _forests.get(key)
+    if forest is None:
+        import joblib
+
+        forest = _forests[key] = joblib.load(os.path.join(directory, entry["file"]))
+    return forest
+
+
+def _plot_variety(plot_id):
+    from monitoring.models import FieldPlot
+
+    return FieldPlot.objects.filter(id=plot_id).values_list("crop_variety", flat=True).first()
+
+
+def group_for(plot_id, manifest):
+    """(group key, mean, scale) of a plot: its own entry, else by crop variety, else the largest group."""
+    groups = manifest["groups"]
+    if not groups:
+        return None
+
+    entry = manifest["plots"].get(str(plot_id))
+    if entry is not None and entry["group"] in groups:
+        return entry["group"], entry["mean"], entry["scale"]
+
+    variety = _plot_variety(plot_id)
+    key = next((k for k, g in groups.items() if variety and variety in g["varieties"]), None)
+    if key is None:
+        key = max(groups, key=lambda k: groups[k]["rows"])
+    return key, groups[key]["mean"], groups[key]["scale"]
+
+
+def group_model(plot_id, directory=None):
+    """GroupedModel for a plot, or None without group models."""
+    directory = directory or models_dir()
+    manifest = load_manifest(directory)
+    if manifest is None:
+        return None
+
+    found = group_for(plot_id, manifest)
+    if found is None:
+        return None
+    key, mean, scale = found
+    try:
+        with _lock:
+            forest = _forest(directory, key, manifest["groups"][key])
+    except (OSError, KeyError, ValueError):
+        return None
+    return GroupedModel(forest, key, mean, scale)
+
+
+def grouped_plot_ids(directory=None):
+    manifest = load_manifest(directory)
+    return [int(pid) for pid in manifest["plots"]] if manifest else []
+
+
+# -----------------------------------------------------------------------------
+# Training
+# -----------------------------------------------------------------------------
+def plot_stats(frame):
+    """{plot_id: (mean, scale, rows)} of baseline vectors (columns plot_id + FEATURES)."""
+    stats = {}
+    for pid, rows in frame.groupby("plot_id"):
+        values = rows[FEATURES].to_numpy(dtype=float)
+        stats[int(pid)] = (
+            values.mean(axis=0).tolist(),
+            values.std(axis=0).clip(min=MIN_SCALE).tolist(),
+            len(values),
+        )
+    return stats
+
+
+def plot_varieties(plot_ids):
+    from monitoring.models import FieldPlot
+
+    varieties = dict(FieldPlot.objects.filter(id__in=plot_ids).values_list("id", "crop_variety"))
+    return {pid: varieties.get(pid) or "" for pid in plot_ids}
+
+
+def assign_groups(stats, varieties, by=None, n_groups=None):
+    """{plot_id: group key}, by crop variety or by k-means over the plot statistics."""
+    import numpy as np
+
+    by = by or _config("BY")
+    if by == "variety":
+        return {pid: slugify(varieties.get(pid) or "") or "default" for pid in stats}
+    if by != "stats":
+        raise ValueError(f"unknown grouping {by!r} (variety or stats)")
+
+    from sklearn.cluster import KMeans
+
+    plot_ids = sorted(stats)
+    n_groups = min(n_groups or _config("GROUPS"), len(plot_ids))
+    points = np.array([stats[pid][0] + stats[pid][1] for pid in plot_ids])
+    points = (points - points.mean(axis=0)) / points.std(axis=0).clip(min=MIN_SCALE)
+    labels = KMeans(n_clusters=n_groups, n_init=10, random_state=42).fit_predict(points)
+    return {pid: f"cluster_{label}" for pid, label in zip(plot_ids, labels)}
+
+
+def normalize(frame, stats):
+    """Feature matrix of the rows of frame, each standardized with its plot's statistics."""
+    import numpy as np
+
+    values = frame[FEATURES].to_numpy(dtype=float)
+    pids = frame["plot_id"].to_numpy()
+    mean = np.array([stats[int(pid)][0] for pid in pids])
+    scale = np.array([stats[int(pid)][1] for pid in pids])
+    return (values - mean) / scale
+
+
+def fit_forest(X, n_estimators=None, contamination=None):
+    import pandas as pd
+    from sklearn.ensemble import IsolationForest
+
+    model = IsolationForest(
+        n_estimators=n_estimators or _config("N_ESTIMATORS"),
+        contamination=contamination or _config("CONTAMINATION"),
+        random_state=42,
+    )
+    # fitted on a DataFrame, like the per-plot models
+    model.fit(pd.DataFrame(X, columns=FEATURES))
+    return model
+
+
+def train_groups(frame, by=None, n_groups=None, varieties=None):
+    """
+    Fit one forest per group on baseline vectors (columns plot_id + FEATURES).
+
+    Returns (manifest, {group key: forest}, {group key: fit seconds}).
+    """
+    by = by or _config("BY")
+    stats = plot_stats(frame)
+    if varieties is None:
+        varieties = plot_varieties(list(stats))
+    assignment = assign_groups(stats, varieties, by=by, n_groups=n_groups)
+
+    manifest = {
+        "version": MANIFEST_VERSION,
+        "by": by,
+        "features": FEATURES,
+        "trained_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "groups": {},
+        "plots": {},
+    }
+    forests, timings = {}, {}
+
+    for key in sorted(set(assignment.values())):
+        members = sorted(pid for pid, k in assignment.items() if k == key)
+        rows = frame[frame["plot_id"].isin(members)]
+
+        t0 = time.perf_counter()
+        forests[key] = fit_forest(normalize(rows, stats))
+        timings[key] = time.perf_counter() - t0
+
+        pooled = rows[FEATURES].to_numpy(dtype=float)
+        manifest["groups"][key] = {
+            "file": group_filename(key),
+            "plots": members,
+            "varieties": sorted({varieties.get(pid) or "" for pid in members}),
+            "rows": len(rows),
+            "mean": pooled.mean(axis=0).tolist(),
+            "scale": pooled.std(axis=0).clip(min=MIN_SCALE).tolist(),
+        }
+        for pid in members:
+            mean, scale, n = stats[pid]
+            manifest["plots"][str(pid)] = {"group": key, "mean": mean, "scale": scale, "rows": n}
+
+    return manifest, forests, timings
+
+
+def save_groups(manifest, forests, directory=None):
+    """Write the group forests, then the manifest that points at them; drop forests of old groups."""
+    import joblib
+
+    directory = directory or models_dir()
+    os.makedirs(directory, exist_ok=True)
+
+    for key, forest in forests.items():
+        atomic_write(os.path.join(directory, group_filename(key)), lambda tmp: joblib.dump(forest, tmp))
+
+    def write_manifest(tmp):
+        with open(tmp, "w") as f:
+            json.dump(manifest, f, indent=2)
+
+    atomic_write(os.path.join(directory, MANIFEST), write_manifest)
+    # this process sees its own new groups; other workers on restart
+    with _lock:
+        _manifests.pop(os.path.join(directory, MANIFEST), None)
+        _forests.clear()
+
+    current = {group_filename(key) for key in manifest["groups"]}
+    for name in os.listdir(directory):
+        if name.startswith("isoforest_group_") and name.endswith(".joblib") and name not in current:
+            os.remove(os.path.join(directory, name))
+
+
+# -----------------------------------------------------------------------------
+# Comparison with per-plot models
+# -----------------------------------------------------------------------------
+def model_bytes(model):
+    return len(pickle.dumps(model, protocol=pickle.HIGHEST_PROTOCOL))
+
+
+def shifted_anomalies(frame, stats, shift):
+    """Copies of the rows of frame with one feature moved by ±shift plot deviations (one copy per feature)."""
+    import numpy as np
+
+    copies = []
+    for i, name in enumerate(FEATURES):
+        copy = frame.copy()
+        scale = np.array([stats[int(pid)][1][i] for pid in copy["plot_id"]])
+        sign = np.where(np.arange(len(copy)) % 2 == 0, 1.0, -1.0)
+        copy[name] = copy[name] + sign * shift * scale
+        copies.append(copy)
+    return copies
+
+
+def compare_with_plot_models(frame, by=None, n_groups=None, varieties=None, holdout=0.2, shift=4.0):
+    """
+    Fit per-plot and group models on the same (1 - holdout) of each plot's
+    baseline vectors and score the rest, plus copies of it with one feature
+    shifted by `shift` plot deviations (synthetic anomalies).
+
+    Returns {"plot": summary, "group": summary, "agreement": fraction, "by_plot": {...}}
+    where a summary has models, bytes, bytes_per_plot, fit_seconds,
+    false_positive_rate and recall; by_plot has the counts behind them.
+    """
+    import numpy as np
+    import pandas as pd
+
+    frame = frame.sample(frac=1.0, random_state=42)
+    test_mask = frame.groupby("plot_id").cumcount() < (frame.groupby("plot_id")["plot_id"].transform("size") * holdout)
+    train, test = frame[~test_mask], frame[test_mask]
+    stats = plot_stats(train)
+
+    # per-plot models, as train_models fits them
+    plot_models, plot_fit = {}, 0.0
+    for pid, rows in train.groupby("plot_id"):
+        t0 = time.perf_counter()
+        plot_models[int(pid)] = fit_full(rows[FEATURES].to_numpy(dtype=float), fit_params())
+        plot_fit += time.perf_counter() - t0
+
+    manifest, forests, timings = train_groups(train, by=by, n_groups=n_groups, varieties=varieties)
+
+    anomalies = pd.concat(shifted_anomalies(test, stats, shift), ignore_index=True)
+    flags = {"plot": {}, "group": {}}
+    by_plot = {}
+    for pid in sorted(plot_models):
+        normal = test[test["plot_id"] == pid][FEATURES].to_numpy(dtype=float)
+        shifted = anomalies[anomalies["plot_id"] == pid][FEATURES].to_numpy(dtype=float)
+        entry = manifest["plots"][str(pid)]
+        models = {
+            "plot": plot_models[pid],
+            "group": GroupedModel(forests[entry["group"]], entry["group"], entry["mean"], entry["scale"]),
+        }
+        by_plot[pid] = {"model_group": entry["group"], "normal": len(normal), "shifted": len(shifted)}
+        for kind, model in models.items():
+            on_normal = model.decision_function(pd.DataFrame(normal, columns=FEATURES)) < 0
+            on_shifted = model.decision_function(pd.DataFrame(shifted, columns=FEATURES)) < 0
+            flags[kind][pid] = np.concatenate([on_normal, on_shifted])
+            by_plot[pid][kind] = {
+                "false_positives": int(on_normal.sum()),
+                "detected": int(on_shifted.sum()),
+            }
+
+    def summary(kind, models, fit_seconds):
+        total = model_bytes(list(models.values()))
+        normal = sum(p["normal"] for p in by_plot.values())
+        shifted = sum(p["shifted"] for p in by_plot.values())
+        return {
+            "models": len(models),
+            "bytes": total,
+            "bytes_per_plot": total / len(by_plot),
+            "fit_seconds": fit_seconds,
+            "false_positive_rate": sum(p[kind]["false_positives"] for p in by_plot.values()) / max(normal, 1),
+            "recall": sum(p[kind]["detected"] for p in by_plot.values()) / max(shifted, 1),
+        }
+
+    plot_flags = np.concatenate([flags["plot"][pid] for pid in by_plot])
+    group_flags = np.concatenate([flags["group"][pid] for pid in by_plot])
+
+    return {
+        "plot": summary("plot", plot_models, plot_fit),
+        "group": summary("group", forests, sum(timings.values())),
+        "agreement": float((plot_flags == group_flags).mean()),
+        "by_plot": by_plot,
+    }
@@ -0,0 +1,174 @@
+"""
+AgriBot recommendation pipeline.
+
+Anomaly events are queued here (after their transaction commits) and a
+background worker turns them into AgentRecommendation rows in batches, so
+the detection request never waits on recommendation generation.
+
+Usage:
+    from mlmodule.recommendation_pipeline import enqueue_on_commit
+    enqueue_on_commit(event.id)
+"""
+import atexit
+import logging
+import queue
+import threading
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+
+from monitoring import metrics
+
+logger = logging.getLogger(__name__)
+
+_queue = queue.Queue()
+_worker = None
+_worker_lock = threading.Lock()
+
+metrics.register_gauge("recommendations.queue_depth", _queue.qsize)
+
+
+def _config(name, default):
+    return getattr(settings, "AGRIBOT_PIPELINE", {}).get(name, default)
+
+
+def is_enabled():
+    return _config("ENABLED", True)
+
+
+def enqueue(anomaly_event_id):
+    """Queue one anomaly event id for recommendation generation."""
+    _queue.put(anomaly_event_id)
+    metrics.incr("recommendations.enqueued")
+    _ensure_worker()
+
+
+def enqueue_on_commit(anomaly_event_id):
+    """
+    Queue the event once the surrounding transaction commits.
+
+    If the transaction rolls back the event never existed, so nothing is queued.
+    Outside a transaction (autocommit) the event is queued immediately.
+    """
+    if not is_enabled():
+        return
+    transaction.on_commit(lambda: enqueue(anomaly_event_id))
+
+
+def _ensure_worker():
+    global _worker
+
+    if _worker is not None and _worker.is_alive():
+        return
+
+    with _worker_lock:
+        if _worker is not None and _worker.is_alive():
+            return
+        _worker = threading.Thread(
+            target=_run_worker, name="agribot-recommendations", daemon=True
+        )
+        _worker.start()
+
+
+def _next_batch(batch_size, wait_seconds):
+    """Block for the first id, then collect up to batch_size ids within wait_seconds."""
+    batch = [_queue.get()]
+    while len(batch) < batch_size:
+        try:
+            batch.append(_queue.get(timeout=wait_seconds))
+        except queue.Empty:
+            break
+    return batch
+
+
+def _run_worker():
+    batch_size = _config("BATCH_SIZE", 50)
+    wait_seconds = _config("BATCH_WAIT_SECONDS", 1.0)
+
+    while True:
+        batch = _next_batch(batch_size, wait_seconds)
+        try:
+            process_batch(batch)
+        except Exception:
+            metrics.incr("recommendations.failed", len(batch))
+            logger.exception("Recommendation batch of %d events failed", len(batch))
+        finally:
+            for _ in batch:
+                _queue.task_done()
+            close_old_connections()
+
+
+def process_batch(anomaly_event_ids):
+    """
+    Generate and store recommendations for a batch of anomaly events.
+
+    Events that already have a recommendation (or were deleted meanwhile)
+    are skipped; an event whose recommendation fails is logged and skipped
+    without losing the rest of the batch. Returns the number of
+    recommendations created.
+    """
+    from monitoring.models import AnomalyEvent, AgentRecommendation
+    from .agribot import generate_recommendation
+
+    template_type = _config("TEMPLATE", "farmer_friendly")
+    events = AnomalyEvent.objects.filter(
+        id__in=anomaly_event_ids, recommendation__isnull=True
+    )
+
+    records = []
+    for event in events:
+        try:
+            rec = generate_recommendation(event, template_type)
+        except Exception:
+            metrics.incr("recommendations.failed")
+            logger.exception("Recommendation for anomaly event %s failed", event.id)
+            continue
+        records.append(AgentRecommendation(
+            anomaly_event=event,
+            recommended_action=rec['recommended_action'],
+            explanation_text=rec['explanation_text'],
+            confidence=rec['confidence'],
+            urgency=rec['urgency'],
+            category=rec['category'],
+        ))
+
+    # OneToOne on anomaly_event: a concurrent POST /ml/recommend/ wins the race
+    AgentRecommendation.objects.bulk_create(records, ignore_conflicts=True)
+
+    # ours are the stored rows with our timestamp (set by bulk_create)
+    stored = dict(
+        AgentRecommendation.objects
+        .filter(anomaly_event_id__in=[r.anomaly_event_id for r in records])
+        .values_list("anomaly_event_id", "timestamp")
+    )
+    created = sum(1 for r in records if stored.get(r.anomaly_event_id) == r.timestamp)
+
+    metrics.incr("recommendations.created", created)
+    metrics.incr("recommendations.batches")
+    return created
+
+
+def drain():
+    """
+    Process everything still queued in the calling thread.
+
+    Used on interpreter shutdown so queued events are not lost.
+    """
+    pending = []
+    while True:
+        try:
+            pending.append(_queue.get_nowait())
+        except queue.Empty:
+            break
+
+    if not pending:
+        return 0
+
+    try:
+        return process_batch(pending)
+    finally:
+        for _ in pending:
+            _queue.task_done()
+
+
+atexit.register(drain)
@@ -0,0 +1,56 @@
+"""
+Single-flight helper.
+
+Concurrent callers asking for the same key share one in-progress
+computation instead of each running it.
+
+Usage:
+    flight = SingleFlight()
+    result, shared = flight.do(("plot", 1), lambda: expensive(1))
+"""
+import threading
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, func):
+        """
+        Run func() once per key at a time.
+
+        Returns (result, shared): shared is True when this caller waited for
+        another caller's computation. Errors are re-raised to every waiter.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = func()
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+        return call.result, False
@@ -1,3 +1,158 @@
-from django.test import TestCase
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+from django.contrib.auth.models import User
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+
+from monitoring.models import AnomalyEvent, FarmProfile, FieldPlot, SensorReading
+
+from . import iris_service, trends
+
+
+@override_settings(ML_INFERENCE_SOCKET="/nonexistent/inference.sock")
+class InferenceFallbackTests(SimpleTestCase):
+    def setUp(self):
+        iris_service._inference_client = None
+        iris_service._inference_down_until = 0.0
+        self.addCleanup(setattr, iris_service, "_inference_client", None)
+        self.addCleanup(setattr, iris_service, "_inference_down_until", 0.0)
+
+    def score(self, error):
+        client = iris_service.get_inference_client()
+        with mock.patch.object(client, "score", side_effect=error), \
+                mock.patch.object(iris_service, "score_local", return_value=[0.25]) as local:
+            self.assertEqual(iris_service.score_vectors(1, [[20.0, 60.0, 30.0]]), [0.25])
+        local.assert_called_once()
+
+    def test_server_error_falls_back_without_retry_window(self):
+        self.score(RuntimeError("model file is corrupt"))
+        self.assertEqual(iris_service._inference_down_until, 0.0)
+
+    def test_unreachable_server_falls_back_and_waits(self):
+        self.score(ConnectionRefusedError())
+        self.assertGreater(iris_service._inference_down_until, 0.0)
+
+    def test_missing_model_is_not_scored_locally(self):
+        from .inference_server import ModelNotFound
+
+        client = iris_service.get_inference_client()
+        with mock.patch.object(client, "score", side_effect=ModelNotFound(1)), \
+                mock.patch.object(iris_service, "score_local") as local:
+            self.assertIsNone(iris_service.score_vectors(1, [[20.0, 60.0, 30.0]]))
+        local.assert_not_called()
+
+
+def fake_scores(plot_id, X):
+    # moisture of 90 or more is anomalous, the more the lower the score
+    moisture = np.asarray(X, dtype=float)[:, 2]
+    return np.where(moisture >= 90, -(moisture - 90) / 10, 0.2)
+
+
+@override_settings(
+    ANOMALY_EPISODE_GAP_SECONDS=60,
+    READING_RING={"ENABLED": False},
+    AGRIBOT_PIPELINE={"ENABLED": False},
+)
+class EpisodeTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        owner = User.objects.create(username="episode-tests")
+        farm = FarmProfile.objects.create(owner=owner, name="f", location="l", size_hectares=1, crop_type="c")
+        cls.plot, cls.other_plot = [FieldPlot.objects.create(farm=farm, name=f"p{i}", crop_variety="v") for i in range(2)]
+
+    def setUp(self):
+        trends._plots.clear()
+        self.addCleanup(trends._plots.clear)
+        patcher = mock.patch.object(iris_service, "score_vectors", side_effect=fake_scores)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.t0 = (timezone.now() - timedelta(minutes=10)).replace(microsecond=0)
+
+    def vector(self, plot, seconds, moisture, sensors=("temperature", "humidity", "moisture")):
+        values = {"temperature": 22.0, "humidity": 60.0, "moisture": moisture}
+        ts = self.t0 + timedelta(seconds=seconds)
+        SensorReading.objects.bulk_create([
+            SensorReading(plot=plot, sensor_type=name, value=values[name], timestamp=ts) for name in sensors
+        ])
+
+    def detect(self):
+        return iris_service.run_batch_detection(minutes=30)
+
+    def episodes(self, plot):
+        return list(AnomalyEvent.objects.filter(plot=plot).order_by("started_at"))
+
+    def test_vectors_within_the_gap_extend_one_episode(self):
+        for seconds, moisture in [(0, 93.0), (20, 98.0), (50, 95.0), (100, 40.0), (200, 92.0)]:
+            self.vector(self.plot, seconds, moisture)
+
+        result = self.detect()
+        self.assertEqual(result["total_analyzed"], 5)
+        self.assertEqual(result["anomalies_found"], 4)
+        self.assertEqual(result["events_created"], 2)
+        self.assertEqual(result["episodes_extended"], 2)
+
+        first, second = self.episodes(self.plot)
+        self.assertEqual((first.started_at, first.ended_at), (self.t0, self.t0 + timedelta(seconds=50)))
+        self.assertEqual(first.vector_count, 3)
+        # peak: the lowest score and the severity it maps to
+        self.assertAlmostEqual(first.min_score, -0.8)
+        self.assertAlmostEqual(first.model_confidence, 0.8)
+        self.assertEqual(first.severity, "high")
+        self.assertIn("M=98.0", first.anomaly_type)
+
+        # 150 s after the first episode ended: a new one
+        self.assertEqual((second.started_at, second.ended_at), (self.t0 + timedelta(seconds=200),) * 2)
+        self.assertEqual(second.vector_count, 1)
+        self.assertEqual(second.severity, "low")
+
+    def test_later_run_extends_the_open_episode_without_recounting(self):
+        self.vector(self.plot, 0, 93.0)
+        self.vector(self.plot, 20, 96.0)
+        self.detect()
+
+        self.vector(self.plot, 70, 94.0)
+        result = self.detect()
+        self.assertEqual(result["events_created"], 0)
+        self.assertEqual(result["episodes_extended"], 1)
+        # the two vectors already in the episode are not counted again
+        self.assertEqual(result["duplicates_skipped"], 2)
+
+        [episode] = self.episodes(self.plot)
+        self.assertEqual(episode.ended_at, self.t0 + timedelta(seconds=70))
+        self.assertEqual(episode.vector_count, 3)
+        self.assertAlmostEqual(episode.min_score, -0.6)
+        self.assertEqual(episode.severity, "high")
+
+    def test_plots_have_separate_episodes(self):
+        self.vector(self.plot, 0, 95.0)
+        self.vector(self.other_plot, 10, 95.0)
+        self.vector(self.plot, 20, 95.0)
+
+        result = self.detect()
+        self.assertEqual(result["events_created"], 2)
+        self.assertEqual(result["by_plot"][self.plot.id]["episodes_extended"], 1)
+        self.assertEqual(result["by_plot"][self.other_plot.id]["events_created"], 1)
+        self.assertEqual([e.vector_count for e in self.episodes(self.plot)], [2])
+        self.assertEqual([e.vector_count for e in self.episodes(self.other_plot)], [1])
+
+    def test_incomplete_vectors_are_not_scored(self):
+        # moisture alone, or without moisture: no vector for that second
+        self.vector(self.plot, 0, 95.0, sensors=("moisture",))
+        self.vector(self.plot, 10, 95.0, sensors=("temperature", "humidity"))
+        self.vector(self.plot, 30, 95.0)
+
+        result = self.detect()
+        self.assertEqual(result["total_analyzed"], 1)
+        [episode] = self.episodes(self.plot)
+        self.assertEqual((episode.started_at, episode.vector_count), (self.t0 + timedelta(seconds=30), 1))
+
+    @override_settings(ANOMALY_EPISODE_GAP_SECONDS=0)
+    def test_no_gap_creates_one_event_per_vector(self):
+        for seconds in (0, 1, 2):
+            self.vector(self.plot, seconds, 95.0)
+
+        result = self.detect()
+        self.assertEqual((result["events_created"], result["episodes_extended"]), (3, 0))
+        self.assertEqual(self.detect()["duplicates_skipped"], 3)
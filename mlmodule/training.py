@@ -0,0 +1,565 @@
+"""
+Per-plot IsolationForest training from the database (python manage.py train_models).
+
+Baseline vectors are streamed per plot: one index-ordered query per sensor
+type (plus its archived days, monitoring/archive.py), merged by timestamp and
+folded into one vector per second the way prepare_vectors() does, so a plot
+never needs more than its own vectors in memory. By default vectors inside
+AnomalyEvent episodes and readings of EXCLUDE_SOURCES are left out, and only
+the last MAX_VECTORS vectors of a plot are kept (each tree only samples 256).
+
+Plots are fitted in WORKERS processes. The main process loads the next plot
+while the workers fit; it waits before submitting when the vectors and models
+in flight would exceed MEMORY_MB. Each worker writes its model to a temporary
+file and renames it over isoforest_plot_<id>.joblib, so detection never loads
+a partial file. manifest.json in the model directory records, per plot, when
+and on what the model was trained.
+
+refresh=True (train_models --refresh) updates existing models instead: only
+the vectors since a plot's last training are loaded, and REFRESH_FRACTION of
+its trees are replaced by (REFRESH_MODE "replace") or extended with ("add",
+up to MAX_TREES) trees fitted on them through IsolationForest.warm_start, so
+the cost follows the new data. Drift guards keep the current model when the
+new vectors do not look like its baseline: more than REFRESH_MAX_FLAGGED of
+them flagged by it, or a feature mean moved by more than REFRESH_MAX_SHIFT
+baseline deviations. Those plots need a full retrain (retrain_on_drift does
+it right away). compare=True also reports, per refreshed plot, time and
+detection quality of a refresh against a full fit, both in memory and
+scored on the newest COMPARE_HOLDOUT of the new vectors, which neither saw.
+"""
+import hashlib
+import heapq
+import json
+import math
+import os
+import time
+from array import array
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django import db
+from django.conf import settings
+from django.utils import timezone
+
+FEATURES = ["temperature", "humidity", "moisture"]
+MANIFEST = "manifest.json"
+MANIFEST_VERSION = 1
+# pickled IsolationForest size per tree (256 samples), for the memory budget
+TREE_BYTES = 16 * 1024
+
+DEFAULTS = {
+    "DAYS": 30,
+    "MAX_VECTORS": 50000,
+    "MIN_VECTORS": 50,
+    "WORKERS": None,
+    "MEMORY_MB": 512,
+    "EXCLUDE_SOURCES": ["test"],
+    "N_ESTIMATORS": 200,
+    "CONTAMINATION": 0.02,
+    "CHUNK_SIZE": 5000,
+    "REFRESH_FRACTION": 0.25,
+    "REFRESH_MODE": "replace",
+    "REFRESH_MAX_FLAGGED": 0.2,
+    "REFRESH_MAX_SHIFT": 3.0,
+    "MAX_TREES": 400,
+}
+# size of the synthetic anomalies of the refresh comparison, in baseline deviations
+COMPARE_SHIFT = 4.0
+# newest share of the new vectors held out of both comparison fits
+COMPARE_HOLDOUT = 0.25
+
+
+def _config(name):
+    return getattr(settings, "ML_TRAINING", {}).get(name, DEFAULTS[name])
+
+
+def model_filename(plot_id):
+    return f"isoforest_plot_{plot_id}.joblib"
+
+
+def atomic_write(path, write):
+    """Call write(tmp) on a temporary file next to path, then rename it over path."""
+    tmp = f"{path}.tmp{os.getpid()}"
+    try:
+        write(tmp)
+        os.replace(tmp, path)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+
+# -----------------------------------------------------------------------------
+# Baseline vectors
+# -----------------------------------------------------------------------------
+def _sensor_stream(plot_id, sensor_type, start, end, exclude_sources, chunk_size):
+    # (timestamp, value) of one sensor, raw readings and archived days merged
+    from monitoring.archive import archived_rows, archives_in
+    from monitoring.models import SensorReading
+
+    raw = SensorReading.objects.filter(
+        plot_id=plot_id, sensor_type=sensor_type, timestamp__gte=start, timestamp__lt=end,
+    )
+    if exclude_sources:
+        raw = raw.exclude(source__in=exclude_sources)
+    raw = raw.order_by("timestamp").values_list("timestamp", "value").iterator(chunk_size=chunk_size)
+
+    archived = (
+        (ts, value)
+        for ts, value, source in archived_rows(
+            archives_in([plot_id], [sensor_type], start, end), ["timestamp", "value", "source"], start, end,
+        )
+        if source not in exclude_sources
+    )
+    return heapq.merge(archived, raw, key=lambda row: row[0])
+
+
+def _episodes(plot_id, start, end):
+    from monitoring.models import AnomalyEvent
+
+    gap = timedelta(seconds=getattr(settings, "ANOMALY_EPISODE_GAP_SECONDS", 0))
+    return [
+        (math.floor((s - gap).timestamp()), math.floor((e + gap).timestamp()))
+        for s, e in AnomalyEvent.objects
+        .filter(plot_id=plot_id, started_at__lt=end, ended_at__gte=start)
+        .order_by("started_at")
+        .values_list("started_at", "ended_at")
+    ]
+
+
+def baseline_vectors(plot_id, start, end, exclude_sources=None, exclude_anomalies=True,
+                     max_vectors=None, chunk_size=None):
+    """
+    (n, 3) float array of the plot's complete per-second vectors in [start, end),
+    oldest first, at most max_vectors (the most recent ones).
+    """
+    import numpy as np
+
+    exclude_sources = set(_config("EXCLUDE_SOURCES") if exclude_sources is None else exclude_sources)
+    max_vectors = max_vectors or _config("MAX_VECTORS")
+    chunk_size = chunk_size or _config("CHUNK_SIZE")
+    episodes = _episodes(plot_id, start, end) if exclude_anomalies else []
+
+    def tagged(i, name):
+        for ts, value in _sensor_stream(plot_id, name, start, end, exclude_sources, chunk_size):
+            yield ts, i, value
+
+    streams = [tagged(i, name) for i, name in enumerate(FEATURES)]
+
+    # ring of the last max_vectors vectors, one column per feature
+    columns = [array("d", bytes(8 * max_vectors)) for _ in FEATURES]
+    count = 0
+    episode = 0
+    second = None
+    sums, counts = [0.0] * 3, [0] * 3
+
+    def flush():
+        nonlocal count, episode
+        if not all(counts):
+            return
+        while episode < len(episodes) and episodes[episode][1] < second:
+            episode += 1
+        if episode < len(episodes) and episodes[episode][0] <= second:
+            return
+        slot = count % max_vectors
+        for i in range(3):
+            columns[i][slot] = sums[i] / counts[i]
+        count += 1
+
+    for ts, i, value in heapq.merge(*streams, key=lambda row: row[0]):
+        s = math.floor(ts.timestamp())
+        if s != second:
+            if second is not None:
+                flush()
+            second, sums, counts = s, [0.0] * 3, [0] * 3
+        sums[i] += value
+        counts[i] += 1
+    if second is not None:
+        flush()
+
+    n = min(count, max_vectors)
+    X = np.column_stack([np.frombuffer(column, dtype=float) for column in columns])[:n]
+    # oldest first
+    return np.roll(X, -(count % max_vectors), axis=0) if count > max_vectors else X
+
+
+def baseline_frame(plot_ids=None, days=None, exclude_sources=None, exclude_anomalies=True, max_vectors=None):
+    """
+    DataFrame (plot_id + FEATURES) of the baseline vectors train_models() fits
+    on, for every plot (or plot_ids) with at least MIN_VECTORS of them over the
+    last `days`. Used by the group models (train_model_groups).
+    """
+    import numpy as np
+    import pandas as pd
+
+    from monitoring.models import FieldPlot
+
+    end = timezone.now()
+    start = end - timedelta(days=days or _config("DAYS"))
+    if plot_ids is None:
+        plot_ids = list(FieldPlot.objects.order_by("id").values_list("id", flat=True))
+
+    frames = []
+    for plot_id in plot_ids:
+        X = baseline_vectors(plot_id, start, end, exclude_sources, exclude_anomalies, max_vectors)
+        if len(X) < _config("MIN_VECTORS"):
+            continue
+        frame = _frame(X)
+        frame.insert(0, "plot_id", np.full(len(X), plot_id))
+        frames.append(frame)
+    if not frames:
+        return pd.DataFrame(columns=["plot_id"] + FEATURES)
+    return pd.concat(frames, ignore_index=True)
+
+
+def fit_params():
+    """IsolationForest parameters of the per-plot models (from ML_TRAINING)."""
+    return {"n_estimators": _config("N_ESTIMATORS"), "contamination": _config("CONTAMINATION")}
+
+
+# -----------------------------------------------------------------------------
+# Fitting (runs in worker processes: no database, no settings)
+# -----------------------------------------------------------------------------
+def _frame(X):
+    import pandas as pd
+
+    return pd.DataFrame(X, columns=FEATURES)
+
+
+def fit_full(X, params):
+    from sklearn.ensemble import IsolationForest
+
+    model = IsolationForest(random_state=42, n_jobs=1, **params)
+    # fitted on a DataFrame, like the models iris_service scores with feature names
+    model.fit(_frame(X))
+    return model
+
+
+def fit_plot(plot_id, X, params, directory):
+    """Fit and atomically write one plot model. Returns its manifest entry."""
+    import joblib
+    import sklearn
+
+    t0 = time.perf_counter()
+    model = fit_full(X, params)
+    fit_seconds = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    path = os.path.join(directory, model_filename(plot_id))
+    atomic_write(path, lambda tmp: joblib.dump(model, tmp))
+    write_seconds = time.perf_counter() - t0
+
+    with open(path, "rb") as f:
+        digest = hashlib.sha256(f.read()).hexdigest()
+
+    return {
+        "file": model_filename(plot_id),
+        "rows": len(X),
+        "mean": X.mean(axis=0).tolist(),
+        "std": X.std(axis=0).tolist(),
+        "params": params,
+        "refreshes": 0,
+        "sklearn": sklearn.__version__,
+        "sha256": digest,
+        "bytes": os.path.getsize(path),
+        "fit_seconds": fit_seconds,
+        "write_seconds": write_seconds,
+    }
+
+
+def shifted_copies(X, std, shift=COMPARE_SHIFT):
+    """Copies of the rows of X with one feature moved by ±shift deviations (one copy per feature)."""
+    import numpy as np
+
+    sign = np.where(np.arange(len(X)) % 2 == 0, 1.0, -1.0)
+    copies = []
+    for i in range(len(FEATURES)):
+        copy = X.copy()
+        copy[:, i] += sign * shift * std[i]
+        copies.append(copy)
+    return np.concatenate(copies)
+
+
+def detection_quality(model, normal, anomalies):
+    """(false positive rate, recall, flags) of a model on normal and anomalous vectors."""
+    import numpy as np
+
+    on_normal = model.decision_function(_frame(normal)) < 0
+    on_anomalies = model.decision_function(_frame(anomalies)) < 0
+    return float(on_normal.mean()), float(on_anomalies.mean()), np.concatenate([on_normal, on_anomalies])
+
+
+def refresh_plot(plot_id, X, entry, options, directory, X_full=None):
+    """
+    Refresh one plot model with new vectors X through warm_start and write it
+    atomically. Returns its new manifest entry, or {"drift": reason} /
+    {"skipped": reason} with the model left as it is. With X_full (the whole
+    training window, ending with X), the entry also has "compare": refresh
+    against a full fit, see compare_refresh().
+    """
+    import copy
+
+    import joblib
+    import numpy as np
+
+    path = os.path.join(directory, model_filename(plot_id))
+    model = joblib.load(path)
+    entry = dict(entry)
+    entry.pop("compare", None)
+
+    # new trees must sample as many vectors as the old ones for comparable path lengths
+    if len(X) < model.max_samples_:
+        return {"skipped": f"only {len(X)} new vectors (need {model.max_samples_})", "rows": len(X)}
+
+    # drift guards
+    flagged = float((model.decision_function(_frame(X)) < 0).mean())
+    if flagged > options["max_flagged"]:
+        return {"drift": f"{flagged:.0%} of the new vectors are flagged by the current model", "rows": len(X)}
+    if entry.get("mean") and entry.get("std"):
+        std = np.clip(entry["std"], 1e-6, None)
+        shift = np.abs(X.mean(axis=0) - entry["mean"]) / std
+        if shift.max() > options["max_shift"]:
+            feature = FEATURES[int(shift.argmax())]
+            return {"drift": f"{feature} mean moved {shift.max():.1f} baseline deviations", "rows": len(X)}
+
+    refreshes = entry.get("refreshes", 0) + 1
+    original = copy.deepcopy(model) if X_full is not None else None
+
+    t0 = time.perf_counter()
+    drop, new = _warm_refit(model, X, options, refreshes)
+    fit_seconds = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    atomic_write(path, lambda tmp: joblib.dump(model, tmp))
+    write_seconds = time.perf_counter() - t0
+    with open(path, "rb") as f:
+        digest = hashlib.sha256(f.read()).hexdigest()
+
+    entry.update(
+        refreshes=refreshes,
+        refresh_rows=len(X),
+        trees_replaced=drop,
+        trees_added=new - drop,
+        flagged_before=flagged,
+        sha256=digest,
+        bytes=os.path.getsize(path),
+        fit_seconds=fit_seconds,
+        write_seconds=write_seconds,
+    )
+    entry["params"] = {**entry.get("params", {}), "n_estimators": len(model.estimators_)}
+
+    if X_full is not None:
+        entry["compare"] = compare_refresh(original, X, X_full, options, refreshes, entry["params"])
+    return entry
+
+
+def _warm_refit(model, X, options, refreshes):
+    # replaces (or adds) options["fraction"] of the trees; returns (dropped, new)
+    trees = len(model.estimators_)
+    new = max(1, round(trees * options["fraction"]))
+    drop = new if options["mode"] == "replace" else max(0, trees + new - options["max_trees"])
+    # oldest trees first
+    del model.estimators_[:drop]
+    del model.estimators_features_[:drop]
+    model.set_params(
+        warm_start=True, n_estimators=len(model.estimators_) + new,
+        random_state=42 + refreshes, n_jobs=1,
+    )
+    # refits offset_ on the new vectors, with the whole ensemble
+    model.fit(_frame(X))
+    model.set_params(warm_start=False)
+    return drop, new
+
+
+def compare_refresh(model, X, X_full, options, refreshes, params):
+    """
+    Refresh of model (a copy of the one before refreshing) against a full fit,
+    out of sample: the newest COMPARE_HOLDOUT of X is held out of both fits
+    (X_full ends with the same vectors), and the false positive rate and the
+    recall on shifted copies are measured on it.
+    """
+    holdout = min(int(len(X) * COMPARE_HOLDOUT), len(X) - model.max_samples_)
+    if holdout < 1:
+        return {"skipped": f"too few new vectors to hold out ({len(X)})"}
+    X_train, X_test = X[:-holdout], X[-holdout:]
+
+    t0 = time.perf_counter()
+    _warm_refit(model, X_train, options, refreshes)
+    refresh_seconds = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    full = fit_full(X_full[:-holdout], params)
+    full_seconds = time.perf_counter() - t0
+
+    anomalies = shifted_copies(X_test, X_full[:-holdout].std(axis=0))
+    refresh_fp, refresh_recall, refresh_flags = detection_quality(model, X_test, anomalies)
+    full_fp, full_recall, full_flags = detection_quality(full, X_test, anomalies)
+    return {
+        "refresh_seconds": refresh_seconds,
+        "full_seconds": full_seconds,
+        "refresh_rows": len(X_train),
+        "full_rows": len(X_full) - holdout,
+        "holdout_rows": holdout,
+        "refresh_false_positive_rate": refresh_fp,
+        "full_false_positive_rate": full_fp,
+        "refresh_recall": refresh_recall,
+        "full_recall": full_recall,
+        "agreement": float((refresh_flags == full_flags).mean()),
+    }
+
+
+# -----------------------------------------------------------------------------
+# Pipeline
+# -----------------------------------------------------------------------------
+def load_manifest(directory):
+    path = os.path.join(directory, MANIFEST)
+    if not os.path.exists(path):
+        return {"version": MANIFEST_VERSION, "features": FEATURES, "plots": {}}
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_manifest(manifest, directory):
+    def write(tmp):
+        with open(tmp, "w") as f:
+            json.dump(manifest, f, indent=2, sort_keys=True)
+
+    atomic_write(os.path.join(directory, MANIFEST), write)
+
+
+def _refresh_since(entry, path):
+    # end of the window the model last saw (the file time for models without a manifest entry)
+    if entry and entry.get("window"):
+        return datetime.fromisoformat(entry["window"]["end"])
+    return datetime.fromtimestamp(os.path.getmtime(path), dt_timezone.utc)
+
+
+def train_models(plot_ids=None, days=None, workers=None, memory_mb=None, max_vectors=None,
+                 exclude_sources=None, exclude_anomalies=True, directory=None, dry_run=False,
+                 refresh=False, compare=False, retrain_on_drift=False, report=None):
+    """
+    Train the model of every plot (or plot_ids) on its last `days` of baseline
+    vectors, or with refresh=True update existing models with the vectors
+    since their last training (plots without a model are trained in full).
+    report(plot_id, entry) is called as each plot finishes; entry has rows,
+    load_seconds, fit_seconds, write_seconds, bytes, or "skipped" / "drift" /
+    "error". Returns the manifest.
+    """
+    from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+    from monitoring.models import FieldPlot
+
+    from .iris_service import MODELS_DIR
+
+    directory = str(directory or MODELS_DIR)
+    days = days or _config("DAYS")
+    workers = workers or _config("WORKERS") or os.cpu_count() or 1
+    budget = (memory_mb or _config("MEMORY_MB")) * 1024 * 1024
+    params = fit_params()
+    refresh_options = {
+        "fraction": _config("REFRESH_FRACTION"),
+        "mode": _config("REFRESH_MODE"),
+        "max_flagged": _config("REFRESH_MAX_FLAGGED"),
+        "max_shift": _config("REFRESH_MAX_SHIFT"),
+        "max_trees": _config("MAX_TREES"),
+    }
+    model_bytes = max(params["n_estimators"], _config("MAX_TREES") if refresh else 0) * TREE_BYTES
+    report = report or (lambda plot_id, entry: None)
+
+    end = timezone.now()
+    start = end - timedelta(days=days)
+    if plot_ids is None:
+        plot_ids = list(FieldPlot.objects.order_by("id").values_list("id", flat=True))
+
+    os.makedirs(directory, exist_ok=True)
+    manifest = load_manifest(directory)
+    drifted = []
+
+    # memory of one job: its vectors (also copied into the worker) and its model
+    def job_bytes(*arrays):
+        return sum(2 * X.nbytes for X in arrays if X is not None) + model_bytes
+
+    in_flight = {}
+
+    def collect(done):
+        for future in done:
+            plot_id, load_seconds, _, window = in_flight.pop(future)
+            try:
+                entry = future.result()
+            except Exception as e:
+                # the previous model (if any) is left in place
+                report(plot_id, {"error": repr(e), "load_seconds": load_seconds})
+                continue
+            entry["load_seconds"] = load_seconds
+            if "drift" in entry or "skipped" in entry:
+                if "drift" in entry:
+                    drifted.append(plot_id)
+                report(plot_id, entry)
+                continue
+            entry.update(trained_at=end.isoformat(), window=window)
+            manifest["plots"][str(plot_id)] = entry
+            report(plot_id, entry)
+
+    pool = None
+    try:
+        for plot_id in plot_ids:
+            entry = manifest["plots"].get(str(plot_id))
+            path = os.path.join(directory, model_filename(plot_id))
+            refreshing = refresh and os.path.exists(path)
+
+            t0 = time.perf_counter()
+            since = _refresh_since(entry, path) if refreshing else start
+            X = baseline_vectors(plot_id, since, end, exclude_sources, exclude_anomalies, max_vectors)
+            X_full = None
+            if refreshing and compare:
+                X_full = baseline_vectors(plot_id, start, end, exclude_sources, exclude_anomalies, max_vectors)
+            load_seconds = time.perf_counter() - t0
+
+            if len(X) < _config("MIN_VECTORS"):
+                new = "new " if refreshing else ""
+                report(plot_id, {"skipped": f"only {len(X)} {new}vectors", "rows": len(X), "load_seconds": load_seconds})
+                continue
+            if dry_run:
+                report(plot_id, {"skipped": "dry run", "rows": len(X), "load_seconds": load_seconds})
+                continue
+
+            # bounded memory: wait for running fits before taking on more
+            while in_flight and (
+                len(in_flight) >= workers
+                or sum(job[2] for job in in_flight.values()) + job_bytes(X, X_full) > budget
+            ):
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                collect(done)
+
+            if pool is None:
+                # with the fork start method every worker is forked at the first
+                # submit: close the connection the vectors were loaded over, so
+                # no worker inherits it
+                db.connections.close_all()
+                pool = ProcessPoolExecutor(max_workers=workers)
+
+            if refreshing:
+                # the window keeps its start: the old trees still describe it
+                window = {"start": (entry or {}).get("window", {}).get("start", since.isoformat()), "end": end.isoformat()}
+                future = pool.submit(refresh_plot, plot_id, X, entry or {}, refresh_options, directory, X_full)
+            else:
+                window = {"start": start.isoformat(), "end": end.isoformat()}
+                future = pool.submit(fit_plot, plot_id, X, params, directory)
+            in_flight[future] = (plot_id, load_seconds, job_bytes(X, X_full), window)
+
+        while in_flight:
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            collect(done)
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+    if not dry_run:
+        manifest["updated_at"] = end.isoformat()
+        save_manifest(manifest, directory)
+
+    if drifted and retrain_on_drift:
+        manifest = train_models(
+            plot_ids=drifted, days=days, workers=workers, memory_mb=memory_mb, max_vectors=max_vectors,
+            exclude_sources=exclude_sources, exclude_anomalies=exclude_anomalies, directory=directory,
+            report=report,
+        )
+    return manifest
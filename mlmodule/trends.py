@@ -0,0 +1,199 @@
+"""
+Rolling trend statistics per plot, for trend-aware AgriBot rules.
+
+Every complete sensor vector a plot produces updates, in O(1), three
+time-decayed EWMAs per sensor plus a rate of change:
+
+    level      EWMA over FAST_SECONDS (smoothed current value)
+    reference  EWMA over WINDOW_SECONDS (the recent past)
+    baseline   EWMA over BASELINE_SECONDS (what is normal for the plot)
+    rate       EWMA of d(level)/dt, in units per hour
+
+The decay uses the real time between vectors (alpha = 1 - exp(-dt / tau)),
+so gaps in the data need no special handling.
+
+AgriBotRules.analyze_with_trends() gets:
+
+    moisture_trend  % change of the moisture level against its reference
+    temp_trend      °C of the temperature reference above its baseline
+                    (sustained over WINDOW_SECONDS, not a single spike)
+
+Detection (mlmodule/iris_service.py) feeds the stored vectors it scores
+(never ad-hoc /ml/check/ values) and stores the trends on the AnomalyEvents
+it creates; generate_recommendation() reads
+them from there. State lives in process memory. A plot seen for the first
+time is warmed up from the last WARMUP_MINUTES of vectors (ring buffer,
+then database).
+"""
+import math
+import threading
+import time
+
+from django.conf import settings
+
+FEATURES = ["temperature", "humidity", "moisture"]
+
+DEFAULTS = {
+    "FAST_SECONDS": 120,
+    "WINDOW_SECONDS": 1800,
+    "BASELINE_SECONDS": 86400,
+    "WARMUP_MINUTES": 360,
+}
+
+
+def _config(name):
+    return getattr(settings, "TREND_STATS", {}).get(name, DEFAULTS[name])
+
+
+class RollingStats:
+    """Time-decayed EWMAs and rate of change of one sensor of one plot."""
+    __slots__ = ("level", "reference", "baseline", "rate")
+
+    def __init__(self, value):
+        self.level = self.reference = self.baseline = value
+        self.rate = 0.0
+
+    def update(self, value, dt, taus):
+        fast, window, baseline = taus
+        previous = self.level
+        self.level += (1.0 - math.exp(-dt / fast)) * (value - self.level)
+        self.reference += (1.0 - math.exp(-dt / window)) * (value - self.reference)
+        self.baseline += (1.0 - math.exp(-dt / baseline)) * (value - self.baseline)
+        self.rate += (1.0 - math.exp(-dt / fast)) * ((self.level - previous) / dt * 3600.0 - self.rate)
+
+    @property
+    def change_pct(self):
+        if not self.reference:
+            return 0.0
+        return (self.level - self.reference) / abs(self.reference) * 100.0
+
+    @property
+    def deviation(self):
+        return self.reference - self.baseline
+
+    def as_dict(self):
+        return {
+            "level": self.level,
+            "reference": self.reference,
+            "baseline": self.baseline,
+            "rate_per_hour": self.rate,
+            "change_pct": self.change_pct,
+            "deviation": self.deviation,
+        }
+
+
+class PlotTrends:
+    """RollingStats of every sensor of one plot, and the last vector time seen."""
+    __slots__ = ("t", "stats")
+
+    def __init__(self):
+        self.t = None
+        self.stats = None
+
+    def observe(self, t, values, taus):
+        """Feed one complete vector at epoch second t; older or repeated vectors are ignored."""
+        if self.t is not None and t <= self.t:
+            return False
+        if self.stats is None:
+            self.stats = {name: RollingStats(values[name]) for name in FEATURES}
+        else:
+            dt = t - self.t
+            for name in FEATURES:
+                self.stats[name].update(values[name], dt, taus)
+        self.t = t
+        return True
+
+    def features(self):
+        """Keyword arguments for AgriBotRules.analyze_with_trends()."""
+        if self.stats is None:
+            return {"moisture_trend": None, "temp_trend": None}
+        return {
+            "moisture_trend": self.stats["moisture"].change_pct,
+            "temp_trend": self.stats["temperature"].deviation,
+        }
+
+
+_plots = {}
+_lock = threading.Lock()
+
+
+def _taus():
+    return (_config("FAST_SECONDS"), _config("WINDOW_SECONDS"), _config("BASELINE_SECONDS"))
+
+
+def _epoch_seconds(frame):
+    import pandas as pd
+
+    return ((frame["timestamp"] - pd.Timestamp(0, tz="UTC")) // pd.Timedelta(seconds=1)).to_numpy()
+
+
+def _warm_up(plot_id, state, until=None):
+    # history before the first vector this process sees
+    from .iris_service import get_vectors
+
+    vectors = get_vectors(plot_id, _config("WARMUP_MINUTES"))
+    if vectors.empty:
+        return
+    taus = _taus()
+    for t, *values in zip(_epoch_seconds(vectors), *(vectors[name].to_numpy() for name in FEATURES)):
+        if until is not None and t >= until:
+            break
+        state.observe(int(t), dict(zip(FEATURES, values)), taus)
+
+
+def _state(plot_id, first_t=None):
+    # called without _lock: the warm-up queries the database
+    state = _plots.get(plot_id)
+    if state is None:
+        state = PlotTrends()
+        _warm_up(plot_id, state, until=first_t)
+        with _lock:
+            # another thread may have warmed the plot up meanwhile
+            state = _plots.setdefault(plot_id, state)
+    return state
+
+
+def observe(plot_id, t, temperature, humidity, moisture):
+    """Feed one complete, stored vector of a plot (epoch second t). O(1)."""
+    state = _state(plot_id, first_t=t)
+    with _lock:
+        state.observe(t, {"temperature": temperature, "humidity": humidity, "moisture": moisture}, _taus())
+
+
+def catch_up(plot_id):
+    """Feed the vectors of a plot newer than the last one seen (ring buffer, then database)."""
+    from .iris_service import get_vectors
+
+    state = _state(plot_id)
+    with _lock:
+        since = state.t if state.t is not None else time.time() - _config("WARMUP_MINUTES") * 60
+        minutes = max(1, math.ceil((time.time() - since) / 60))
+
+    vectors = get_vectors(plot_id, minutes)
+    if vectors.empty:
+        return
+
+    taus = _taus()
+    with _lock:
+        for t, *values in zip(_epoch_seconds(vectors), *(vectors[name].to_numpy() for name in FEATURES)):
+            state.observe(int(t), dict(zip(FEATURES, values)), taus)
+
+
+def trend_features(plot_id, refresh=False):
+    """{"moisture_trend", "temp_trend"} of a plot (None values before any data)."""
+    if refresh:
+        catch_up(plot_id)
+    state = _state(plot_id)
+    with _lock:
+        return state.features()
+
+
+def plot_trends(plot_id, refresh=True):
+    """Full statistics of a plot: {"t": epoch second, "temperature": {...}, ...} or None."""
+    if refresh:
+        catch_up(plot_id)
+    state = _state(plot_id)
+    with _lock:
+        if state.stats is None:
+            return None
+        return {"t": state.t, **{name: state.stats[name].as_dict() for name in FEATURES}}
@@ -1,6 +1,6 @@
 from django.contrib import admin
 from django.contrib.auth.models import User
-from .models import UserProfile, FarmProfile, FieldPlot, SensorReading, AnomalyEvent, AgentRecommendation
+from .models import UserProfile, FarmProfile, FieldPlot, SensorReading, AnomalyEvent, AgentRecommendation, LatestReading, DeviceAPIKey, ReadingSource, RetentionPolicy, ReadingRollup, ReadingArchive
 
 # Simple registration
 admin.site.register(UserProfile)
@@ -9,3 +9,9 @@ admin.site.register(FieldPlot)
 admin.site.register(SensorReading)
 admin.site.register(AnomalyEvent)
 admin.site.register(AgentRecommendation)
+admin.site.register(LatestReading)
+admin.site.register(DeviceAPIKey)
+admin.site.register(ReadingSource)
+admin.site.register(RetentionPolicy)
+admin.site.register(ReadingRollup)
+admin.site.register(ReadingArchive)
@@ -1,6 +1,15 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
 
 
 class MonitoringConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'monitoring'
+
+    def ready(self):
+        # connect the role and device-key cache invalidation receivers
+        from . import authentication, permissions  # noqa: F401
+        from .ringbuffer import clear
+
+        # migrate and flush: the reading rings must not outlive the data
+        post_migrate.connect(clear, sender=self, dispatch_uid="monitoring.ringbuffer.clear")
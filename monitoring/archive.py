@@ -0,0 +1,424 @@
+"""
+Compressed cold storage of historical readings (ReadingArchive).
+
+One archive row holds every reading of one (plot, sensor_type, local day).
+The blob is a small header followed by one zlib stream of four columns,
+each an array of fixed-width integers:
+
+    timestamps         int64  microseconds, delta to the previous reading
+    values             int64  value * 10**scale, delta to the previous one, when
+                              every value has at most MAX_SCALE decimals (sensors
+                              report 2); otherwise uint64 float64 bits XORed
+                              with the previous value's
+    sources            uint16 ReadingSource codes
+    device timestamps  int64  microseconds relative to the timestamp (NULL_OFFSET = NULL)
+
+Regular sampling leaves near-constant deltas, and slowly changing values
+leave small deltas (or XORs whose high sign/exponent bytes are zero). Each column is
+byte-shuffled (all first bytes, then all second bytes, ...) before
+compression so those runs end up next to each other.
+
+Ids and idempotency keys are not kept.
+
+archive_readings() moves whole days older than READING_ARCHIVE["AFTER_DAYS"]
+out of SensorReading (python manage.py archive_readings);
+archived_rows() and archive_bucket_rows() read them back for the export and
+stats endpoints. Archiving does not end retention: apply_retention()
+(monitoring/retention.py) rolls archived days past a policy's cutoff into
+ReadingRollup rows and deletes them, like raw readings.
+"""
+import heapq
+import struct
+import sys
+import zlib
+from array import array
+from datetime import datetime, time as dt_time, timedelta, timezone as dt_timezone
+from itertools import chain
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import ReadingArchive, SensorReading
+
+DEFAULTS = {
+    "AFTER_DAYS": 30,
+    "ZLIB_LEVEL": 6,
+}
+
+MAGIC = b"AGRA"
+VERSION = 1
+# magic, version, value scale, reading count, first timestamp (microseconds since the epoch)
+HEADER = struct.Struct("<4sBBIq")
+NULL_OFFSET = -(2 ** 63)
+# values with more decimals are stored as XORed float bits
+MAX_SCALE = 6
+FLOAT_BITS = 255
+
+EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+_SOURCE = SensorReading._meta.get_field("source")
+
+
+def _config(name):
+    return getattr(settings, "READING_ARCHIVE", {}).get(name, DEFAULTS[name])
+
+
+# -----------------------------------------------------------------------------
+# Codec
+# -----------------------------------------------------------------------------
+def _micros(dt):
+    return (dt - EPOCH) // timedelta(microseconds=1)
+
+
+def _datetime(micros):
+    return EPOCH + timedelta(microseconds=micros)
+
+
+def _shuffle(values):
+    if sys.byteorder == "big":
+        values = array(values.typecode, values)
+        values.byteswap()
+    raw = values.tobytes()
+    width = values.itemsize
+    return b"".join(raw[i::width] for i in range(width))
+
+
+def _unshuffle(typecode, data, count):
+    values = array(typecode)
+    width = values.itemsize
+    raw = bytearray(count * width)
+    for i in range(width):
+        raw[i::width] = data[i * count:(i + 1) * count]
+    values.frombytes(raw)
+    if sys.byteorder == "big":
+        values.byteswap()
+    return values
+
+
+def _value_scale(values):
+    """Smallest number of decimals that represents every value exactly, or FLOAT_BITS."""
+    for scale in range(MAX_SCALE + 1):
+        factor = 10 ** scale
+        if all(abs(v) < 2 ** 52 / factor and round(v * factor) / factor == v for v in values):
+            return scale
+    return FLOAT_BITS
+
+
+def _encode_values(values, scale):
+    if scale == FLOAT_BITS:
+        bits = array("Q")
+        bits.frombytes(array("d", values).tobytes())
+        return array("Q", [a ^ b for a, b in zip(chain([0], bits), bits)])
+    factor = 10 ** scale
+    ints = [round(v * factor) for v in values]
+    return array("q", [b - a for a, b in zip(chain([0], ints), ints)])
+
+
+def _decode_values(encoded, scale):
+    values = array("d")
+    if scale == FLOAT_BITS:
+        bits = array("Q")
+        value = 0
+        for x in encoded:
+            value ^= x
+            bits.append(value)
+        values.frombytes(bits.tobytes())
+        return values
+    factor = 10 ** scale
+    value = 0
+    for delta in encoded:
+        value += delta
+        values.append(value / factor)
+    return values
+
+
+def pack(readings):
+    """
+    Blob for [(timestamp, value, source_code, device_timestamp)] sorted by
+    timestamp (aware datetimes; device_timestamp may be None).
+    """
+    stamps = [_micros(r[0]) for r in readings]
+    first = stamps[0] if stamps else 0
+    deltas = array("q", [b - a for a, b in zip(chain([first], stamps), stamps)])
+
+    values = [r[1] for r in readings]
+    scale = _value_scale(values)
+    encoded = _encode_values(values, scale)
+
+    sources = array("H", [r[2] for r in readings])
+    offsets = array("q", [
+        NULL_OFFSET if r[3] is None else _micros(r[3]) - stamp
+        for r, stamp in zip(readings, stamps)
+    ])
+
+    body = b"".join(_shuffle(column) for column in (deltas, encoded, sources, offsets))
+    return HEADER.pack(MAGIC, VERSION, scale, len(readings), first) + zlib.compress(body, _config("ZLIB_LEVEL"))
+
+
+def unpack(blob):
+    """(timestamps µs, values, source codes, device timestamp offsets µs) arrays of a blob."""
+    magic, version, scale, count, first = HEADER.unpack_from(blob)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError(f"Not a reading archive (version {version})")
+
+    body = zlib.decompress(bytes(blob[HEADER.size:]))
+    pos = 0
+    columns = []
+    for typecode in ("q", "Q" if scale == FLOAT_BITS else "q", "H", "q"):
+        size = count * array(typecode).itemsize
+        columns.append(_unshuffle(typecode, body[pos:pos + size], count))
+        pos += size
+    deltas, encoded, sources, offsets = columns
+
+    stamps = array("q")
+    stamp = first
+    for delta in deltas:
+        stamp += delta
+        stamps.append(stamp)
+
+    return stamps, _decode_values(encoded, scale), sources, offsets
+
+
+def decode(archive):
+    """[(timestamp, value, source, device_timestamp)] of an archive, as stored before archiving."""
+    stamps, values, sources, offsets = unpack(archive.data)
+    names = {code: _SOURCE.name_for(code) for code in set(sources)}
+    return [
+        (_datetime(stamp), value, names[source], None if offset == NULL_OFFSET else _datetime(stamp + offset))
+        for stamp, value, source, offset in zip(stamps, values, sources, offsets)
+    ]
+
+
+# -----------------------------------------------------------------------------
+# Archiving
+# -----------------------------------------------------------------------------
+def archive_cutoff(days=None, now=None):
+    """Start of the local day days ago: whole days before it are archived."""
+    days = _config("AFTER_DAYS") if days is None else days
+    local = timezone.localtime(now or timezone.now()) - timedelta(days=days)
+    return local.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def pending_days(cutoff, plot_ids=None):
+    """[(plot_id, sensor_type, day, readings)] of raw readings before cutoff."""
+    qs = SensorReading.objects.filter(timestamp__lt=cutoff)
+    if plot_ids:
+        qs = qs.filter(plot_id__in=plot_ids)
+    return list(
+        qs.annotate(day=TruncDate("timestamp"))
+        .values_list("plot_id", "sensor_type", "day")
+        .annotate(readings=Count("id"))
+        .order_by("plot_id", "sensor_type", "day")
+    )
+
+
+def archive_day(plot_id, sensor_type, day):
+    """Move one day of readings into its archive row (merged with any earlier one). Returns the count."""
+    tz = timezone.get_current_timezone()
+    start = datetime.combine(day, dt_time.min, tzinfo=tz)
+    end = datetime.combine(day + timedelta(days=1), dt_time.min, tzinfo=tz)
+
+    with transaction.atomic():
+        readings = SensorReading.objects.filter(
+            plot_id=plot_id, sensor_type=sensor_type, timestamp__gte=start, timestamp__lt=end
+        )
+        rows = list(
+            readings.order_by("timestamp", "id")
+            .values_list("timestamp", "value", "source", "device_timestamp")
+        )
+        if not rows:
+            return 0
+        rows = [(ts, value, _SOURCE.code_for(source), device_ts) for ts, value, source, device_ts in rows]
+
+        archive = ReadingArchive.objects.select_for_update().filter(
+            plot_id=plot_id, sensor_type=sensor_type, day=day
+        ).first()
+        if archive is not None:
+            rows = sorted(
+                [(ts, value, _SOURCE.code_for(source), device_ts)
+                 for ts, value, source, device_ts in decode(archive)] + rows,
+                key=lambda r: r[0],
+            )
+        else:
+            archive = ReadingArchive(plot_id=plot_id, sensor_type=sensor_type, day=day)
+
+        archive.data = pack(rows)
+        archive.count = len(rows)
+        archive.first_timestamp = rows[0][0]
+        archive.last_timestamp = rows[-1][0]
+        archive.save()
+
+        _, deleted = readings.delete()
+        return deleted.get(SensorReading._meta.label, 0)
+
+
+def archive_readings(days=None, plot_ids=None, now=None):
+    """Archive every whole day older than days. Returns [(plot_id, sensor_type, day, readings)]."""
+    results = []
+    for plot_id, sensor_type, day, _ in pending_days(archive_cutoff(days, now), plot_ids):
+        results.append((plot_id, sensor_type, day, archive_day(plot_id, sensor_type, day)))
+    return results
+
+
+# -----------------------------------------------------------------------------
+# Reading archives back
+# -----------------------------------------------------------------------------
+def archives_in(plot_ids, sensor_types, start, end, using="default"):
+    qs = ReadingArchive.objects.using(using).order_by("first_timestamp")
+    if plot_ids:
+        qs = qs.filter(plot_id__in=plot_ids)
+    if sensor_types:
+        qs = qs.filter(sensor_type__in=sensor_types)
+    if start is not None:
+        qs = qs.filter(last_timestamp__gte=start)
+    if end is not None:
+        qs = qs.filter(first_timestamp__lt=end)
+    return qs
+
+
+def _in_range(rows, start, end):
+    for row in rows:
+        if (start is None or row[0] >= start) and (end is None or row[0] < end):
+            yield row
+
+
+def archived_readings(archives, start=None, end=None):
+    """
+    (timestamp, plot_id, sensor_type, value, source, device_timestamp) of the
+    archives' readings in [start, end), in timestamp order. An archive is
+    decoded when the merge reaches its first timestamp, so only the days
+    overlapping the current position are in memory.
+    """
+    def readings(archive):
+        for ts, value, source, device_ts in _in_range(decode(archive), start, end):
+            yield ts, archive.plot_id, archive.sensor_type, value, source, device_ts
+
+    pending = archives.order_by("first_timestamp").iterator()
+    following = next(pending, None)
+    # (timestamp, archive order, reading, rest of the archive's readings)
+    heap = []
+    order = 0
+    while heap or following is not None:
+        # no reading of an archive is older than its first_timestamp
+        while following is not None and (not heap or following.first_timestamp <= heap[0][0]):
+            rows = readings(following)
+            row = next(rows, None)
+            if row is not None:
+                heapq.heappush(heap, (row[0], order, row, rows))
+                order += 1
+            following = next(pending, None)
+        if not heap:
+            continue
+
+        _, position, row, rows = heap[0]
+        yield row
+        following_row = next(rows, None)
+        if following_row is None:
+            heapq.heappop(heap)
+        else:
+            heapq.heapreplace(heap, (following_row[0], position, following_row, rows))
+
+
+ARCHIVED_COLUMNS = {
+    "timestamp": 0,
+    "plot_id": 1,
+    "sensor_type": 2,
+    "value": 3,
+    "source": 4,
+    "device_timestamp": 5,
+}
+
+
+def archived_rows(archives, columns, start=None, end=None):
+    """
+    Archived readings as values_list(*columns) rows of SensorReading, in
+    timestamp order; columns that are not archived (id, idempotency_key) are None.
+    """
+    picks = [ARCHIVED_COLUMNS.get(column) for column in columns]
+    for reading in archived_readings(archives, start, end):
+        yield tuple(None if i is None else reading[i] for i in picks)
+
+
+def _trunc(dt, bucket):
+    """Local start of dt's bucket, as Trunc(bucket) computes it in the database."""
+    dt = timezone.localtime(dt)
+    if bucket == "minute":
+        return dt.replace(second=0, microsecond=0)
+    dt = dt.replace(minute=0, second=0, microsecond=0)
+    if bucket == "hour":
+        return dt
+    dt = dt.replace(hour=0)
+    if bucket == "week":
+        return dt - timedelta(days=dt.weekday())
+    if bucket == "month":
+        return dt.replace(day=1)
+    return dt
+
+
+_BUCKET_STEPS = {
+    "minute": timedelta(minutes=1),
+    "hour": timedelta(hours=1),
+    "day": timedelta(days=1),
+    "week": timedelta(days=7),
+}
+
+
+def _next_bucket(dt, bucket):
+    if bucket == "month":
+        return _trunc(dt + timedelta(days=32), "month")
+    return dt + _BUCKET_STEPS[bucket]
+
+
+def archive_buckets(archive, bucket, start=None, end=None):
+    """{bucket start: [count, min, max, sum, sum of squares]} of an archive's readings in [start, end)."""
+    low = _micros(start) if start is not None else NULL_OFFSET
+    high = _micros(end) if end is not None else -NULL_OFFSET
+
+    sums = {}
+    stamps, values, _, _ = unpack(archive.data)
+    bucket_end = None
+    # timestamps are sorted: a new bucket only starts past bucket_end
+    for stamp, value in zip(stamps, values):
+        if stamp < low or stamp >= high:
+            continue
+        if bucket_end is None or stamp >= bucket_end:
+            t = _trunc(_datetime(stamp), bucket)
+            bucket_end = _micros(_next_bucket(t, bucket))
+            s = sums.setdefault(t, [0, value, value, 0.0, 0.0])
+        s[0] += 1
+        if value < s[1]:
+            s[1] = value
+        if value > s[2]:
+            s[2] = value
+        s[3] += value
+        s[4] += value * value
+    return sums
+
+
+def archive_bucket_rows(plot_ids, sensor_types, start, end, bucket, using="default"):
+    """
+    stats.bucket_rows() rows (plot_id, sensor_type, bucket, count, min, max,
+    avg, stddev) computed from the archived readings in [start, end).
+    """
+    sums = {}
+    for archive in archives_in(plot_ids, sensor_types, start, end, using).iterator():
+        # week and month buckets span several archived days
+        for t, day in archive_buckets(archive, bucket, start, end).items():
+            s = sums.get((archive.plot_id, archive.sensor_type, t))
+            if s is None:
+                sums[(archive.plot_id, archive.sensor_type, t)] = day
+                continue
+            s[0] += day[0]
+            s[1] = min(s[1], day[1])
+            s[2] = max(s[2], day[2])
+            s[3] += day[3]
+            s[4] += day[4]
+
+    rows = []
+    for key in sorted(sums):
+        count, low, high, total, total_sq = sums[key]
+        avg = total / count
+        rows.append((*key, count, low, high, avg, max(total_sq / count - avg * avg, 0.0) ** 0.5))
+    return rows
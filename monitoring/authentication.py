@@ -0,0 +1,208 @@
+"""
+API authentication classes.
+
+RoleJWTAuthentication
+    Access tokens issued by RoleTokenObtainPairSerializer carry the role, so
+    the request user can be built from the token alone (SimpleJWT
+    TokenUser). Tokens without the claim, issued before it existed, still
+    load the user from the database.
+
+DeviceAPIKeyAuthentication
+    Field devices send "Authorization: Api-Key <prefix>.<secret>". The
+    secret is checked against an HMAC-SHA256 (keyed with SECRET_KEY) kept in
+    an in-process cache for DEVICE_KEY_CACHE_SECONDS, so a request costs one
+    HMAC instead of a PBKDF2 password hash and a user query.
+
+Create keys with:
+    python manage.py create_device_key "Gateway north" --plot 1 --plot 2
+"""
+import hashlib
+import hmac
+import secrets
+import threading
+import time
+
+from django.conf import settings
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+from rest_framework import exceptions
+from rest_framework.authentication import BaseAuthentication, get_authorization_header
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.models import TokenUser
+
+from .models import DeviceAPIKey
+from .permissions import ROLE_CLAIM
+
+DEVICE_KEYWORD = b"api-key"
+DEVICE_ROLE = "device"
+
+
+class RoleJWTAuthentication(JWTAuthentication):
+    def get_user(self, validated_token):
+        if validated_token.get(ROLE_CLAIM):
+            return TokenUser(validated_token)
+        return super().get_user(validated_token)
+
+
+# -----------------------------------------------------------------------------
+# Device keys
+# -----------------------------------------------------------------------------
+def hash_device_secret(secret):
+    return hmac.new(
+        settings.SECRET_KEY.encode("utf-8"), secret.encode("utf-8"), hashlib.sha256
+    ).hexdigest()
+
+
+def create_device_key(name, plot_ids):
+    """Create a key for the given plots. Returns (DeviceAPIKey, raw key); the raw key is not stored."""
+    prefix = secrets.token_hex(4)
+    secret = secrets.token_urlsafe(32)
+
+    key = DeviceAPIKey.objects.create(
+        name=name, prefix=prefix, key_hash=hash_device_secret(secret)
+    )
+    key.plots.set(plot_ids)
+    return key, f"{prefix}.{secret}"
+
+
+class DeviceKey:
+    """Cached, read-only view of a DeviceAPIKey; becomes request.auth."""
+    role = DEVICE_ROLE
+
+    def __init__(self, key_id, prefix, name, key_hash, plot_ids, is_active):
+        self.id = key_id
+        self.prefix = prefix
+        self.name = name
+        self.key_hash = key_hash
+        self.plot_ids = plot_ids
+        self.is_active = is_active
+
+    def allows_plot(self, plot_id):
+        return plot_id in self.plot_ids
+
+
+class DeviceUser:
+    """request.user for device requests; devices have no user account."""
+    is_authenticated = True
+    is_anonymous = False
+    is_active = True
+    is_staff = False
+    is_superuser = False
+    pk = id = None
+
+    def __init__(self, key):
+        self.device_key = key
+        self.username = f"device:{key.prefix}"
+
+    def __str__(self):
+        return self.username
+
+
+# prefix -> (DeviceKey, expiry); only existing keys, so bounded by the table
+_key_cache = {}
+_key_cache_lock = threading.Lock()
+_next_sweep = 0.0
+_MISSING = object()
+
+
+def _load_device_key(prefix):
+    key = DeviceAPIKey.objects.filter(prefix=prefix).first()
+    if key is None:
+        return None
+    return DeviceKey(
+        key_id=key.id,
+        prefix=key.prefix,
+        name=key.name,
+        key_hash=key.key_hash,
+        plot_ids=frozenset(key.plots.values_list("id", flat=True)),
+        is_active=key.is_active,
+    )
+
+
+def get_device_key(prefix):
+    """
+    DeviceKey for a prefix (None if unknown), from the cache when fresh.
+
+    Unknown prefixes are not cached: random Api-Key headers would grow the
+    cache without bound.
+    """
+    global _next_sweep
+
+    now = time.monotonic()
+    cached, expires = _key_cache.get(prefix, (_MISSING, 0.0))
+    if cached is not _MISSING and expires > now:
+        return cached
+
+    key = _load_device_key(prefix)
+    ttl = getattr(settings, "DEVICE_KEY_CACHE_SECONDS", 60)
+    with _key_cache_lock:
+        if now >= _next_sweep:
+            # drop expired entries (revoked or deleted keys) once per ttl
+            for stale in [p for p, (_, e) in _key_cache.items() if e <= now]:
+                del _key_cache[stale]
+            _next_sweep = now + ttl
+        if key is None:
+            _key_cache.pop(prefix, None)
+        else:
+            _key_cache[prefix] = (key, now + ttl)
+    return key
+
+
+def forget_device_key(prefix):
+    with _key_cache_lock:
+        _key_cache.pop(prefix, None)
+
+
+@receiver(post_save, sender=DeviceAPIKey)
+@receiver(post_delete, sender=DeviceAPIKey)
+def _invalidate_device_key(sender, instance, **kwargs):
+    forget_device_key(instance.prefix)
+
+
+@receiver(m2m_changed, sender=DeviceAPIKey.plots.through)
+def _invalidate_device_key_plots(sender, instance, **kwargs):
+    if isinstance(instance, DeviceAPIKey):
+        forget_device_key(instance.prefix)
+    else:
+        # changed from the FieldPlot side
+        for prefix in instance.device_keys.values_list("prefix", flat=True):
+            forget_device_key(prefix)
+
+
+class DeviceAPIKeyAuthentication(BaseAuthentication):
+    """
+    Authorization: Api-Key <prefix>.<secret>
+
+    Returns (DeviceUser, DeviceKey); requests without this header are left
+    to the next authentication class.
+    """
+
+    def authenticate(self, request):
+        auth = get_authorization_header(request).split()
+        if not auth or auth[0].lower() != DEVICE_KEYWORD:
+            return None
+        if len(auth) != 2:
+            raise exceptions.AuthenticationFailed("Invalid Api-Key header.")
+
+        try:
+            prefix, secret = auth[1].decode("ascii").split(".", 1)
+        except (UnicodeDecodeError, ValueError):
+            raise exceptions.AuthenticationFailed("Invalid Api-Key header.")
+
+        key = get_device_key(prefix)
+        if key is None or not hmac.compare_digest(key.key_hash, hash_device_secret(secret)):
+            raise exceptions.AuthenticationFailed("Invalid API key.")
+        if not key.is_active:
+            raise exceptions.AuthenticationFailed("API key disabled.")
+
+        return DeviceUser(key), key
+
+    def authenticate_header(self, request):
+        return "Api-Key"
+
+
+def check_device_plot(request, plot_id):
+    """Raise PermissionDenied when a device key posts for a plot outside its scope."""
+    key = request.auth
+    if isinstance(key, DeviceKey) and not key.allows_plot(plot_id):
+        raise exceptions.PermissionDenied(f"This API key may not write readings for plot {plot_id}.")
@@ -0,0 +1,29 @@
+"""
+Read connection routing.
+
+With the SQLite production profile and AGRI_DB_PROFILE/AGRI_DB_READ_ALIAS
+set (see settings.py), DATABASES has a "read" alias: a separate, query-only
+connection to the same WAL database. GET endpoints query through it so
+their reads never share a connection (or a transaction) with ingest writes.
+Without the alias everything stays on "default".
+"""
+from django.conf import settings
+from rest_framework.permissions import SAFE_METHODS
+
+READ_ALIAS = "read"
+
+
+def read_alias():
+    return READ_ALIAS if READ_ALIAS in settings.DATABASES else "default"
+
+
+class ReadConnectionMixin:
+    """ViewSet mixin: GET/HEAD/OPTIONS querysets use the read alias."""
+
+    def get_read_alias(self):
+        if self.request is not None and self.request.method in SAFE_METHODS:
+            return read_alias()
+        return "default"
+
+    def get_queryset(self):
+        return super().get_queryset().using(self.get_read_alias())
@@ -0,0 +1,251 @@
+"""
+Read-optimized list serialization.
+
+High-volume list endpoints skip model instances and per-field DRF
+machinery: rows come from values_list() and a RowEncoder compiled once per
+(serializer, fields) writes each row straight to JSON text. The output is
+byte-for-byte what ModelSerializer + JSONRenderer would produce.
+
+?fields=id,timestamp,value limits the columns that are queried and returned.
+
+Binary renderers (monitoring/renderers.py) with columnar = True get the
+same rows as a Columns object of native values instead.
+"""
+import json
+import math
+from json.encoder import encode_basestring
+
+from django.db.models import QuerySet
+from django.utils import timezone
+from rest_framework import serializers
+from rest_framework.exceptions import ValidationError
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+from rest_framework.settings import ISO_8601, api_settings
+
+
+class RenderedJSON(bytes):
+    """A response body that is already JSON; FastJSONRenderer passes it through."""
+
+
+class FastJSONRenderer(JSONRenderer):
+    """JSONRenderer that passes pre-encoded bodies from FastListMixin through untouched."""
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if isinstance(data, RenderedJSON):
+            return bytes(data)
+        return super().render(data, accepted_media_type, renderer_context)
+
+
+# -----------------------------------------------------------------------------
+# Value converters
+# -----------------------------------------------------------------------------
+def _json_float(value):
+    # same as json.dumps(allow_nan=False), which JSONRenderer uses
+    if math.isnan(value) or math.isinf(value):
+        raise ValueError("Out of range float values are not JSON compliant")
+    return float.__repr__(value)
+
+
+def _iso_datetime(value, tz):
+    # DateTimeField.enforce_timezone + ISO 8601 output
+    if value.tzinfo is not None and value.tzinfo is not tz:
+        value = value.astimezone(tz)
+    value = value.isoformat()
+    if value.endswith("+00:00"):
+        value = value[:-6] + "Z"
+    return value
+
+
+def _json_converter(field):
+    """Function turning a raw column value into JSON text, mirroring field.to_representation."""
+    if isinstance(field, serializers.PrimaryKeyRelatedField):
+        return lambda v: "null" if v is None else (int.__repr__(v) if type(v) is int else json.dumps(v))
+    if isinstance(field, serializers.BooleanField):
+        return lambda v: "null" if v is None else ("true" if v else "false")
+    if isinstance(field, serializers.IntegerField):
+        return lambda v: "null" if v is None else int.__repr__(int(v))
+    if isinstance(field, serializers.FloatField):
+        return lambda v: "null" if v is None else _json_float(float(v))
+    if isinstance(field, serializers.DateTimeField) and getattr(field, "format", api_settings.DATETIME_FORMAT) == ISO_8601:
+        # takes the active timezone, looked up once per response
+        convert = lambda v, tz: "null" if v is None else '"' + _iso_datetime(v, tz) + '"'
+        convert.needs_tz = True
+        return convert
+    if isinstance(field, serializers.ChoiceField) and all(isinstance(k, str) for k in field.choices):
+        return lambda v: "null" if v is None else encode_basestring(v)
+    if type(field) is serializers.CharField:
+        return lambda v: "null" if v is None else encode_basestring(str(v))
+
+    encoder = JSONRenderer.encoder_class
+    return lambda v: "null" if v is None else json.dumps(
+        field.to_representation(v), cls=encoder, ensure_ascii=False,
+        allow_nan=False, separators=(",", ":"),
+    )
+
+
+def _column_kind(field):
+    """Native type of a column as seen by the binary renderers."""
+    if isinstance(field, serializers.BooleanField):
+        return "bool"
+    if isinstance(field, (serializers.PrimaryKeyRelatedField, serializers.IntegerField)):
+        return "int"
+    if isinstance(field, serializers.FloatField):
+        return "float"
+    if isinstance(field, serializers.DateTimeField):
+        return "datetime"
+    if isinstance(field, serializers.ChoiceField) and all(isinstance(k, str) for k in field.choices):
+        return "str"
+    if type(field) is serializers.CharField:
+        return "str"
+    return "other"
+
+
+class Columns:
+    """
+    Column-oriented list payload.
+
+    - names:   output keys, in serializer order
+    - kinds:   "int" | "float" | "bool" | "str" | "datetime" | "other" per column
+    - columns: one list of values per column (None for NULL, aware datetimes)
+    """
+
+    def __init__(self, names, kinds, columns):
+        self.names = names
+        self.kinds = kinds
+        self.columns = columns
+
+    def __len__(self):
+        return len(self.columns[0]) if self.columns else 0
+
+    def rows(self):
+        return zip(*self.columns)
+
+
+# -----------------------------------------------------------------------------
+# Row encoder
+# -----------------------------------------------------------------------------
+class RowEncoder:
+    """
+    Compiled encoder for values_list() rows of one serializer.
+
+    - columns: the values_list() lookups to query (FKs as their *_id column)
+    - names:   the output keys, in serializer order
+    """
+
+    def __init__(self, serializer_class, field_names=None):
+        serializer = serializer_class()
+        model = serializer.Meta.model
+        fields = serializer.fields
+
+        if field_names is None:
+            field_names = [name for name, field in fields.items() if not field.write_only]
+
+        self.names = []
+        self.columns = []
+        self.fields = []
+        for name, field in fields.items():
+            if name not in field_names or field.write_only:
+                continue
+            self.names.append(name)
+            self.columns.append(model._meta.get_field(field.source).attname)
+            self.fields.append(field)
+
+        self.kinds = [_column_kind(field) for field in self.fields]
+        self._encode_json_row = self._compile_json()
+
+    def _compile_json(self):
+        template = "{" + ",".join(
+            encode_basestring(name).replace("%", "%%") + ":%s" for name in self.names
+        ) + "}"
+        namespace = {f"c{i}": _json_converter(field) for i, field in enumerate(self.fields)}
+        values = ", ".join(
+            f"c{i}(r[{i}], tz)" if getattr(namespace[f"c{i}"], "needs_tz", False) else f"c{i}(r[{i}])"
+            for i in range(len(self.fields))
+        )
+        source = (
+            f"def encode_row(r, tz, {', '.join(f'c{i}=c{i}' for i in range(len(self.fields)))}):\n"
+            f"    return {template!r} % ({values},)\n"
+        )
+        exec(source, namespace)
+        return namespace["encode_row"]
+
+    def encode_json(self, rows):
+        """JSON array text for an iterable of values_list() rows."""
+        encode_row = self._encode_json_row
+        tz = timezone.get_current_timezone()
+        body = "[" + ",".join([encode_row(row, tz) for row in rows]) + "]"
+        # JSONRenderer escapes these two for JavaScript compatibility
+        if "\u2028" in body or "\u2029" in body:
+            body = body.replace("\u2028", "\\u2028").replace("\u2029", "\\u2029")
+        return RenderedJSON(body.encode("utf-8"))
+
+    def encode_columns(self, rows):
+        """Columns of native values for an iterable of values_list() rows."""
+        columns = [list(column) for column in zip(*rows)] or [[] for _ in self.names]
+        for i, (kind, field) in enumerate(zip(self.kinds, self.fields)):
+            if kind == "other":
+                columns[i] = [None if v is None else field.to_representation(v) for v in columns[i]]
+        return Columns(self.names, self.kinds, columns)
+
+
+_encoder_cache = {}
+
+
+def get_row_encoder(serializer_class, field_names=None):
+    key = (serializer_class, tuple(field_names) if field_names else None)
+    encoder = _encoder_cache.get(key)
+    if encoder is None:
+        encoder = _encoder_cache[key] = RowEncoder(serializer_class, field_names)
+    return encoder
+
+
+class FastListMixin:
+    """
+    ViewSet mixin: list() through values_list + RowEncoder when the response
+    is JSON or one of the columnar binary formats.
+
+    Other renderers (browsable API) and paginated lists use the regular
+    ModelSerializer path.
+    """
+
+    def get_list_fields(self):
+        raw = self.request.query_params.get("fields")
+        if not raw:
+            return None
+
+        requested = [name.strip() for name in raw.split(",") if name.strip()]
+        available = self.get_serializer_class()().fields
+        unknown = [name for name in requested if name not in available]
+        if unknown:
+            raise ValidationError({"fields": f"Unknown field(s): {', '.join(unknown)}"})
+        return requested
+
+    def use_fast_list(self, request):
+        if self.paginator is not None:
+            return False
+        if getattr(request.accepted_renderer, "columnar", False):
+            return True
+        if not isinstance(request.accepted_renderer, FastJSONRenderer):
+            return False
+        # RowEncoder reproduces the default compact, unicode, strict JSONRenderer output only
+        if "indent" in (request.accepted_media_type or ""):
+            return False
+        return api_settings.COMPACT_JSON and api_settings.UNICODE_JSON and api_settings.STRICT_JSON
+
+    def list(self, request, *args, **kwargs):
+        if not self.use_fast_list(request):
+            return super().list(request, *args, **kwargs)
+
+        encoder = get_row_encoder(self.get_serializer_class(), self.get_list_fields())
+        queryset = self.filter_queryset(self.get_queryset())
+        rows = queryset.values_list(*encoder.columns)
+        return self.fast_list_response(encoder, rows)
+
+    def fast_list_response(self, encoder, rows):
+        """rows: a values_list() queryset, or any iterable of its rows."""
+        if isinstance(rows, QuerySet):
+            rows = rows.iterator(chunk_size=2000)
+        if getattr(self.request.accepted_renderer, "columnar", False):
+            return Response(encoder.encode_columns(rows))
+        return Response(encoder.encode_json(rows))
@@ -0,0 +1,120 @@
+"""
+String-valued model fields stored as small integer codes.
+
+Python code, querysets, filters and serializers see the string values;
+the column and its indexes hold a 2-byte integer.
+
+SmallCodeField
+    Fixed mapping given in the field definition (SensorReading.sensor_type).
+
+LookupCodeField
+    Codes are ids of a lookup table with a unique "name" column
+    (ReadingSource for SensorReading.source). Unknown names get a new row
+    when saved; filtering on an unknown name matches nothing.
+"""
+import threading
+
+from django.apps import apps
+from django.core import exceptions
+from django.db import models
+
+# code used in lookups for names that have no code: matches no row
+NO_CODE = 0
+
+
+class SmallCodeField(models.Field):
+    description = "String stored as a small integer code"
+    empty_strings_allowed = False
+
+    def __init__(self, *args, codes=None, **kwargs):
+        self.codes = dict(codes or {})
+        self.names = {code: name for name, code in self.codes.items()}
+        super().__init__(*args, **kwargs)
+
+    def deconstruct(self):
+        name, path, args, kwargs = super().deconstruct()
+        kwargs["codes"] = self.codes
+        return name, path, args, kwargs
+
+    def get_internal_type(self):
+        return "PositiveSmallIntegerField"
+
+    # --- name <-> code -------------------------------------------------------
+    def code_for(self, name, create=False):
+        """Code of name; create=True (saving) rejects names without a code."""
+        code = self.codes.get(name)
+        if code is None and create:
+            raise exceptions.ValidationError(f"Unknown {self.name}: {name!r}")
+        return NO_CODE if code is None else code
+
+    def name_for(self, code):
+        return self.names.get(code)
+
+    # --- conversions ---------------------------------------------------------
+    def from_db_value(self, value, expression, connection):
+        return None if value is None else self.name_for(value)
+
+    def to_python(self, value):
+        if isinstance(value, int):
+            return self.name_for(value)
+        return value
+
+    def get_prep_value(self, value):
+        value = super().get_prep_value(value)
+        if value is None or isinstance(value, int):
+            return value
+        return self.code_for(str(value))
+
+    def get_db_prep_save(self, value, connection):
+        if isinstance(value, str):
+            return self.code_for(value, create=True)
+        return super().get_db_prep_save(value, connection)
+
+
+class LookupCodeField(SmallCodeField):
+    description = "String stored as the id of a lookup table row"
+
+    def __init__(self, *args, lookup=None, **kwargs):
+        self.lookup = lookup
+        self._lock = threading.Lock()
+        super().__init__(*args, **kwargs)
+
+    def deconstruct(self):
+        name, path, args, kwargs = super().deconstruct()
+        kwargs.pop("codes", None)
+        kwargs["lookup"] = self.lookup
+        return name, path, args, kwargs
+
+    def lookup_model(self):
+        return apps.get_model(self.lookup)
+
+    def _remember(self, name, code):
+        with self._lock:
+            self.codes[name] = code
+            self.names[code] = name
+
+    def code_for(self, name, create=False):
+        code = self.codes.get(name)
+        if code is not None:
+            return code
+
+        model = self.lookup_model()
+        if create:
+            row, _ = model.objects.get_or_create(name=name)
+        else:
+            row = model.objects.filter(name=name).first()
+            if row is None:
+                return NO_CODE
+        self._remember(row.name, row.pk)
+        return row.pk
+
+    def name_for(self, code):
+        name = self.names.get(code)
+        if name is None:
+            # added by another process since we last looked
+            row = self.lookup_model().objects.filter(pk=code).first()
+            if row is None:
+                return None
+            name = row.name
+            self._remember(name, code)
+        return name
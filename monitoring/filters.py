@@ -0,0 +1,72 @@
+"""
+Query-parameter parsing helpers shared by the API views.
+
+Invalid values raise a DRF ValidationError, which the views turn into a
+400 response naming the offending parameter.
+"""
+from datetime import datetime, time
+
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from rest_framework.exceptions import ValidationError
+
+
+def parse_list(params, name, cast=str, choices=None):
+    """
+    Values of a list parameter, accepting both ?plot=1,2 and ?plot=1&plot=2.
+    Returns an empty list when the parameter is absent.
+    """
+    values = []
+    for raw in params.getlist(name):
+        values.extend(v.strip() for v in raw.split(",") if v.strip())
+
+    try:
+        values = [cast(v) for v in values]
+    except (TypeError, ValueError):
+        raise ValidationError({name: f"Invalid value: {','.join(map(str, values))}"})
+
+    if choices is not None:
+        invalid = [v for v in values if v not in choices]
+        if invalid:
+            raise ValidationError({name: f"Unknown value(s): {', '.join(map(str, invalid))}"})
+
+    return values
+
+
+def parse_datetime_param(params, name, default=None):
+    """ISO datetime or date (midnight) parameter, always returned timezone-aware."""
+    raw = params.get(name)
+    if not raw:
+        return default
+
+    try:
+        # well formed but out of range (2024-13-01) raises ValueError
+        value = parse_datetime(raw)
+        if value is None:
+            day = parse_date(raw)
+            if day is None:
+                raise ValueError(raw)
+            value = datetime.combine(day, time.min)
+    except ValueError:
+        raise ValidationError({name: f"Invalid datetime: {raw}"})
+
+    if timezone.is_naive(value):
+        value = timezone.make_aware(value)
+    return value
+
+
+def parse_float_param(params, name, default=None):
+    raw = params.get(name)
+    if raw in (None, ""):
+        return default
+    try:
+        return float(raw)
+    except ValueError:
+        raise ValidationError({name: f"Invalid number: {raw}"})
+
+
+def parse_choice(params, name, choices, default):
+    value = params.get(name) or default
+    if value not in choices:
+        raise ValidationError({name: f"Must be one of: {', '.join(choices)}"})
+    return value
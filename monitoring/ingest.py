@@ -0,0 +1,315 @@
+"""
+Sensor reading ingestion helpers.
+
+Everything that stores new SensorReading rows goes through here so the
+derived data (latest value per plot/sensor, ring buffers of recent vectors
+in monitoring/ringbuffer.py) stays in sync.
+
+Retried uploads are deduplicated on SensorReading.idempotency_key: either
+the client's own key, or natural_key(device, plot, sensor_type,
+device_timestamp) when the device reports its measurement time.
+
+Write-behind mode (settings.INGEST_WRITE_BEHIND["ENABLED"])
+    POSTs are answered 202 once the readings are in an in-process buffer;
+    a background flusher commits them with insert_readings() every
+    BATCH_SIZE readings or FLUSH_SECONDS, whichever comes first.
+
+    Durability: readings still in the buffer (at most MAX_QUEUE, normally
+    under FLUSH_SECONDS worth) are lost if the process is killed. A normal
+    shutdown (SIGTERM/SIGINT handled by the server, interpreter exit)
+    flushes the buffer first. Buffered readings show up in the API and in
+    detection after their flush.
+"""
+import atexit
+import hashlib
+import logging
+import queue
+import threading
+import time
+from datetime import timezone as dt_timezone
+from functools import partial
+
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+
+from . import metrics, ringbuffer
+from .models import LatestReading, SensorReading
+
+logger = logging.getLogger(__name__)
+
+
+def natural_key(device, plot_id, sensor_type, device_timestamp):
+    """Idempotency key for a reading identified by who measured what, where and when."""
+    ts = device_timestamp.astimezone(dt_timezone.utc).isoformat()
+    raw = f"{device}|{plot_id}|{sensor_type}|{ts}"
+    return "nk:" + hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+def assign_idempotency_key(data, device):
+    """Fill data["idempotency_key"] from the natural key when the client sent none."""
+    if not data.get("idempotency_key") and data.get("device_timestamp"):
+        plot_id = data["plot"].pk if "plot" in data else data["plot_id"]
+        data["idempotency_key"] = natural_key(
+            device, plot_id, data["sensor_type"], data["device_timestamp"]
+        )
+    return data
+
+
+def insert_readings(readings):
+    """
+    Store a batch of unsaved SensorReading objects with one existence query
+    and one INSERT ... ON CONFLICT DO NOTHING, skipping readings whose
+    idempotency key is already stored or repeated in the batch.
+
+    Returns the readings that were inserted; a key stored concurrently between
+    the check and the insert is ignored by the database and not returned.
+    Their pk is not set on backends that cannot return ids from a
+    conflict-ignoring insert (SQLite).
+    """
+    keys = {r.idempotency_key for r in readings if r.idempotency_key}
+    stored = set()
+    if keys:
+        stored = set(
+            SensorReading.objects
+            .filter(idempotency_key__in=keys)
+            .values_list("idempotency_key", flat=True)
+        )
+
+    fresh = []
+    for reading in readings:
+        key = reading.idempotency_key
+        if key:
+            if key in stored:
+                continue
+            stored.add(key)
+        fresh.append(reading)
+
+    with transaction.atomic():
+        # a concurrent upload of the same key is ignored by the unique index
+        SensorReading.objects.bulk_create(fresh, ignore_conflicts=True)
+        fresh = _inserted(fresh)
+        update_latest_readings(fresh)
+    return fresh
+
+
+def _inserted(readings):
+    # keyed readings are ours when the stored row has our server timestamp
+    # (microseconds): otherwise a concurrent upload won the unique index
+    keys = [r.idempotency_key for r in readings if r.idempotency_key]
+    if not keys:
+        return readings
+    stored = dict(
+        SensorReading.objects
+        .filter(idempotency_key__in=keys)
+        .values_list("idempotency_key", "timestamp")
+    )
+    return [r for r in readings if not r.idempotency_key or stored.get(r.idempotency_key) == r.timestamp]
+
+
+def update_latest_readings(readings):
+    """
+    Upsert the latest-value row for every (plot, sensor_type) in `readings`
+    with one INSERT ... ON CONFLICT DO UPDATE statement, and add the readings
+    to the per-plot ring buffers once the transaction commits.
+
+    The update only applies when the reading is not older than the stored
+    one: a write-behind flush or another worker may commit older readings
+    after newer ones.
+    """
+    latest = {}
+    for reading in readings:
+        key = (reading.plot_id, reading.sensor_type)
+        current = latest.get(key)
+        # a statement may only touch each conflict key once
+        if current is None or reading.timestamp >= current.timestamp:
+            latest[key] = LatestReading(
+                plot_id=reading.plot_id,
+                sensor_type=reading.sensor_type,
+                value=reading.value,
+                timestamp=reading.timestamp,
+                reading_id=reading.pk,
+            )
+
+    if not latest:
+        return
+
+    _upsert_latest(list(latest.values()))
+    transaction.on_commit(partial(ringbuffer.record, readings))
+
+
+def _upsert_latest(rows, batch_size=100):
+    # bulk_create(update_conflicts=True) cannot add the WHERE clause
+    # (SQLite >= 3.24 and PostgreSQL syntax)
+    qn = connection.ops.quote_name
+    table = qn(LatestReading._meta.db_table)
+    columns = ["plot_id", "sensor_type", "value", "timestamp", "reading_id"]
+    updates = ", ".join(f"{qn(c)} = excluded.{qn(c)}" for c in columns[2:])
+
+    with connection.cursor() as cursor:
+        for i in range(0, len(rows), batch_size):
+            batch = rows[i:i + batch_size]
+            cursor.execute(
+                f"INSERT INTO {table} ({', '.join(qn(c) for c in columns)}) "
+                f"VALUES {', '.join(['(%s, %s, %s, %s, %s)'] * len(batch))} "
+                f"ON CONFLICT ({qn('plot_id')}, {qn('sensor_type')}) DO UPDATE SET {updates} "
+                f"WHERE excluded.{qn('timestamp')} >= {table}.{qn('timestamp')}",
+                [
+                    param
+                    for row in batch
+                    for param in (
+                        row.plot_id, row.sensor_type, row.value,
+                        connection.ops.adapt_datetimefield_value(row.timestamp), row.reading_id,
+                    )
+                ],
+            )
+
+
+# -----------------------------------------------------------------------------
+# Write-behind buffer
+# -----------------------------------------------------------------------------
+_buffer = queue.Queue()
+_flusher = None
+_flusher_lock = threading.Lock()
+_stopping = threading.Event()
+# put on the buffer by drain() to wake the flusher
+_STOP = object()
+
+metrics.register_gauge("ingest.buffer_depth", _buffer.qsize)
+
+
+def _config(name, default):
+    return getattr(settings, "INGEST_WRITE_BEHIND", {}).get(name, default)
+
+
+def write_behind_enabled():
+    return _config("ENABLED", False)
+
+
+def buffer_readings(readings):
+    """
+    Queue unsaved readings for the background flusher.
+
+    Returns False, queueing nothing, when the buffer would exceed MAX_QUEUE
+    or the process is shutting down.
+    """
+    if _stopping.is_set() or _buffer.qsize() + len(readings) > _config("MAX_QUEUE", 10000):
+        return False
+
+    for reading in readings:
+        _buffer.put(reading)
+    metrics.incr("ingest.buffered", len(readings))
+    _ensure_flusher()
+    return True
+
+
+def _ensure_flusher():
+    global _flusher
+
+    if _flusher is not None and _flusher.is_alive():
+        return
+
+    with _flusher_lock:
+        if _flusher is not None and _flusher.is_alive():
+            return
+        _flusher = threading.Thread(target=_run_flusher, name="ingest-flusher", daemon=True)
+        _flusher.start()
+
+
+def _next_batch(batch_size, flush_seconds):
+    """
+    Block for the first reading, then collect up to batch_size until
+    flush_seconds after it. Stops early at the shutdown marker.
+    """
+    first = _buffer.get()
+    if first is _STOP:
+        return []
+
+    batch = [first]
+    deadline = time.monotonic() + flush_seconds
+    while len(batch) < batch_size:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        try:
+            reading = _buffer.get(timeout=remaining)
+        except queue.Empty:
+            break
+        if reading is _STOP:
+            break
+        batch.append(reading)
+    return batch
+
+
+def _run_flusher():
+    batch_size = _config("BATCH_SIZE", 500)
+    flush_seconds = _config("FLUSH_SECONDS", 0.5)
+
+    while not _stopping.is_set():
+        batch = _next_batch(batch_size, flush_seconds)
+        if not batch:
+            continue
+        try:
+            flush_batch(batch)
+        finally:
+            close_old_connections()
+
+
+def flush_batch(readings):
+    """
+    Commit one buffered batch, retrying RETRIES times (e.g. on "database is
+    locked"). Returns the number of readings inserted.
+    """
+    retries = _config("RETRIES", 3)
+
+    for attempt in range(retries + 1):
+        started = time.perf_counter()
+        try:
+            created = insert_readings(readings)
+        except Exception:
+            if attempt < retries:
+                close_old_connections()
+                time.sleep(0.1 * 2 ** attempt)
+                continue
+            metrics.incr("ingest.dropped", len(readings))
+            logger.exception("Dropped write-behind batch of %d readings", len(readings))
+            return 0
+
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        metrics.incr("ingest.flushes")
+        metrics.incr("ingest.accepted", len(created))
+        metrics.incr("ingest.duplicates", len(readings) - len(created))
+        metrics.incr("ingest.flush_ms_total", elapsed_ms)
+        metrics.set_gauge("ingest.last_batch_size", len(readings))
+        metrics.set_gauge("ingest.last_flush_ms", round(elapsed_ms, 2))
+        return len(created)
+
+
+def drain(timeout=30):
+    """
+    Stop the flusher after its current batch and flush everything still
+    buffered in the calling thread.
+
+    Runs on interpreter shutdown so accepted readings are not lost.
+    """
+    _stopping.set()
+    if _flusher is not None and _flusher.is_alive():
+        _buffer.put(_STOP)
+        _flusher.join(timeout)
+
+    pending = []
+    while True:
+        try:
+            reading = _buffer.get_nowait()
+        except queue.Empty:
+            break
+        if reading is not _STOP:
+            pending.append(reading)
+
+    batch_size = _config("BATCH_SIZE", 500)
+    total = 0
+    for i in range(0, len(pending), batch_size):
+        total += flush_batch(pending[i:i + batch_size])
+    return total
+
+
+atexit.register(drain)
@@ -0,0 +1,126 @@
+"""
+Roll raw sensor readings past their retention age into hourly/daily rollups
+and delete them (monitoring/retention.py).
+
+Usage:
+    python manage.py apply_retention --dry-run
+    python manage.py apply_retention
+    python manage.py apply_retention --loop --interval 600
+    python manage.py apply_retention --plot 1 --chunk-size 500
+
+Policies are RetentionPolicy rows (admin), per farm and/or sensor type,
+with settings.READING_RETENTION as the default.
+"""
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from monitoring.retention import _config, apply_retention, retention_report
+
+
+def _size(n):
+    if n is None:
+        return "n/a"
+    for unit in ("B", "KB", "MB", "GB"):
+        if n < 1024 or unit == "GB":
+            return f"{n:.0f} {unit}" if unit == "B" else f"{n:.1f} {unit}"
+        n /= 1024
+
+
+class Command(BaseCommand):
+    help = "Roll up and delete raw sensor readings older than their retention policy"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--plot',
+            type=int,
+            action='append',
+            help='Only this plot ID (repeatable)'
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Report what would be rolled up and deleted, change nothing'
+        )
+        parser.add_argument(
+            '--loop',
+            action='store_true',
+            help='Keep running, once every --interval seconds'
+        )
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=_config("INTERVAL_SECONDS"),
+            help='Seconds between runs with --loop'
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=_config("CHUNK_SIZE"),
+            help='Raw readings deleted per transaction'
+        )
+        parser.add_argument(
+            '--pause',
+            type=float,
+            default=_config("PAUSE_SECONDS"),
+            help='Seconds to pause between chunks, for ingest writers'
+        )
+
+    def handle(self, *args, **options):
+        if options['dry_run']:
+            self.report(options['plot'])
+            return
+
+        while True:
+            self.run_once(options)
+            if not options['loop']:
+                break
+            close_old_connections()
+            try:
+                time.sleep(options['interval'])
+            except KeyboardInterrupt:
+                break
+
+    def run_once(self, options):
+        t0 = time.perf_counter()
+        results = apply_retention(
+            plot_ids=options['plot'], chunk_size=options['chunk_size'], pause=options['pause']
+        )
+        readings = sum(r[3] for r in results)
+        rollups = sum(r[4] for r in results)
+
+        for plot_id, sensor_type, policy, deleted, expired in results:
+            if deleted or expired:
+                self.stdout.write(
+                    f"  plot {plot_id} {sensor_type}: {deleted} readings -> {policy.rollup} rollups"
+                    + (f", {expired} old rollups deleted" if expired else "")
+                )
+        self.stdout.write(self.style.SUCCESS(
+            f"Retention: {readings} readings rolled up, {rollups} rollups expired "
+            f"in {time.perf_counter() - t0:.1f}s"
+        ))
+
+    def report(self, plot_ids):
+        rows = retention_report(plot_ids)
+
+        self.stdout.write(
+            f"{'plot':>5}  {'sensor':<12}{'raw days':>9}  {'rollup':<7}{'cutoff':<18}"
+            f"{'readings':>10}{'rollups':>9}{'frees':>11}"
+        )
+        for row in rows:
+            policy = row["policy"]
+            self.stdout.write(
+                f"{row['plot']:>5}  {row['sensor_type']:<12}{policy.raw_days:>9}  {policy.rollup:<7}"
+                f"{row['cutoff']:%Y-%m-%d %H:%M}  {row['readings']:>10}{row['rollups']:>9}"
+                f"{_size(row['bytes']):>11}"
+            )
+
+        known = [row["bytes"] for row in rows if row["bytes"] is not None]
+        archived = sum(row["archived"] for row in rows)
+        self.stdout.write(self.style.SUCCESS(
+            f"Dry run: {sum(r['readings'] for r in rows)} readings would become "
+            f"{sum(r['rollups'] for r in rows)} rollups"
+            + (f", freeing about {_size(sum(known))}" if known else "")
+            + (f"; {archived} archived readings would be rolled up too" if archived else "")
+        ))
@@ -0,0 +1,60 @@
+"""
+Move whole days of old raw readings into compressed ReadingArchive rows
+(monitoring/archive.py). The export and stats endpoints keep returning them.
+
+Usage:
+    python manage.py archive_readings --dry-run
+    python manage.py archive_readings
+    python manage.py archive_readings --days 7 --plot 1
+
+Each (plot, sensor type, day) is archived and deleted in its own transaction.
+"""
+import time
+
+from django.core.management.base import BaseCommand
+
+from monitoring.archive import _config, archive_cutoff, archive_day, pending_days
+
+
+class Command(BaseCommand):
+    help = "Pack old sensor readings into compressed per-day archives"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days',
+            type=int,
+            default=_config("AFTER_DAYS"),
+            help='Archive whole days older than this many days'
+        )
+        parser.add_argument(
+            '--plot',
+            type=int,
+            action='append',
+            help='Only this plot ID (repeatable)'
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='List the days that would be archived, change nothing'
+        )
+
+    def handle(self, *args, **options):
+        cutoff = archive_cutoff(options['days'])
+        days = pending_days(cutoff, options['plot'])
+
+        if options['dry_run']:
+            for plot_id, sensor_type, day, readings in days:
+                self.stdout.write(f"  plot {plot_id} {sensor_type} {day}: {readings} readings")
+            self.stdout.write(self.style.SUCCESS(
+                f"Dry run: {sum(d[3] for d in days)} readings in {len(days)} plot-days before {cutoff:%Y-%m-%d}"
+            ))
+            return
+
+        t0 = time.perf_counter()
+        archived = 0
+        for plot_id, sensor_type, day, _ in days:
+            archived += archive_day(plot_id, sensor_type, day)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Archived {archived} readings into {len(days)} plot-days in {time.perf_counter() - t0:.1f}s"
+        ))
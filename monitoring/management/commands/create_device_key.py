@@ -0,0 +1,38 @@
+"""
+Create an API key for a field device or gateway.
+
+Usage:
+    python manage.py create_device_key "Gateway north" --plot 1 --plot 2
+
+The full key is printed once; only its prefix and hash are stored.
+Devices send it as:  Authorization: Api-Key <key>
+"""
+from django.core.management.base import BaseCommand, CommandError
+
+from monitoring.authentication import create_device_key
+from monitoring.models import FieldPlot
+
+
+class Command(BaseCommand):
+    help = "Create a plot-scoped API key for sensor ingestion"
+
+    def add_arguments(self, parser):
+        parser.add_argument('name', help='Device or gateway name')
+        parser.add_argument(
+            '--plot',
+            type=int,
+            action='append',
+            required=True,
+            help='Plot ID the device may post readings for (repeatable)'
+        )
+
+    def handle(self, *args, **options):
+        plot_ids = sorted(set(options['plot']))
+        missing = set(plot_ids) - set(FieldPlot.objects.filter(id__in=plot_ids).values_list("id", flat=True))
+        if missing:
+            raise CommandError(f"Unknown plot(s): {', '.join(map(str, sorted(missing)))}")
+
+        key, raw_key = create_device_key(options['name'], plot_ids)
+
+        self.stdout.write(self.style.SUCCESS(f"Created key {key.prefix} for plots {plot_ids}"))
+        self.stdout.write(raw_key)
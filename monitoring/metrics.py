@@ -0,0 +1,44 @@
+"""
+In-process metrics registry.
+
+Background workers and the ingestion path record counters and gauges here;
+GET /api/metrics/ returns a snapshot of everything registered in the
+current worker process.
+"""
+import threading
+
+
+_lock = threading.Lock()
+_counters = {}
+_gauges = {}
+
+
+def incr(name, amount=1):
+    """Increment a counter (created on first use)."""
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + amount
+
+
+def set_gauge(name, value):
+    """Set a gauge to a fixed value."""
+    with _lock:
+        _gauges[name] = value
+
+
+def register_gauge(name, func):
+    """Register a gauge whose value is computed by calling func() at snapshot time."""
+    with _lock:
+        _gauges[name] = func
+
+
+def snapshot():
+    """Return a plain dict of every counter and gauge."""
+    with _lock:
+        counters = dict(_counters)
+        gauges = dict(_gauges)
+
+    values = {}
+    for name, value in gauges.items():
+        values[name] = value() if callable(value) else value
+
+    return {"counters": counters, "gauges": values}
@@ -0,0 +1,133 @@
+"""
+Response compression for the bulk API endpoints.
+
+Only responses under RESPONSE_COMPRESSION_PATHS whose content type is in
+RESPONSE_COMPRESSION_TYPES are compressed: reading and anomaly lists,
+stats and exports, which carry no secrets. HTML (admin, the browsable API,
+forms with a csrfmiddlewaretoken) is never compressed here.
+
+gzip goes through Django's GZipMiddleware, including its random-length
+padding against BREACH. zstd is used instead when the client prefers it
+and the compression.zstd module (Python 3.14+) or the zstandard package is
+available. Bodies below RESPONSE_COMPRESSION_MIN_BYTES, already-encoded
+bodies and responses marked Cache-Control: no-transform pass through.
+"""
+from django.conf import settings
+from django.middleware.gzip import GZipMiddleware
+from django.utils.cache import patch_vary_headers
+
+from . import metrics
+
+try:
+    from compression import zstd as _zstd
+
+    def _zstd_compress(data, level):
+        return _zstd.compress(data, level=level)
+except ImportError:
+    try:
+        import zstandard as _zstd
+
+        def _zstd_compress(data, level):
+            return _zstd.ZstdCompressor(level=level).compress(data)
+    except ImportError:  # optional dependency
+        _zstd_compress = None
+
+DEFAULT_PATHS = ["/api/sensor-readings/", "/api/anomalies/"]
+DEFAULT_TYPES = [
+    "application/json",
+    "application/msgpack",
+    "application/vnd.apache.arrow.stream",
+    "application/x-npz",
+]
+
+
+def _accepted_encodings(header):
+    """{coding: q} from an Accept-Encoding header."""
+    accepted = {}
+    for part in header.split(","):
+        coding, _, params = part.strip().partition(";")
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        q = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key.strip() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        accepted[coding] = q
+    return accepted
+
+
+def choose_encoding(header):
+    accepted = _accepted_encodings(header or "")
+    wildcard = accepted.get("*", 0.0)
+
+    candidates = ["zstd", "gzip"] if _zstd_compress is not None else ["gzip"]
+    best, best_q = None, 0.0
+    for coding in candidates:
+        q = accepted.get(coding, wildcard)
+        if q > best_q:
+            best, best_q = coding, q
+    return best
+
+
+def _no_transform(response):
+    directives = response.get("Cache-Control", "").split(",")
+    return any(d.split("=")[0].strip().lower() == "no-transform" for d in directives)
+
+
+class CompressionMiddleware(GZipMiddleware):
+    def __init__(self, get_response):
+        super().__init__(get_response)
+        self.min_bytes = getattr(settings, "RESPONSE_COMPRESSION_MIN_BYTES", 1024)
+        self.zstd_level = getattr(settings, "RESPONSE_COMPRESSION_ZSTD_LEVEL", 3)
+        self.paths = tuple(getattr(settings, "RESPONSE_COMPRESSION_PATHS", DEFAULT_PATHS))
+        self.content_types = set(getattr(settings, "RESPONSE_COMPRESSION_TYPES", DEFAULT_TYPES))
+
+    def compressible(self, request, response):
+        if not request.path.startswith(self.paths):
+            return False
+        content_type = response.get("Content-Type", "").partition(";")[0].strip().lower()
+        if content_type not in self.content_types:
+            return False
+        if response.streaming or response.has_header("Content-Encoding") or _no_transform(response):
+            return False
+        return len(response.content) >= self.min_bytes
+
+    def process_response(self, request, response):
+        if not self.compressible(request, response):
+            return response
+
+        patch_vary_headers(response, ("Accept-Encoding",))
+
+        encoding = choose_encoding(request.META.get("HTTP_ACCEPT_ENCODING"))
+        if encoding is None:
+            return response
+
+        original = len(response.content)
+        if encoding == "zstd":
+            self.compress_zstd(response)
+        else:
+            response = super().process_response(request, response)
+
+        if response.get("Content-Encoding") == encoding:
+            metrics.incr(f"http.compressed.{encoding}")
+            metrics.incr("http.compressed.bytes_saved", original - len(response.content))
+        return response
+
+    def compress_zstd(self, response):
+        compressed = _zstd_compress(response.content, self.zstd_level)
+        if len(compressed) >= len(response.content):
+            return
+
+        response.content = compressed
+        response.headers["Content-Length"] = str(len(compressed))
+        response.headers["Content-Encoding"] = "zstd"
+
+        # the compressed body is a different representation
+        etag = response.get("ETag")
+        if etag and etag.startswith('"'):
+            response.headers["ETag"] = "W/" + etag
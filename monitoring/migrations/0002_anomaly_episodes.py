@@ -0,0 +1,45 @@
+# Generated by Django 5.2.18 on 2026-10-19 19:10
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def backfill_episodes(apps, schema_editor):
+    # existing events are single-vector episodes
+    AnomalyEvent = apps.get_model('monitoring', 'AnomalyEvent')
+    AnomalyEvent.objects.filter(started_at__isnull=True).update(
+        started_at=F('timestamp'),
+        ended_at=F('timestamp'),
+        min_score=-F('model_confidence'),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('monitoring', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='anomalyevent',
+            name='ended_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='anomalyevent',
+            name='min_score',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='anomalyevent',
+            name='started_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='anomalyevent',
+            name='vector_count',
+            field=models.PositiveIntegerField(default=1),
+        ),
+        migrations.RunPython(backfill_episodes, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-19 19:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('monitoring', '0002_anomaly_episodes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='sensorreading',
+            index=models.Index(fields=['plot', 'sensor_type', 'timestamp'], name='reading_plot_type_ts_idx'),
+        ),
+    ]
@@ -0,0 +1,65 @@
+# Generated by Django 5.2.18 on 2026-10-19 19:18
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def backfill_latest_readings(apps, schema_editor):
+    SensorReading = apps.get_model('monitoring', 'SensorReading')
+    LatestReading = apps.get_model('monitoring', 'LatestReading')
+
+    keys = SensorReading.objects.values_list('plot_id', 'sensor_type').distinct()
+    latest = []
+    for plot_id, sensor_type in keys:
+        reading = (
+            SensorReading.objects
+            .filter(plot_id=plot_id, sensor_type=sensor_type)
+            .order_by('-timestamp')
+            .first()
+        )
+        latest.append(LatestReading(
+            plot_id=plot_id,
+            sensor_type=sensor_type,
+            value=reading.value,
+            timestamp=reading.timestamp,
+            reading_id=reading.id,
+        ))
+    LatestReading.objects.bulk_create(latest)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('monitoring', '0003_reading_plot_type_ts_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LatestReading',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sensor_type', models.CharField(choices=[('moisture', 'Soil Moisture'), ('temperature', 'Air Temperature'), ('humidity', 'Humidity')], max_length=20)),
+                ('value', models.FloatField()),
+                ('timestamp', models.DateTimeField()),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='anomalyevent',
+            index=models.Index(fields=['plot', '-timestamp'], name='anomaly_plot_ts_idx'),
+        ),
+        migrations.AddField(
+            model_name='latestreading',
+            name='plot',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='latest_readings', to='monitoring.fieldplot'),
+        ),
+        migrations.AddField(
+            model_name='latestreading',
+            name='reading',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='monitoring.sensorreading'),
+        ),
+        migrations.AddConstraint(
+            model_name='latestreading',
+            constraint=models.UniqueConstraint(fields=('plot', 'sensor_type'), name='latest_reading_plot_type_uniq'),
+        ),
+        migrations.RunPython(backfill_latest_readings, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.18 on 2026-10-19 19:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('monitoring', '0004_latest_readings'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='agentrecommendation',
+            name='category',
+            field=models.CharField(blank=True, default='', max_length=50),
+        ),
+        migrations.AddField(
+            model_name='agentrecommendation',
+            name='urgency',
+            field=models.PositiveSmallIntegerField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='agentrecommendation',
+            index=models.Index(fields=['urgency', '-timestamp'], name='rec_urgency_ts_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='agentrecommendation',
+            index=models.Index(fields=['category', '-timestamp'], name='rec_category_ts_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='anomalyevent',
+            index=models.Index(fields=['plot', 'severity', '-timestamp'], name='anomaly_plot_sev_ts_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='anomalyevent',
+            index=models.Index(fields=['severity', '-timestamp'], name='anomaly_sev_ts_idx'),
+        ),
+    ]
@@ -0,0 +1,116 @@
+# SensorReading.sensor_type and .source: strings -> small integer codes
+
+from django.db import migrations, models
+
+import monitoring.fields
+
+SENSOR_TYPE_CHOICES = [('moisture', 'Soil Moisture'), ('temperature', 'Air Temperature'), ('humidity', 'Humidity')]
+SENSOR_TYPE_CODES = {'moisture': 1, 'temperature': 2, 'humidity': 3}
+
+
+def create_sources(apps, schema_editor):
+    SensorReading = apps.get_model('monitoring', 'SensorReading')
+    ReadingSource = apps.get_model('monitoring', 'ReadingSource')
+
+    names = set(SensorReading.objects.values_list('source', flat=True).distinct())
+    names.add('simulator')
+    ReadingSource.objects.bulk_create(
+        [ReadingSource(name=name) for name in sorted(names)], ignore_conflicts=True
+    )
+
+
+def encode_readings(apps, schema_editor):
+    # one UPDATE per distinct value
+    SensorReading = apps.get_model('monitoring', 'SensorReading')
+    ReadingSource = apps.get_model('monitoring', 'ReadingSource')
+
+    for name, code in SENSOR_TYPE_CODES.items():
+        SensorReading.objects.filter(sensor_type=name).update(sensor_type_code=code)
+    for source in ReadingSource.objects.all():
+        SensorReading.objects.filter(source=source.name).update(source_code=source.id)
+
+
+def decode_readings(apps, schema_editor):
+    SensorReading = apps.get_model('monitoring', 'SensorReading')
+    ReadingSource = apps.get_model('monitoring', 'ReadingSource')
+
+    for name, code in SENSOR_TYPE_CODES.items():
+        SensorReading.objects.filter(sensor_type_code=code).update(sensor_type=name)
+    for source in ReadingSource.objects.all():
+        SensorReading.objects.filter(source_code=source.id).update(source=source.name)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('monitoring', '0008_reading_timestamp_default'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReadingSource',
+            fields=[
+                ('id', models.SmallAutoField(primary_key=True, serialize=False)),
+                ('name', models.CharField(max_length=30, unique=True)),
+            ],
+        ),
+        migrations.RunPython(create_sources, migrations.RunPython.noop),
+        migrations.RemoveIndex(
+            model_name='sensorreading',
+            name='reading_plot_type_ts_idx',
+        ),
+        migrations.AddField(
+            model_name='sensorreading',
+            name='sensor_type_code',
+            field=monitoring.fields.SmallCodeField(choices=SENSOR_TYPE_CHOICES, codes=SENSOR_TYPE_CODES, null=True),
+        ),
+        migrations.AddField(
+            model_name='sensorreading',
+            name='source_code',
+            field=monitoring.fields.LookupCodeField(lookup='monitoring.ReadingSource', null=True),
+        ),
+        # nullable first, so the reverse migration can re-add and refill them
+        migrations.AlterField(
+            model_name='sensorreading',
+            name='sensor_type',
+            field=models.CharField(choices=SENSOR_TYPE_CHOICES, max_length=20, null=True),
+        ),
+        migrations.AlterField(
+            model_name='sensorreading',
+            name='source',
+            field=models.CharField(default='simulator', max_length=30, null=True),
+        ),
+        migrations.RunPython(encode_readings, decode_readings),
+        migrations.RemoveField(
+            model_name='sensorreading',
+            name='sensor_type',
+        ),
+        migrations.RemoveField(
+            model_name='sensorreading',
+            name='source',
+        ),
+        migrations.RenameField(
+            model_name='sensorreading',
+            old_name='sensor_type_code',
+            new_name='sensor_type',
+        ),
+        migrations.RenameField(
+            model_name='sensorreading',
+            old_name='source_code',
+            new_name='source',
+        ),
+        migrations.AlterField(
+            model_name='sensorreading',
+            name='sensor_type',
+            field=monitoring.fields.SmallCodeField(choices=SENSOR_TYPE_CHOICES, codes=SENSOR_TYPE_CODES),
+        ),
+        migrations.AlterField(
+            model_name='sensorreading',
+            name='source',
+            field=monitoring.fields.LookupCodeField(default='simulator', lookup='monitoring.ReadingSource'),
+        ),
+        migrations.AddIndex(
+            model_name='sensorreading',
+            index=models.Index(fields=['plot', 'sensor_type', 'timestamp'], name='reading_plot_type_ts_idx'),
+        ),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 5.2.18 on 2026-10-19 19:38
+
+import django.db.models.deletion
+import monitoring.fields
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('monitoring', '0009_compact_reading_codes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReadingRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sensor_type', monitoring.fields.SmallCodeField(choices=[('moisture', 'Soil Moisture'), ('temperature', 'Air Temperature'), ('humidity', 'Humidity')], codes={'humidity': 3, 'moisture': 1, 'temperature': 2})),
+                ('resolution', models.CharField(choices=[('hour', 'Hourly'), ('day', 'Daily')], max_length=5)),
+                ('start', models.DateTimeField()),
+                ('count', models.PositiveIntegerField()),
+                ('min', models.FloatField()),
+                ('max', models.FloatField()),
+                ('sum', models.FloatField()),
+                ('sum_sq', models.FloatField()),
+                ('plot', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='rollups', to='monitoring.fieldplot')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('plot', 'sensor_type', 'resolution', 'start'), name='rollup_plot_type_res_start_uniq')],
+            },
+        ),
+        migrations.CreateModel(
+            name='RetentionPolicy',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sensor_type', monitoring.fields.SmallCodeField(blank=True, choices=[('moisture', 'Soil Moisture'), ('temperature', 'Air Temperature'), ('humidity', 'Humidity')], codes={'humidity': 3, 'moisture': 1, 'temperature': 2}, null=True)),
+                ('raw_days', models.PositiveIntegerField(default=90)),
+                ('rollup', models.CharField(choices=[('hour', 'Hourly'), ('day', 'Daily')], default='hour', max_length=5)),
+                ('rollup_days', models.PositiveIntegerField(blank=True, null=True)),
+                ('farm', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='retention_policies', to='monitoring.farmprofile')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('farm', 'sensor_type'), name='retention_farm_type_uniq')],
+            },
+        ),
+    ]
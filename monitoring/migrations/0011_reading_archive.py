@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-19 19:40
+
+import django.db.models.deletion
+import monitoring.fields
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('monitoring', '0010_reading_retention'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReadingArchive',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sensor_type', monitoring.fields.SmallCodeField(choices=[('moisture', 'Soil Moisture'), ('temperature', 'Air Temperature'), ('humidity', 'Humidity')], codes={'humidity': 3, 'moisture': 1, 'temperature': 2})),
+                ('day', models.DateField()),
+                ('first_timestamp', models.DateTimeField()),
+                ('last_timestamp', models.DateTimeField()),
+                ('count', models.PositiveIntegerField()),
+                ('data', models.BinaryField()),
+                ('plot', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archives', to='monitoring.fieldplot')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['first_timestamp'], name='archive_first_ts_idx')],
+                'constraints': [models.UniqueConstraint(fields=('plot', 'sensor_type', 'day'), name='archive_plot_type_day_uniq')],
+            },
+        ),
+    ]
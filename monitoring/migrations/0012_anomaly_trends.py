@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-19 19:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('monitoring', '0011_reading_archive'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='anomalyevent',
+            name='moisture_trend',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='anomalyevent',
+            name='temp_trend',
+            field=models.FloatField(blank=True, null=True),
+        ),
+    ]
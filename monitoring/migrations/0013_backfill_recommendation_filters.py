@@ -0,0 +1,47 @@
+# AgentRecommendation.urgency/category (0005) for recommendations created before them
+
+from django.db import migrations
+
+
+def backfill_filters(apps, schema_editor):
+    # the same rule generate_recommendation() applies to the anomaly
+    from mlmodule.agribot import AgriBotRules, _parse_sensor_values
+
+    AgentRecommendation = apps.get_model('monitoring', 'AgentRecommendation')
+
+    pending = (
+        AgentRecommendation.objects.filter(urgency__isnull=True)
+        .select_related('anomaly_event')
+        .order_by('id')
+    )
+    batch = []
+    for recommendation in pending.iterator(chunk_size=500):
+        event = recommendation.anomaly_event
+        readings = _parse_sensor_values(event.anomaly_type)
+        rule = AgriBotRules.analyze_with_trends(
+            temperature=readings['temperature'],
+            humidity=readings['humidity'],
+            moisture=readings['moisture'],
+            severity=event.severity,
+            moisture_trend=event.moisture_trend,
+            temp_trend=event.temp_trend,
+        )
+        recommendation.urgency = rule['urgency']
+        recommendation.category = rule['category']
+        batch.append(recommendation)
+        if len(batch) >= 500:
+            AgentRecommendation.objects.bulk_update(batch, ['urgency', 'category'])
+            batch = []
+    if batch:
+        AgentRecommendation.objects.bulk_update(batch, ['urgency', 'category'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('monitoring', '0012_anomaly_trends'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_filters, migrations.RunPython.noop),
+    ]
@@ -1,6 +1,9 @@
 from django.db import models
+from django.utils import timezone
 from django.contrib.auth.models import User
 
+from .fields import LookupCodeField, SmallCodeField
+
 
 class UserProfile(models.Model):
     ROLE_CHOICES = [
@@ -36,18 +39,42 @@ class FieldPlot(models.Model):
         return f"{self.name} - {self.farm.name}"
 
 
+class ReadingSource(models.Model):
+    """Lookup table for SensorReading.source, which stores the row id."""
+    id = models.SmallAutoField(primary_key=True)
+    name = models.CharField(max_length=30, unique=True)
+
+    def __str__(self):
+        return self.name
+
+
 class SensorReading(models.Model):
     SENSOR_TYPES = [
         ("moisture", "Soil Moisture"),
         ("temperature", "Air Temperature"),
         ("humidity", "Humidity"),
     ]
+    # stored codes; never renumber
+    SENSOR_TYPE_CODES = {"moisture": 1, "temperature": 2, "humidity": 3}
 
-    timestamp = models.DateTimeField(auto_now_add=True)
+    # time the server accepted the reading (set before a write-behind flush)
+    timestamp = models.DateTimeField(default=timezone.now)
     plot = models.ForeignKey(FieldPlot, on_delete=models.CASCADE, related_name="readings")
-    sensor_type = models.CharField(max_length=20, choices=SENSOR_TYPES)
+    # both read and written as strings, stored as small integers (monitoring/fields.py)
+    sensor_type = SmallCodeField(choices=SENSOR_TYPES, codes=SENSOR_TYPE_CODES)
     value = models.FloatField()
-    source = models.CharField(max_length=30, default="simulator")
+    source = LookupCodeField(lookup="monitoring.ReadingSource", default="simulator")
+    # time of measurement as reported by the device
+    device_timestamp = models.DateTimeField(null=True, blank=True)
+    # client-supplied, or derived from (device, plot, sensor_type, device_timestamp);
+    # a retried upload with the same key is stored once (monitoring/ingest.py)
+    idempotency_key = models.CharField(max_length=64, null=True, blank=True, unique=True)
+
+    class Meta:
+        indexes = [
+            # per-plot history, stats buckets and detection windows
+            models.Index(fields=["plot", "sensor_type", "timestamp"], name="reading_plot_type_ts_idx"),
+        ]
 
     def __str__(self):
         return f"{self.sensor_type}={self.value} ({self.plot.name})"
@@ -69,10 +96,45 @@ class AnomalyEvent(models.Model):
         SensorReading, null=True, blank=True,
         on_delete=models.SET_NULL, related_name="anomaly_events"
     )
+    # episode: consecutive anomalous vectors of one plot merged into this row
+    started_at = models.DateTimeField(null=True, blank=True)
+    ended_at = models.DateTimeField(null=True, blank=True)
+    min_score = models.FloatField(null=True, blank=True)
+    vector_count = models.PositiveIntegerField(default=1)
+    # plot trends when the episode last grew (mlmodule/trends.py), read by AgriBot
+    moisture_trend = models.FloatField(null=True, blank=True)
+    temp_trend = models.FloatField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["plot", "-timestamp"], name="anomaly_plot_ts_idx"),
+            models.Index(fields=["plot", "severity", "-timestamp"], name="anomaly_plot_sev_ts_idx"),
+            models.Index(fields=["severity", "-timestamp"], name="anomaly_sev_ts_idx"),
+        ]
 
     def __str__(self):
         return f"{self.anomaly_type} ({self.severity})"
 
+class LatestReading(models.Model):
+    """Most recent value per (plot, sensor_type), upserted on every ingest for live dashboards."""
+    plot = models.ForeignKey(FieldPlot, on_delete=models.CASCADE, related_name="latest_readings")
+    sensor_type = models.CharField(max_length=20, choices=SensorReading.SENSOR_TYPES)
+    value = models.FloatField()
+    timestamp = models.DateTimeField()
+    reading = models.ForeignKey(
+        SensorReading, null=True, blank=True,
+        on_delete=models.SET_NULL, related_name="+"
+    )
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["plot", "sensor_type"], name="latest_reading_plot_type_uniq"),
+        ]
+
+    def __str__(self):
+        return f"{self.sensor_type}={self.value} (plot {self.plot_id}, latest)"
+
+
 #recommendation par l'ia
 class AgentRecommendation(models.Model):
     timestamp = models.DateTimeField(auto_now_add=True)
@@ -82,6 +144,133 @@ class AgentRecommendation(models.Model):
     recommended_action = models.TextField()
     explanation_text = models.TextField()
     confidence = models.FloatField()
+    # from the matched AgriBot rule, for filtering
+    urgency = models.PositiveSmallIntegerField(null=True, blank=True)
+    category = models.CharField(max_length=50, blank=True, default="")
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["urgency", "-timestamp"], name="rec_urgency_ts_idx"),
+            models.Index(fields=["category", "-timestamp"], name="rec_category_ts_idx"),
+        ]
 
     def __str__(self):
         return f"Recommendation for {self.anomaly_event_id}"
+
+
+class DeviceAPIKey(models.Model):
+    """
+    API key of a field gateway / sensor device (monitoring/authentication.py).
+
+    The key is "<prefix>.<secret>"; only the prefix and an HMAC-SHA256 of the
+    secret are stored. A key may only post readings for its plots.
+    """
+    name = models.CharField(max_length=100)
+    prefix = models.CharField(max_length=16, unique=True)
+    key_hash = models.CharField(max_length=64)
+    plots = models.ManyToManyField(FieldPlot, related_name="device_keys", blank=True)
+    is_active = models.BooleanField(default=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.name} ({self.prefix})"
+
+
+class RetentionPolicy(models.Model):
+    """
+    How long raw readings are kept before monitoring/retention.py rolls them
+    into ReadingRollup rows and deletes them.
+
+    farm and sensor_type left blank mean "any"; for each plot and sensor type
+    the most specific policy applies (farm + type, farm, type, then
+    settings.READING_RETENTION).
+    """
+    ROLLUP_RESOLUTIONS = [
+        ("hour", "Hourly"),
+        ("day", "Daily"),
+    ]
+
+    farm = models.ForeignKey(
+        FarmProfile, null=True, blank=True,
+        on_delete=models.CASCADE, related_name="retention_policies"
+    )
+    sensor_type = SmallCodeField(
+        choices=SensorReading.SENSOR_TYPES, codes=SensorReading.SENSOR_TYPE_CODES,
+        null=True, blank=True
+    )
+    raw_days = models.PositiveIntegerField(default=90)
+    rollup = models.CharField(max_length=5, choices=ROLLUP_RESOLUTIONS, default="hour")
+    # rollups older than this are deleted too; blank = kept forever
+    rollup_days = models.PositiveIntegerField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["farm", "sensor_type"], name="retention_farm_type_uniq"),
+        ]
+
+    def __str__(self):
+        scope = f"{self.farm or 'all farms'} / {self.sensor_type or 'all sensors'}"
+        return f"{scope}: raw {self.raw_days}d, {self.rollup} rollups"
+
+
+class ReadingRollup(models.Model):
+    """
+    Aggregate of the raw readings of one (plot, sensor_type) in one hour or day,
+    written by the retention job before the raw rows are deleted.
+
+    Sums rather than averages are stored so partial buckets can be merged.
+    """
+    plot = models.ForeignKey(FieldPlot, on_delete=models.CASCADE, related_name="rollups")
+    sensor_type = SmallCodeField(choices=SensorReading.SENSOR_TYPES, codes=SensorReading.SENSOR_TYPE_CODES)
+    resolution = models.CharField(max_length=5, choices=RetentionPolicy.ROLLUP_RESOLUTIONS)
+    start = models.DateTimeField()
+    count = models.PositiveIntegerField()
+    min = models.FloatField()
+    max = models.FloatField()
+    sum = models.FloatField()
+    sum_sq = models.FloatField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["plot", "sensor_type", "resolution", "start"], name="rollup_plot_type_res_start_uniq"
+            ),
+        ]
+
+    @property
+    def avg(self):
+        return self.sum / self.count
+
+    @property
+    def stddev(self):
+        # population standard deviation, like the stats endpoint
+        return max(self.sum_sq / self.count - self.avg ** 2, 0.0) ** 0.5
+
+    def __str__(self):
+        return f"{self.sensor_type} {self.resolution} {self.start:%Y-%m-%d %H:%M} (plot {self.plot_id})"
+
+
+class ReadingArchive(models.Model):
+    """
+    Cold storage: all readings of one plot and sensor type on one (local) day,
+    packed into a compressed blob by monitoring/archive.py. The export and
+    stats endpoints read archived days as if they were SensorReading rows.
+    """
+    plot = models.ForeignKey(FieldPlot, on_delete=models.CASCADE, related_name="archives")
+    sensor_type = SmallCodeField(choices=SensorReading.SENSOR_TYPES, codes=SensorReading.SENSOR_TYPE_CODES)
+    day = models.DateField()
+    first_timestamp = models.DateTimeField()
+    last_timestamp = models.DateTimeField()
+    count = models.PositiveIntegerField()
+    data = models.BinaryField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["plot", "sensor_type", "day"], name="archive_plot_type_day_uniq"),
+        ]
+        indexes = [
+            models.Index(fields=["first_timestamp"], name="archive_first_ts_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.sensor_type} {self.day} (plot {self.plot_id}, {self.count} readings)"
@@ -1,19 +1,63 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
 from rest_framework.permissions import BasePermission, SAFE_METHODS
 
+from .models import UserProfile
+
+# JWT claim carrying the role (see RoleTokenObtainPairSerializer)
+ROLE_CLAIM = "role"
+
+
+def _role_cache_key(user_id):
+    return f"user-role:{user_id}"
+
 
 def get_user_role(user):
     """
     Small helper to safely get the user's role from UserProfile.
     Returns 'admin', 'farmer', 'worker', or None.
+
+    Cached for ROLE_CACHE_SECONDS so session-authenticated requests do not
+    query the profile every time.
     """
     if not user or not user.is_authenticated:
         return None
 
-    profile = getattr(user, "profile", None)
-    if profile is None:
-        return None
+    key = _role_cache_key(user.pk)
+    role = cache.get(key)
+    if role is not None:
+        return role or None
 
-    return getattr(profile, "role", None)
+    profile = UserProfile.objects.filter(user_id=user.pk).only("role").first()
+    role = profile.role if profile is not None else None
+    # "" caches "no profile" too
+    cache.set(key, role or "", getattr(settings, "ROLE_CACHE_SECONDS", 60))
+    return role
+
+
+def get_request_role(request):
+    """
+    Role of the caller: "device" for device API keys, the JWT role claim when
+    present (no database access), otherwise get_user_role() for session/basic
+    auth and older tokens.
+    """
+    token = request.auth
+    role = getattr(token, "role", None)
+    if role:
+        return role
+    if token is not None and hasattr(token, "get"):
+        role = token.get(ROLE_CLAIM)
+        if role:
+            return role
+    return get_user_role(request.user)
+
+
+@receiver(post_save, sender=UserProfile)
+@receiver(post_delete, sender=UserProfile)
+def _invalidate_user_role(sender, instance, **kwargs):
+    cache.delete(_role_cache_key(instance.user_id))
 
 
 class ReadOnlyOrFarmer(BasePermission):
@@ -25,13 +69,17 @@ class ReadOnlyOrFarmer(BasePermission):
     - POST / PUT / PATCH / DELETE:
         allowed only for roles: admin, farmer
         (worker cannot modify data)
+    - device API keys: POST only (plot scope is checked on create)
     """
 
     def has_permission(self, request, view):
-        role = get_user_role(request.user)
+        role = get_request_role(request)
         if role is None:
             return False
 
+        if role == "device":
+            return request.method == "POST"
+
         # Read-only methods (GET, HEAD, OPTIONS)
         if request.method in SAFE_METHODS:
             return role in ["admin", "farmer", "worker"]
@@ -50,7 +98,7 @@ class IsAdminFarmerWorker(BasePermission):
     """
 
     def has_permission(self, request, view):
-        role = get_user_role(request.user)
+        role = get_request_role(request)
         if role is None:
             return False
 
@@ -64,5 +112,5 @@ class IsAdminOnly(BasePermission):
     """
 
     def has_permission(self, request, view):
-        role = get_user_role(request.user)
+        role = get_request_role(request)
         return role == "admin"
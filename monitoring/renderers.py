@@ -0,0 +1,221 @@
+"""
+Binary response formats for bulk reading/anomaly pulls.
+
+Selected with the Accept header or ?format=:
+
+    application/msgpack                  ?format=msgpack  same document as JSON, MessagePack-encoded
+    application/vnd.apache.arrow.stream  ?format=arrow    Arrow IPC stream, one typed column per field
+    application/x-npz                    ?format=npz      NumPy .npz, one array per field
+
+MessagePack needs the msgpack package and Arrow needs pyarrow; each
+renderer is only offered when its package is installed. The .npz layout
+works everywhere numpy does and is the columnar fallback without pyarrow.
+
+List endpoints hand these renderers a Columns object (fast_serializers.py)
+straight from values_list(); any other response (detail, errors) is
+converted from the usual serializer data.
+"""
+import datetime
+import importlib.util
+import io
+import json
+
+from django.utils import timezone
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+
+from .fast_serializers import Columns, _iso_datetime
+
+try:
+    import msgpack
+except ImportError:  # optional dependency
+    msgpack = None
+
+HAS_PYARROW = importlib.util.find_spec("pyarrow") is not None
+HAS_NUMPY = importlib.util.find_spec("numpy") is not None
+
+
+# -----------------------------------------------------------------------------
+# Helpers
+# -----------------------------------------------------------------------------
+def _value_kind(values):
+    kinds = set()
+    for v in values:
+        if v is None:
+            continue
+        if isinstance(v, bool):
+            kinds.add("bool")
+        elif isinstance(v, int):
+            kinds.add("int")
+        elif isinstance(v, float):
+            kinds.add("float")
+        elif isinstance(v, str):
+            kinds.add("str")
+        elif isinstance(v, datetime.datetime):
+            kinds.add("datetime")
+        else:
+            kinds.add("other")
+
+    if kinds == {"int", "float"}:
+        return "float"
+    if len(kinds) == 1:
+        return kinds.pop()
+    return "other" if kinds else "str"
+
+
+def as_columns(data):
+    """Columns for serializer output: a list of rows, one row (dict) or a list of scalars."""
+    if isinstance(data, Columns):
+        return data
+    if isinstance(data, dict):
+        data = [data]
+    data = list(data or [])
+    if data and not all(isinstance(row, dict) for row in data):
+        data = [{"value": v} for v in data]
+
+    names = []
+    for row in data:
+        names.extend(name for name in row if name not in names)
+
+    columns = [[row.get(name) for row in data] for name in names]
+    kinds = [_value_kind(column) for column in columns]
+    return Columns(names, kinds, columns)
+
+
+def _json_text(value):
+    if value is None:
+        return None
+    return json.dumps(value, cls=JSONRenderer.encoder_class, ensure_ascii=False, separators=(",", ":"))
+
+
+def _utc_naive(value):
+    if value is None:
+        return None
+    if timezone.is_aware(value):
+        value = value.astimezone(datetime.timezone.utc)
+    return value.replace(tzinfo=None)
+
+
+# -----------------------------------------------------------------------------
+# Renderers
+# -----------------------------------------------------------------------------
+class ColumnarRenderer(BaseRenderer):
+    """
+    Base for the binary renderers.
+
+    columnar = True tells FastListMixin to pass list data as Columns.
+    """
+    charset = None
+    render_style = "binary"
+    columnar = True
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+        return self.render_columns(as_columns(data))
+
+    def render_columns(self, columns):
+        raise NotImplementedError
+
+
+class MessagePackRenderer(ColumnarRenderer):
+    """
+    The JSON document, MessagePack-encoded: same keys and shape, timestamps
+    as the same ISO strings, numbers as binary ints/floats.
+    """
+    media_type = "application/msgpack"
+    format = "msgpack"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+        if isinstance(data, Columns):
+            data = self.columns_to_rows(data)
+        return msgpack.packb(
+            data, use_bin_type=True, default=JSONRenderer.encoder_class().default
+        )
+
+    def columns_to_rows(self, columns):
+        tz = timezone.get_current_timezone()
+        values = list(columns.columns)
+        for i, kind in enumerate(columns.kinds):
+            if kind == "datetime":
+                values[i] = [None if v is None else _iso_datetime(v, tz) for v in values[i]]
+        names = columns.names
+        return [dict(zip(names, row)) for row in zip(*values)]
+
+
+class ArrowRenderer(ColumnarRenderer):
+    """Arrow IPC stream: one record batch, timestamps as timestamp[us, UTC]."""
+    media_type = "application/vnd.apache.arrow.stream"
+    format = "arrow"
+
+    def render_columns(self, columns):
+        import pyarrow as pa
+
+        types = {
+            "int": pa.int64(),
+            "float": pa.float64(),
+            "bool": pa.bool_(),
+            "str": pa.string(),
+            "datetime": pa.timestamp("us", tz="UTC"),
+            "other": pa.string(),
+        }
+        arrays = []
+        for kind, values in zip(columns.kinds, columns.columns):
+            if kind == "other":
+                values = [_json_text(v) for v in values]
+            arrays.append(pa.array(values, type=types[kind]))
+
+        table = pa.Table.from_arrays(arrays, names=list(columns.names))
+        sink = pa.BufferOutputStream()
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+        return sink.getvalue().to_pybytes()
+
+
+class NumpyRenderer(ColumnarRenderer):
+    """
+    NumPy .npz (uncompressed; HTTP compression applies on top), one array per
+    field, loadable with numpy.load(..., allow_pickle=False).
+
+    int64 columns holding NULLs become float64 with NaN, timestamps are
+    datetime64[us] in UTC (NaT for NULL), text columns are unicode arrays.
+    """
+    media_type = "application/x-npz"
+    format = "npz"
+
+    def render_columns(self, columns):
+        import numpy as np
+
+        arrays = {}
+        for name, kind, values in zip(columns.names, columns.kinds, columns.columns):
+            if kind == "int":
+                if any(v is None for v in values):
+                    array = np.array([np.nan if v is None else v for v in values], dtype=np.float64)
+                else:
+                    array = np.array(values, dtype=np.int64)
+            elif kind == "float":
+                array = np.array([np.nan if v is None else v for v in values], dtype=np.float64)
+            elif kind == "bool":
+                array = np.array([bool(v) for v in values], dtype=np.bool_)
+            elif kind == "datetime":
+                array = np.array([_utc_naive(v) for v in values], dtype="datetime64[us]")
+            elif kind == "str":
+                array = np.array(["" if v is None else v for v in values], dtype=np.str_)
+            else:
+                array = np.array([_json_text(v) or "" for v in values], dtype=np.str_)
+            arrays[name] = array
+
+        buf = io.BytesIO()
+        np.savez(buf, **arrays)
+        return buf.getvalue()
+
+
+# Offered by the bulk endpoints after JSON and the browsable API.
+BINARY_RENDERERS = []
+if msgpack is not None:
+    BINARY_RENDERERS.append(MessagePackRenderer)
+if HAS_PYARROW:
+    BINARY_RENDERERS.append(ArrowRenderer)
+if HAS_NUMPY:
+    BINARY_RENDERERS.append(NumpyRenderer)
@@ -0,0 +1,287 @@
+"""
+Retention and downsampling of raw sensor readings.
+
+For each (plot, sensor_type) the effective policy (RetentionPolicy rows,
+falling back to settings.READING_RETENTION) gives:
+  - raw_days:    raw readings older than this are rolled up and deleted;
+  - rollup:      "hour" or "day" ReadingRollup buckets they are rolled into;
+  - rollup_days: rollups older than this are deleted (None = kept).
+
+The cutoff is aligned down to a bucket boundary, so every bucket is rolled
+up complete. Raw rows go CHUNK_SIZE at a time, oldest first; each chunk is
+aggregated, merged into its rollups and deleted in one short transaction,
+so an interrupted run never counts a reading twice and ingest writers
+only ever wait for one chunk.
+
+Archived days (ReadingArchive, monitoring/archive.py) follow the same
+policies: a day whose readings are all past the cutoff is rolled up and
+deleted in one transaction, so archiving before raw_days does not keep
+readings forever.
+
+Run by: python manage.py apply_retention [--dry-run] [--loop]
+"""
+import time
+from collections import namedtuple
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import Count, F, Max, Min, Sum
+from django.db.models.functions import Trunc
+from django.utils import timezone
+
+from .archive import archive_buckets
+from .models import FieldPlot, ReadingArchive, ReadingRollup, RetentionPolicy, SensorReading
+
+DEFAULTS = {
+    "RAW_DAYS": 90,
+    "ROLLUP": "hour",
+    "ROLLUP_DAYS": None,
+    "CHUNK_SIZE": 2000,
+    "PAUSE_SECONDS": 0.05,
+    "INTERVAL_SECONDS": 3600,
+}
+
+Policy = namedtuple("Policy", ["raw_days", "rollup", "rollup_days"])
+
+
+def _config(name):
+    return getattr(settings, "READING_RETENTION", {}).get(name, DEFAULTS[name])
+
+
+# -----------------------------------------------------------------------------
+# Policies
+# -----------------------------------------------------------------------------
+def policy_table():
+    """{(farm_id, sensor_type): Policy}; (None, None) is always present."""
+    table = {(None, None): Policy(_config("RAW_DAYS"), _config("ROLLUP"), _config("ROLLUP_DAYS"))}
+    for row in RetentionPolicy.objects.all():
+        table[(row.farm_id, row.sensor_type)] = Policy(row.raw_days, row.rollup, row.rollup_days)
+    return table
+
+
+def plot_policies(plot_ids=None):
+    """[(plot_id, sensor_type, Policy)] for every plot and sensor type."""
+    table = policy_table()
+    plots = FieldPlot.objects.order_by("id")
+    if plot_ids:
+        plots = plots.filter(id__in=plot_ids)
+
+    result = []
+    for plot_id, farm_id in plots.values_list("id", "farm_id"):
+        for sensor_type, _ in SensorReading.SENSOR_TYPES:
+            policy = (
+                table.get((farm_id, sensor_type))
+                or table.get((farm_id, None))
+                or table.get((None, sensor_type))
+                or table[(None, None)]
+            )
+            result.append((plot_id, sensor_type, policy))
+    return result
+
+
+def cutoff_for(policy, now):
+    """Start of the rollup bucket containing now - raw_days (same buckets as Trunc)."""
+    cutoff = timezone.localtime(now - timedelta(days=policy.raw_days))
+    cutoff = cutoff.replace(minute=0, second=0, microsecond=0)
+    if policy.rollup == "day":
+        cutoff = cutoff.replace(hour=0)
+    return cutoff
+
+
+# -----------------------------------------------------------------------------
+# Rolling up
+# -----------------------------------------------------------------------------
+def roll_up(plot_id, sensor_type, resolution, start, end):
+    """Merge raw readings in [start, end) into rollups and delete them. Returns rows deleted."""
+    with transaction.atomic():
+        readings = SensorReading.objects.filter(
+            plot_id=plot_id, sensor_type=sensor_type, timestamp__gte=start, timestamp__lt=end
+        )
+        buckets = list(
+            readings.annotate(bucket=Trunc("timestamp", resolution))
+            .values("bucket")
+            .annotate(
+                count=Count("id"),
+                min=Min("value"),
+                max=Max("value"),
+                sum=Sum("value"),
+                sum_sq=Sum(F("value") * F("value")),
+            )
+        )
+        if not buckets:
+            return 0
+
+        merge_rollups(plot_id, sensor_type, resolution, buckets)
+        # anomaly events and latest values keep their rows, with the link cleared
+        _, deleted = readings.delete()
+        return deleted.get(SensorReading._meta.label, 0)
+
+
+def merge_rollups(plot_id, sensor_type, resolution, buckets):
+    """Add [{"bucket", "count", "min", "max", "sum", "sum_sq"}] to the rollups (inside a transaction)."""
+    # the first bucket of a chunk may already hold the previous chunk's tail
+    existing = {
+        r.start: r for r in ReadingRollup.objects.filter(
+            plot_id=plot_id, sensor_type=sensor_type, resolution=resolution,
+            start__in=[b["bucket"] for b in buckets],
+        )
+    }
+    rollups = []
+    for b in buckets:
+        rollup = existing.get(b["bucket"])
+        if rollup is None:
+            rollup = ReadingRollup(
+                plot_id=plot_id, sensor_type=sensor_type, resolution=resolution, start=b["bucket"],
+                count=0, min=b["min"], max=b["max"], sum=0.0, sum_sq=0.0,
+            )
+        rollup.count += b["count"]
+        rollup.min = min(rollup.min, b["min"])
+        rollup.max = max(rollup.max, b["max"])
+        rollup.sum += b["sum"]
+        rollup.sum_sq += b["sum_sq"]
+        rollups.append(rollup)
+
+    ReadingRollup.objects.bulk_create(
+        rollups,
+        update_conflicts=True,
+        unique_fields=["plot", "sensor_type", "resolution", "start"],
+        update_fields=["count", "min", "max", "sum", "sum_sq"],
+    )
+
+
+def roll_up_archive(archive, resolution):
+    """Merge an archived day into rollups and delete it. Returns the readings it held."""
+    with transaction.atomic():
+        buckets = [
+            {"bucket": t, "count": count, "min": low, "max": high, "sum": total, "sum_sq": total_sq}
+            for t, (count, low, high, total, total_sq) in sorted(archive_buckets(archive, resolution).items())
+        ]
+        if buckets:
+            merge_rollups(archive.plot_id, archive.sensor_type, resolution, buckets)
+        archive.delete()
+        return archive.count
+
+
+def expired_archives(plot_id, sensor_type, cutoff):
+    """Archived days whose readings are all before cutoff."""
+    return ReadingArchive.objects.filter(
+        plot_id=plot_id, sensor_type=sensor_type, last_timestamp__lt=cutoff
+    ).order_by("day")
+
+
+def apply_policy(plot_id, sensor_type, policy, now=None, chunk_size=None, pause=None):
+    """Roll up and delete everything past the policy's cutoff. Returns (readings, rollups) deleted."""
+    now = now or timezone.now()
+    chunk_size = chunk_size or _config("CHUNK_SIZE")
+    pause = _config("PAUSE_SECONDS") if pause is None else pause
+
+    cutoff = cutoff_for(policy, now)
+    expired = SensorReading.objects.filter(
+        plot_id=plot_id, sensor_type=sensor_type, timestamp__lt=cutoff
+    ).order_by("timestamp").values_list("timestamp", flat=True)
+
+    readings = 0
+    while True:
+        # chunk = the oldest chunk_size readings, cut on a timestamp
+        first = list(expired[:1])
+        if not first:
+            break
+        start = first[0]
+        nxt = list(expired[chunk_size:chunk_size + 1])
+        end = nxt[0] if nxt else cutoff
+        if end <= start:
+            # more than chunk_size readings share one timestamp
+            end = start + timedelta(microseconds=1)
+
+        readings += roll_up(plot_id, sensor_type, policy.rollup, start, end)
+        if pause:
+            # let queued ingest writes take the database lock
+            time.sleep(pause)
+
+    # a day straddling the cutoff waits until it is wholly past it
+    for archive in expired_archives(plot_id, sensor_type, cutoff).iterator():
+        readings += roll_up_archive(archive, policy.rollup)
+        if pause:
+            time.sleep(pause)
+
+    rollups = 0
+    if policy.rollup_days is not None:
+        rollups, _ = ReadingRollup.objects.filter(
+            plot_id=plot_id, sensor_type=sensor_type,
+            start__lt=now - timedelta(days=policy.rollup_days),
+        ).delete()
+    return readings, rollups
+
+
+def apply_retention(plot_ids=None, now=None, chunk_size=None, pause=None):
+    """Apply every plot's policies. Returns [(plot_id, sensor_type, Policy, readings, rollups)]."""
+    now = now or timezone.now()
+    results = []
+    for plot_id, sensor_type, policy in plot_policies(plot_ids):
+        readings, rollups = apply_policy(plot_id, sensor_type, policy, now, chunk_size, pause)
+        results.append((plot_id, sensor_type, policy, readings, rollups))
+    return results
+
+
+# -----------------------------------------------------------------------------
+# Dry run
+# -----------------------------------------------------------------------------
+def reading_bytes_per_row(using="default"):
+    """
+    Average on-disk bytes per SensorReading (table + indexes), or None.
+
+    Needs SQLite's dbstat table; other databases report no sizes.
+    """
+    connection = connections[using]
+    if connection.vendor != "sqlite":
+        return None
+    table = SensorReading._meta.db_table
+    total = SensorReading.objects.using(using).count()
+    if not total:
+        return None
+    with connection.cursor() as cursor:
+        try:
+            cursor.execute(
+                "SELECT SUM(pgsize) FROM dbstat WHERE name = %s "
+                "OR name IN (SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = %s)",
+                [table, table],
+            )
+        except Exception:
+            return None
+        size = cursor.fetchone()[0]
+    return size / total if size else None
+
+
+def retention_report(plot_ids=None, now=None):
+    """
+    What apply_retention would do, without changing anything:
+    [{"plot", "sensor_type", "policy", "cutoff", "readings", "archived", "rollups", "bytes"}]
+
+    "archived" counts the readings of expired archived days, "rollups" the
+    buckets the raw readings fall into, "bytes" estimates the raw space freed
+    (None when unknown).
+    """
+    now = now or timezone.now()
+    per_row = reading_bytes_per_row()
+
+    report = []
+    for plot_id, sensor_type, policy in plot_policies(plot_ids):
+        cutoff = cutoff_for(policy, now)
+        expired = SensorReading.objects.filter(plot_id=plot_id, sensor_type=sensor_type, timestamp__lt=cutoff)
+        readings = expired.count()
+        buckets = 0
+        if readings:
+            buckets = expired.annotate(bucket=Trunc("timestamp", policy.rollup)).values("bucket").distinct().count()
+        archived = expired_archives(plot_id, sensor_type, cutoff).aggregate(n=Sum("count"))["n"] or 0
+        report.append({
+            "plot": plot_id,
+            "sensor_type": sensor_type,
+            "policy": policy,
+            "cutoff": cutoff,
+            "readings": readings,
+            "archived": archived,
+            "rollups": buckets,
+            "bytes": None if per_row is None else int(readings * per_row),
+        })
+    return report
@@ -0,0 +1,317 @@
+"""
+Shared-memory ring buffer of recent sensor vectors per plot.
+
+One memory-mapped file per plot holds its last SLOTS vectors; every worker
+process on the host maps the same files, so a reading ingested by one
+worker is visible to detection in any other without a database query.
+
+File layout (little endian):
+
+    header  64 bytes: magic, version, slot count, write count, created (epoch s),
+            newest dropped second (epoch s, 0 = none)
+    slots   SLOTS x 32 bytes: second (int64 epoch s), temperature, humidity,
+            moisture (float64, NaN until that sensor reports)
+
+A slot is one plot second, the same grouping prepare_vectors() uses for
+detection; a sensor reporting twice in one second keeps its last value
+(prepare_vectors() averages them). Writers (update_latest_readings(), after commit) take an
+exclusive flock on the file, fill the slot of the reading's second (a new
+slot when it is newer than the last one, one of the last LOOKBACK slots
+otherwise) and bump the write count after the slot. Readers never lock:
+window() views the slots through NumPy, copies the requested window and
+checks the write count again to discard slots overwritten meanwhile.
+
+Readings older than the last LOOKBACK slots, or late for a second that has
+no slot, are only in the database; the header keeps the newest such second.
+recent_vectors() also returns the time from which the ring is complete (after
+that second); callers read anything older from the database
+(mlmodule/iris_service.py).
+
+The rings outlive the database they mirror: migrate and flush (post_migrate)
+reset them, see clear().
+
+Needs fcntl (POSIX); elsewhere the ring is disabled and callers use the
+database.
+"""
+import hashlib
+import math
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+
+from . import metrics
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+DEFAULTS = {
+    "ENABLED": True,
+    "DIR": None,
+    "SLOTS": 8192,
+}
+
+FEATURES = ["temperature", "humidity", "moisture"]
+MAGIC = b"AGRR"
+VERSION = 2
+# magic, version, slots, write count, created, newest dropped second
+HEADER = struct.Struct("<4sB3xIQqq")
+HEADER_SIZE = 64
+COUNT_OFFSET = 12
+CREATED_OFFSET = 20
+DROPPED_OFFSET = 28
+SLOT = struct.Struct("<qddd")
+FEATURE_OFFSETS = {name: 8 + 8 * i for i, name in enumerate(FEATURES)}
+# how far back an out-of-order reading may land
+LOOKBACK = 16
+NAN = float("nan")
+
+
+def _config(name):
+    return getattr(settings, "READING_RING", {}).get(name, DEFAULTS[name])
+
+
+def enabled():
+    return fcntl is not None and _config("ENABLED")
+
+
+def ring_dir():
+    """Configured directory, else one temp directory per database file."""
+    path = _config("DIR")
+    if not path:
+        name = str(settings.DATABASES["default"]["NAME"])
+        path = os.path.join(tempfile.gettempdir(), f"agri-ring-{hashlib.sha1(name.encode()).hexdigest()[:12]}")
+    return path
+
+
+class PlotRing:
+    """The memory-mapped ring file of one plot."""
+
+    def __init__(self, path, slots):
+        self.path = path
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            try:
+                magic, version = MAGIC, VERSION
+                if os.fstat(fd).st_size >= HEADER.size:
+                    magic, version = HEADER.unpack(os.pread(fd, HEADER.size, 0))[:2]
+                if os.fstat(fd).st_size == 0 or (magic == MAGIC and version != VERSION):
+                    # new file, or one of an older layout: start empty
+                    os.ftruncate(fd, 0)
+                    os.ftruncate(fd, HEADER_SIZE + slots * SLOT.size)
+                    os.pwrite(fd, HEADER.pack(MAGIC, VERSION, slots, 0, int(time.time()), 0), 0)
+                magic, version, self.slots = HEADER.unpack(os.pread(fd, HEADER.size, 0))[:3]
+            finally:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+            if magic != MAGIC or version != VERSION:
+                raise ValueError(f"{path} is not a reading ring")
+            self.mm = mmap.mmap(fd, HEADER_SIZE + self.slots * SLOT.size)
+        except BaseException:
+            os.close(fd)
+            raise
+        self.fd = fd
+        # flock only excludes other processes
+        self._lock = threading.Lock()
+        self._array = None
+
+    # --- writing -------------------------------------------------------------
+    def count(self):
+        return struct.unpack_from("<Q", self.mm, COUNT_OFFSET)[0]
+
+    def created(self):
+        return struct.unpack_from("<q", self.mm, CREATED_OFFSET)[0]
+
+    def dropped_second(self):
+        return struct.unpack_from("<q", self.mm, DROPPED_OFFSET)[0]
+
+    def _offset(self, index):
+        return HEADER_SIZE + (index % self.slots) * SLOT.size
+
+    def write(self, items):
+        """Store [(epoch_second, sensor_type, value)]. Returns how many were too old to place."""
+        with self._lock:
+            fcntl.flock(self.fd, fcntl.LOCK_EX)
+            try:
+                return self._write(items)
+            finally:
+                fcntl.flock(self.fd, fcntl.LOCK_UN)
+
+    def reset(self):
+        """Empty the ring (in place: other processes keep their mappings)."""
+        with self._lock:
+            fcntl.flock(self.fd, fcntl.LOCK_EX)
+            try:
+                struct.pack_into("<q", self.mm, DROPPED_OFFSET, 0)
+                struct.pack_into("<q", self.mm, CREATED_OFFSET, int(time.time()))
+                struct.pack_into("<Q", self.mm, COUNT_OFFSET, 0)
+            finally:
+                fcntl.flock(self.fd, fcntl.LOCK_UN)
+
+    def _write(self, items):
+        mm = self.mm
+        dropped = 0
+        dropped_second = self.dropped_second()
+        count = self.count()
+        for second, sensor_type, value in items:
+            offset = FEATURE_OFFSETS.get(sensor_type)
+            if offset is None:
+                continue
+
+            last = struct.unpack_from("<q", mm, self._offset(count - 1))[0] if count else None
+            if last is None or second > last:
+                slot = self._offset(count)
+                SLOT.pack_into(mm, slot, second, NAN, NAN, NAN)
+                struct.pack_into("<d", mm, slot + offset, value)
+                # published after the slot is complete
+                count += 1
+                struct.pack_into("<Q", mm, COUNT_OFFSET, count)
+                continue
+
+            for index in range(count - 1, max(count - LOOKBACK, count - self.slots, 0) - 1, -1):
+                slot = self._offset(index)
+                slot_second = struct.unpack_from("<q", mm, slot)[0]
+                if slot_second == second:
+                    struct.pack_into("<d", mm, slot + offset, value)
+                    break
+                if slot_second < second:
+                    break
+            else:
+                slot_second = None
+            if slot_second != second:
+                # only in the database: window() no longer covers this second
+                dropped += 1
+                dropped_second = max(dropped_second, second)
+
+        if dropped_second != self.dropped_second():
+            struct.pack_into("<q", mm, DROPPED_OFFSET, dropped_second)
+        return dropped
+
+    # --- reading -------------------------------------------------------------
+    def array(self):
+        """Structured NumPy view of the slots (no copy)."""
+        if self._array is None:
+            import numpy as np
+
+            dtype = np.dtype([("t", "<i8")] + [(name, "<f8") for name in FEATURES])
+            self._array = np.frombuffer(self.mm, dtype=dtype, count=self.slots, offset=HEADER_SIZE)
+        return self._array
+
+    def window(self, since):
+        """
+        (vectors, covered_since): the epoch second from which the ring holds
+        every vector (>= since), and a copy of its slots from then on, oldest first.
+        """
+        import numpy as np
+
+        slots = self.array()
+        for _ in range(3):
+            created = self.created()
+            count = self.count()
+            # the slot after the newest one is the next overwritten: never read it
+            first = max(0, count - self.slots + 1)
+            start, n = first % self.slots, count - first
+            if start + n <= self.slots:
+                segments = [slots[start:start + n]]
+            else:
+                segments = [slots[start:], slots[:start + n - self.slots]]
+            # readings stamped before the ring existed may be in the ring or not
+            covered = created if first == 0 else int(segments[0]["t"][0])
+            # not after a reading that arrived too late for its slot
+            start_at = max(since, covered, self.dropped_second() + 1)
+
+            vectors = np.concatenate([seg[np.searchsorted(seg["t"], start_at):] for seg in segments])
+
+            if self.created() != created:
+                # reset meanwhile
+                continue
+            # slots overwritten while copying are dropped
+            overwritten = (self.count() - self.slots + 1) - (count - len(vectors))
+            if overwritten <= 0:
+                return vectors, start_at
+            if overwritten < len(vectors):
+                return vectors[overwritten:], int(vectors["t"][overwritten])
+        return vectors[:0], math.inf
+
+
+_rings = {}
+_rings_lock = threading.Lock()
+
+
+def get_ring(plot_id, create=True):
+    """This process's PlotRing of a plot; None when disabled or (create=False) not yet written."""
+    if not enabled():
+        return None
+    ring = _rings.get(plot_id)
+    if ring is not None:
+        return ring
+
+    with _rings_lock:
+        ring = _rings.get(plot_id)
+        if ring is None:
+            path = os.path.join(ring_dir(), f"plot_{plot_id}.ring")
+            if not create and not os.path.exists(path):
+                return None
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            ring = _rings[plot_id] = PlotRing(path, _config("SLOTS"))
+    return ring
+
+
+def record(readings):
+    """Add SensorReading objects to their plots' rings (called after commit)."""
+    if not enabled():
+        return
+
+    by_plot = {}
+    for reading in readings:
+        second = math.floor(reading.timestamp.timestamp())
+        by_plot.setdefault(reading.plot_id, []).append((second, reading.sensor_type, reading.value))
+
+    for plot_id, items in by_plot.items():
+        try:
+            dropped = get_ring(plot_id).write(sorted(items, key=lambda item: item[0]))
+        except OSError:
+            metrics.incr("ring.errors")
+            continue
+        metrics.incr("ring.writes", len(items))
+        if dropped:
+            metrics.incr("ring.dropped", dropped)
+
+
+def recent_vectors(plot_id, since):
+    """
+    (vectors, covered_since) of a plot from its ring: structured NumPy array
+    with fields t (epoch second), temperature, humidity, moisture, and the
+    epoch second from which it is complete. (None, inf) without a ring.
+    """
+    ring = get_ring(plot_id, create=False)
+    if ring is None:
+        return None, math.inf
+    return ring.window(since)
+
+
+def clear(**kwargs):
+    """
+    Reset every ring of the database (post_migrate receiver): after flush or a
+    recreated database the rings would serve vectors of plots that no longer
+    exist, or of reused plot ids.
+    """
+    if not enabled():
+        return
+    path = ring_dir()
+    if not os.path.isdir(path):
+        return
+    for name in os.listdir(path):
+        if not (name.startswith("plot_") and name.endswith(".ring")):
+            continue
+        try:
+            plot_id = int(name[len("plot_"):-len(".ring")])
+            get_ring(plot_id).reset()
+        except (OSError, ValueError):
+            metrics.incr("ring.errors")
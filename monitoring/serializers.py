@@ -1,4 +1,10 @@
 from rest_framework import serializers
+from rest_framework.exceptions import AuthenticationFailed
+from django.contrib.auth import get_user_model
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer, TokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import AccessToken
+from .fields import SmallCodeField
 from .models import SensorReading, AnomalyEvent, AgentRecommendation, FieldPlot, FarmProfile,UserProfile
 
 
@@ -20,9 +26,30 @@ class FieldPlotSerializer(serializers.ModelSerializer):
 
 
 class SensorReadingSerializer(serializers.ModelSerializer):
+    # sensor_type and source are strings in the API, codes in the database
+    serializer_field_mapping = {
+        **serializers.ModelSerializer.serializer_field_mapping,
+        SmallCodeField: serializers.CharField,
+    }
+
     class Meta:
         model = SensorReading
         fields = "__all__"
+        extra_kwargs = {
+            # server receive time; devices report theirs as device_timestamp
+            "timestamp": {"read_only": True},
+            # duplicates are answered with the stored reading, not a 400
+            "idempotency_key": {"validators": []},
+            "source": {"max_length": 30},
+        }
+
+
+class SensorReadingBatchSerializer(SensorReadingSerializer):
+    """
+    One item of a batch upload. The plot is taken as a plain id and the
+    view checks all plot ids of the batch with one query.
+    """
+    plot = serializers.IntegerField(source="plot_id")
 
 
 class AnomalyEventSerializer(serializers.ModelSerializer):
@@ -35,3 +62,44 @@ class AgentRecommendationSerializer(serializers.ModelSerializer):
     class Meta:
         model = AgentRecommendation
         fields = "__all__"
+
+
+class RoleTokenObtainPairSerializer(TokenObtainPairSerializer):
+    """Token pair carrying the user's role, so permission checks need no profile query."""
+
+    @classmethod
+    def get_token(cls, user):
+        from .permissions import ROLE_CLAIM, get_user_role
+
+        token = super().get_token(user)
+        token[ROLE_CLAIM] = get_user_role(user)
+        return token
+
+
+class RoleTokenRefreshSerializer(TokenRefreshSerializer):
+    """
+    Refresh that re-reads the role: the claim copied from the refresh token
+    would keep a demoted user's old role for the refresh token's lifetime.
+    Deleted users are rejected here, inactive ones by TokenRefreshSerializer.
+    """
+
+    def validate(self, attrs):
+        from .permissions import ROLE_CLAIM, get_user_role
+
+        # TokenRefreshSerializer would raise DoesNotExist (500) for a deleted user
+        user_id = self.token_class(attrs["refresh"]).payload.get(api_settings.USER_ID_CLAIM)
+        user = get_user_model().objects.filter(**{api_settings.USER_ID_FIELD: user_id}).first()
+        if user is None:
+            raise AuthenticationFailed(self.error_messages["no_active_account"], "no_active_account")
+
+        data = super().validate(attrs)
+        role = get_user_role(user)
+
+        access = AccessToken(data["access"])
+        access[ROLE_CLAIM] = role
+        data["access"] = str(access)
+        if "refresh" in data:
+            refresh = self.token_class(data["refresh"])
+            refresh[ROLE_CLAIM] = role
+            data["refresh"] = str(refresh)
+        return data
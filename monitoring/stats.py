@@ -0,0 +1,92 @@
+"""
+Time-bucketed reading statistics computed in the database.
+
+Used by GET /api/sensor-readings/stats/. One grouped aggregate query
+returns count/min/max/avg/stddev per (plot, sensor_type, bucket), and the
+result is reshaped into compact columnar series. Days moved to cold
+storage (ReadingArchive) are aggregated from their blobs and merged in.
+"""
+from django.db.models import Avg, Count, Max, Min, StdDev
+from django.db.models.functions import Trunc
+
+from .archive import archive_bucket_rows
+from .models import SensorReading
+
+BUCKETS = ["minute", "hour", "day", "week", "month"]
+STAT_FIELDS = ["count", "min", "max", "avg", "stddev"]
+
+
+def bucket_rows(plot_ids, sensor_types, start, end, bucket, using="default"):
+    """(plot_id, sensor_type, bucket, count, min, max, avg, stddev) rows ordered by series then time."""
+    qs = SensorReading.objects.using(using).filter(timestamp__gte=start, timestamp__lt=end)
+    if plot_ids:
+        qs = qs.filter(plot_id__in=plot_ids)
+    if sensor_types:
+        qs = qs.filter(sensor_type__in=sensor_types)
+
+    return (
+        qs.annotate(bucket=Trunc("timestamp", bucket))
+        .values("plot_id", "sensor_type", "bucket")
+        .annotate(
+            count=Count("id"),
+            min=Min("value"),
+            max=Max("value"),
+            avg=Avg("value"),
+            stddev=StdDev("value"),
+        )
+        .order_by("plot_id", "sensor_type", "bucket")
+        .values_list("plot_id", "sensor_type", "bucket", *STAT_FIELDS)
+    )
+
+
+def merge_bucket_rows(rows, archived):
+    """bucket_rows() rows plus archived ones, in the same order; shared buckets are combined."""
+    merged = {}
+    for row in list(rows) + archived:
+        key = row[:3]
+        other = merged.get(key)
+        if other is not None:
+            row = key + _combine(other[3:], row[3:])
+        merged[key] = tuple(row)
+
+    codes = SensorReading.SENSOR_TYPE_CODES
+    return sorted(merged.values(), key=lambda r: (r[0], codes.get(r[1], 0), r[2]))
+
+
+def _combine(a, b):
+    """count/min/max/avg/stddev of two disjoint sets of values."""
+    (n1, lo1, hi1, avg1, sd1), (n2, lo2, hi2, avg2, sd2) = a, b
+    n = n1 + n2
+    avg = (avg1 * n1 + avg2 * n2) / n
+    sq = ((sd1 or 0.0) ** 2 + avg1 ** 2) * n1 + ((sd2 or 0.0) ** 2 + avg2 ** 2) * n2
+    return (n, min(lo1, lo2), max(hi1, hi2), avg, max(sq / n - avg ** 2, 0.0) ** 0.5)
+
+
+def reading_stats(plot_ids, sensor_types, start, end, bucket="hour", using="default"):
+    """
+    Columnar statistics:
+
+        {"bucket": "hour", "start": ..., "end": ...,
+         "series": [{"plot": 1, "sensor_type": "moisture",
+                     "t": [...], "count": [...], "min": [...], "max": [...],
+                     "avg": [...], "stddev": [...]}, ...]}
+    """
+    series = []
+    current = None
+
+    rows = bucket_rows(plot_ids, sensor_types, start, end, bucket, using)
+    archived = archive_bucket_rows(plot_ids, sensor_types, start, end, bucket, using)
+    if archived:
+        rows = merge_bucket_rows(rows, archived)
+
+    for plot_id, sensor_type, t, *values in rows:
+        if current is None or current["plot"] != plot_id or current["sensor_type"] != sensor_type:
+            current = {"plot": plot_id, "sensor_type": sensor_type, "t": []}
+            current.update({field: [] for field in STAT_FIELDS})
+            series.append(current)
+
+        current["t"].append(t)
+        for field, value in zip(STAT_FIELDS, values):
+            current[field].append(value)
+
+    return {"bucket": bucket, "start": start, "end": end, "series": series}
@@ -1,3 +1,698 @@
-from django.test import TestCase
+import gzip
+import math
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.test import SimpleTestCase, TestCase
+from django.utils import timezone
+
+from .archive import (
+    FLOAT_BITS, HEADER, NULL_OFFSET, _datetime, archive_bucket_rows, archive_readings, archived_readings, archives_in,
+    pack, unpack,
+)
+from .models import FarmProfile, FieldPlot, LatestReading, ReadingArchive, SensorReading
+from .stats import bucket_rows, merge_bucket_rows
+
+START = datetime(2024, 3, 29, 20, 17, 3, 250000, tzinfo=dt_timezone.utc)
+
+
+def scale_of(blob):
+    return HEADER.unpack_from(blob)[2]
+
+
+class ArchiveCodecTests(SimpleTestCase):
+    def round_trip(self, readings):
+        """(blob, [(timestamp, value, source code, device_timestamp)]) of pack() then unpack()."""
+        blob = pack(readings)
+        stamps, values, sources, offsets = unpack(blob)
+        return blob, [
+            (_datetime(stamp), value, source, None if offset == NULL_OFFSET else _datetime(stamp + offset))
+            for stamp, value, source, offset in zip(stamps, values, sources, offsets)
+        ]
+
+    def readings(self, values, device_timestamps=None):
+        rows = []
+        for i, value in enumerate(values):
+            ts = START + timedelta(seconds=5 * i, microseconds=137 * i)
+            device_ts = ts - timedelta(milliseconds=800) if device_timestamps is None else device_timestamps[i]
+            rows.append((ts, value, 1 + i % 3, device_ts))
+        return rows
+
+    def test_scaled_values_round_trip(self):
+        values = [21.37, 21.4, 21.41, -3.05, 0.0, 100.0, 99.99]
+        readings = self.readings(values)
+        blob, decoded = self.round_trip(readings)
+
+        self.assertEqual(scale_of(blob), 2)
+        self.assertEqual([r[1] for r in decoded], values)
+        self.assertEqual([r[0] for r in decoded], [r[0] for r in readings])
+        self.assertEqual([r[3] for r in decoded], [r[3] for r in readings])
+
+    def test_float_bits_values_round_trip(self):
+        # too many decimals for MAX_SCALE: stored as XORed float bits, still exact
+        values = [1 / 3, math.pi, -math.e, 1e-300, 1.7976931348623157e308, 0.1 + 0.2, 5e15 + 0.5]
+        blob, decoded = self.round_trip(self.readings(values))
+
+        self.assertEqual(scale_of(blob), FLOAT_BITS)
+        self.assertEqual([r[1] for r in decoded], values)
+
+    def test_null_device_timestamps(self):
+        readings = self.readings([1.5, 2.5, 3.5, 4.5], device_timestamps=[None, START, None, START - timedelta(days=3)])
+        _, decoded = self.round_trip(readings)
+
+        self.assertEqual([r[3] for r in decoded], [None, START, None, START - timedelta(days=3)])
+
+    def test_sources_and_count(self):
+        readings = self.readings([float(i) for i in range(1000)])
+        stamps, values, sources, _ = unpack(pack(readings))
+
+        self.assertEqual(len(stamps), 1000)
+        self.assertEqual(list(sources), [r[2] for r in readings])
+        self.assertEqual(list(values), [r[1] for r in readings])
+
+    def test_empty(self):
+        stamps, values, sources, offsets = unpack(pack([]))
+        self.assertEqual((len(stamps), len(values), len(sources), len(offsets)), (0, 0, 0, 0))
+
+
+class ArchiveBucketTests(TestCase):
+    """Buckets computed in Python from archives match the database's Trunc buckets."""
+
+    @classmethod
+    def setUpTestData(cls):
+        owner = User.objects.create(username="archive-tests")
+        farm = FarmProfile.objects.create(owner=owner, name="f", location="l", size_hectares=1, crop_type="c")
+        cls.plots = [FieldPlot.objects.create(farm=farm, name=f"p{i}", crop_variety="v") for i in range(2)]
+
+        # irregular readings over 40 days, across the end of March DST change in Europe
+        readings = []
+        for i in range(3000):
+            ts = START + timedelta(minutes=19 * i, seconds=i % 7)
+            for plot in cls.plots:
+                readings.append(SensorReading(
+                    plot=plot, sensor_type=("moisture", "temperature")[i % 2], timestamp=ts,
+                    value=round(20 + 10 * math.sin(i / 50) + plot.id, 2),
+                    device_timestamp=None if i % 5 else ts,
+                ))
+        SensorReading.objects.bulk_create(readings)
+        cls.end = START + timedelta(days=45)
+
+    def assertRowsEqual(self, expected, actual):
+        self.assertEqual([r[:4] for r in expected], [r[:4] for r in actual])
+        for e, a in zip(expected, actual):
+            self.assertEqual(e[4:6], a[4:6])
+            self.assertAlmostEqual(e[6], a[6], places=9)
+            self.assertAlmostEqual(e[7] or 0.0, a[7], places=6)
+
+    def check_buckets(self, tz):
+        with timezone.override(tz):
+            expected = {bucket: list(bucket_rows(None, None, START, self.end, bucket))
+                        for bucket in ("minute", "hour", "day", "week", "month")}
+            # part of the range archived: the merged rows are unchanged
+            archive_readings(days=0, now=START + timedelta(days=20))
+            self.assertTrue(ReadingArchive.objects.exists())
+            self.assertTrue(SensorReading.objects.exists())
+
+            for bucket, rows in expected.items():
+                with self.subTest(tz=str(tz), bucket=bucket):
+                    raw = list(bucket_rows(None, None, START, self.end, bucket))
+                    archived = archive_bucket_rows(None, None, START, self.end, bucket)
+                    self.assertRowsEqual(rows, merge_bucket_rows(raw, archived))
+
+    def test_utc(self):
+        self.check_buckets(dt_timezone.utc)
+
+    def test_local_time_with_dst(self):
+        from zoneinfo import ZoneInfo
+
+        self.check_buckets(ZoneInfo("Europe/Berlin"))
+
+    def test_archived_readings_in_timestamp_order(self):
+        before = list(
+            SensorReading.objects.order_by("timestamp", "id")
+            .values_list("timestamp", "plot_id", "sensor_type", "value", "source", "device_timestamp")
+        )
+        archive_readings(days=0, now=self.end)
+        self.assertFalse(SensorReading.objects.exists())
+
+        start, end = START + timedelta(days=2, hours=5), START + timedelta(days=9)
+        rows = list(archived_readings(archives_in(None, None, start, end), start, end))
+        self.assertEqual(
+            sorted(rows, key=lambda r: (r[0], r[1], r[2])),
+            sorted([r for r in before if start <= r[0] < end], key=lambda r: (r[0], r[1], r[2])),
+        )
+        self.assertEqual([r[0] for r in rows], sorted(r[0] for r in rows))
+
+    def test_retention_rolls_up_archived_days(self):
+        from .models import ReadingRollup
+        from .retention import apply_retention
+
+        total = SensorReading.objects.count()
+        archive_readings(days=0, now=START + timedelta(days=20))
+
+        # raw_days = 90: everything is past the cutoff 100 days after the last reading
+        apply_retention(now=self.end + timedelta(days=100), pause=0)
+        self.assertFalse(ReadingArchive.objects.exists())
+        self.assertFalse(SensorReading.objects.exists())
+        self.assertEqual(sum(ReadingRollup.objects.values_list("count", flat=True)), total)
+
+
+class LatestReadingTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        owner = User.objects.create(username="latest-tests")
+        farm = FarmProfile.objects.create(owner=owner, name="f", location="l", size_hectares=1, crop_type="c")
+        cls.plot = FieldPlot.objects.create(farm=farm, name="p", crop_variety="v")
+
+    def insert(self, value, seconds):
+        from .ingest import insert_readings
+
+        insert_readings([SensorReading(
+            plot=self.plot, sensor_type="moisture", value=value, timestamp=START + timedelta(seconds=seconds),
+        )])
+        return LatestReading.objects.get(plot=self.plot, sensor_type="moisture")
+
+    def test_older_reading_committed_later_does_not_replace_newer(self):
+        self.assertEqual(self.insert(30.0, 10).value, 30.0)
+        latest = self.insert(20.0, 5)
+        self.assertEqual((latest.value, latest.timestamp), (30.0, START + timedelta(seconds=10)))
+        self.assertEqual(self.insert(40.0, 10.5).value, 40.0)
+
+    def test_key_stored_concurrently_is_not_counted(self):
+        from .ingest import _inserted
+
+        SensorReading.objects.create(plot=self.plot, sensor_type="moisture", value=1.0, idempotency_key="k1")
+        ours = SensorReading(plot=self.plot, sensor_type="moisture", value=1.0, idempotency_key="k1")
+        unkeyed = SensorReading(plot=self.plot, sensor_type="moisture", value=2.0)
+        self.assertEqual(_inserted([ours, unkeyed]), [unkeyed])
+
+
+class NaturalKeyTests(TestCase):
+    def test_users_reporting_the_same_source_are_not_deduplicated(self):
+        from rest_framework.test import APIClient
+
+        from .models import UserProfile
+
+        owner = User.objects.create(username="owner")
+        farm = FarmProfile.objects.create(owner=owner, name="f", location="l", size_hectares=1, crop_type="c")
+        plot = FieldPlot.objects.create(farm=farm, name="p", crop_variety="v")
+        reading = {
+            "plot": plot.id, "sensor_type": "moisture", "value": 30.5,
+            "source": "gateway", "device_timestamp": START.isoformat(),
+        }
+        for name in ("a", "b"):
+            user = User.objects.create(username=name)
+            UserProfile.objects.create(user=user, role="farmer")
+            client = APIClient()
+            client.force_authenticate(user)
+            for _ in range(2):
+                response = client.post("/api/sensor-readings/", [reading], format="json")
+                self.assertEqual(response.status_code, 201, response.content)
+
+        self.assertEqual(SensorReading.objects.filter(plot=plot).count(), 2)
+
+
+class IngestThrottleTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        from .models import UserProfile
+
+        owner = User.objects.create(username="throttle-tests")
+        UserProfile.objects.create(user=owner, role="farmer")
+        farm = FarmProfile.objects.create(owner=owner, name="f", location="l", size_hectares=1, crop_type="c")
+        cls.owner = owner
+        cls.plots = [FieldPlot.objects.create(farm=farm, name=f"p{i}", crop_variety="v") for i in range(2)]
+
+    def setUp(self):
+        from rest_framework.test import APIClient
+
+        from . import throttling
+
+        throttling._buckets.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.owner)
+
+    def post(self, plots, count=1):
+        body = [
+            {"plot": plot.id, "sensor_type": "moisture", "value": 30.0 + i}
+            for plot in plots for i in range(count)
+        ]
+        return self.client.post("/api/sensor-readings/", body, format="json")
+
+    def test_bucket_refills_at_rate_up_to_burst(self):
+        from .throttling import TokenBucket
+
+        bucket = TokenBucket(30, now=0.0)
+        self.assertEqual(bucket.take(20, 5.0, 30, now=0.0), 0.0)
+        self.assertEqual(bucket.take(15, 5.0, 30, now=0.0), 1.0)
+        self.assertEqual(bucket.take(15, 5.0, 30, now=1.0), 0.0)
+        # idle for a minute: refilled to burst, not beyond
+        self.assertEqual(bucket.take(31, 5.0, 30, now=61.0), 0.0)
+        self.assertEqual(bucket.tokens, -1.0)
+
+    def test_batch_larger_than_burst_is_charged_in_full(self):
+        from .throttling import TokenBucket
+
+        bucket = TokenBucket(30, now=0.0)
+        self.assertEqual(bucket.take(1000, 5.0, 30, now=0.0), 0.0)
+        # 970 readings of debt plus the one asked for
+        self.assertAlmostEqual(bucket.take(1, 5.0, 30, now=0.0), 971 / 5.0)
+        self.assertAlmostEqual(bucket.take(1000, 5.0, 30, now=100.0), (30 + 470) / 5.0)
+        self.assertEqual(bucket.take(1, 5.0, 30, now=194.4), 0.0)
+
+    def test_large_batch_throttles_the_next_upload(self):
+        response = self.post(self.plots[:1], count=100)
+        self.assertEqual(response.status_code, 201, response.content)
+
+        response = self.post(self.plots[:1])
+        self.assertEqual(response.status_code, 429)
+        # 70 readings of debt plus this one at 5 per second
+        self.assertEqual(response["Retry-After"], "15")
+        self.assertEqual(SensorReading.objects.count(), 100)
+
+    def test_batches_are_charged_per_plot(self):
+        self.assertEqual(self.post(self.plots, count=30).status_code, 201)
+        self.assertEqual(self.post(self.plots[:1]).status_code, 429)
+        self.assertEqual(self.post(self.plots[1:]).status_code, 429)
+
+    def test_users_have_separate_buckets(self):
+        from .models import UserProfile
+
+        self.assertEqual(self.post(self.plots[:1], count=30).status_code, 201)
+        other = User.objects.create(username="throttle-other")
+        UserProfile.objects.create(user=other, role="farmer")
+        self.client.force_authenticate(other)
+        self.assertEqual(self.post(self.plots[:1]).status_code, 201)
+
+    def test_write_cap_sheds_with_503(self):
+        with self.settings(INGEST_THROTTLE={"MAX_PENDING_WRITES": 0, "SHED_RETRY_AFTER": 2}):
+            response = self.post(self.plots[:1])
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response["Retry-After"], "2")
+        self.assertFalse(SensorReading.objects.exists())
+
+
+class CompressionMiddlewareTests(SimpleTestCase):
+    body = b'{"results": [' + b",".join(b'{"value": %d}' % i for i in range(500)) + b"]}"
+
+    def respond(self, path, content_type="application/json", accept="gzip", **headers):
+        from django.http import HttpResponse
+        from django.test import RequestFactory
+
+        from .middleware import CompressionMiddleware
+
+        def view(request):
+            response = HttpResponse(self.body, content_type=content_type)
+            for name, value in headers.items():
+                response[name] = value
+            return response
+
+        request = RequestFactory().get(path, HTTP_ACCEPT_ENCODING=accept)
+        return CompressionMiddleware(view)(request)
+
+    def test_bulk_endpoint_is_gzipped(self):
+        response = self.respond("/api/sensor-readings/export/")
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertEqual(gzip.decompress(response.content), self.body)
+        self.assertIn("Accept-Encoding", response["Vary"])
+
+    def test_other_paths_and_html_are_not_compressed(self):
+        for path, content_type in [
+            ("/admin/login/", "text/html; charset=utf-8"),
+            ("/api/sensor-readings/", "text/html; charset=utf-8"),
+            ("/api/plots/live/", "application/json"),
+        ]:
+            with self.subTest(path=path, content_type=content_type):
+                response = self.respond(path, content_type)
+                self.assertFalse(response.has_header("Content-Encoding"))
+                self.assertEqual(response.content, self.body)
+
+    def test_no_transform_is_honoured(self):
+        response = self.respond("/api/anomalies/", **{"Cache-Control": "private, no-transform"})
+        self.assertFalse(response.has_header("Content-Encoding"))
+
+    def test_refused_gzip_is_not_sent(self):
+        response = self.respond("/api/anomalies/", accept="gzip;q=0, identity")
+        self.assertFalse(response.has_header("Content-Encoding"))
+
+    def test_zstd_when_preferred_and_available(self):
+        with mock.patch("monitoring.middleware._zstd_compress", lambda data, level: b"zstd" + data[:10]):
+            response = self.respond("/api/anomalies/", accept="gzip;q=0.5, zstd", ETag='"abc"')
+        self.assertEqual(response["Content-Encoding"], "zstd")
+        self.assertEqual(response.content, b"zstd" + self.body[:10])
+        self.assertEqual(response["ETag"], 'W/"abc"')
+
+
+class DeviceAPIKeyTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        owner = User.objects.create(username="device-tests")
+        farm = FarmProfile.objects.create(owner=owner, name="f", location="l", size_hectares=1, crop_type="c")
+        cls.plot, cls.other_plot = [FieldPlot.objects.create(farm=farm, name=f"p{i}", crop_variety="v") for i in range(2)]
+
+    def setUp(self):
+        from rest_framework.test import APIClient
+
+        from . import authentication, throttling
+        from .authentication import create_device_key
+
+        authentication._key_cache.clear()
+        throttling._buckets.clear()
+        self.key, self.raw_key = create_device_key("gateway", [self.plot.id])
+        self.client = APIClient()
+
+    def post(self, raw_key, plot=None):
+        self.client.credentials(HTTP_AUTHORIZATION=f"Api-Key {raw_key}")
+        reading = {"plot": (plot or self.plot).id, "sensor_type": "moisture", "value": 30.0}
+        return self.client.post("/api/sensor-readings/", reading, format="json")
+
+    def test_valid_key_posts_for_its_plot(self):
+        response = self.post(self.raw_key)
+        self.assertEqual(response.status_code, 201, response.content)
+
+    def test_wrong_secret_is_rejected(self):
+        response = self.post(f"{self.key.prefix}.not-the-secret")
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response["WWW-Authenticate"], "Api-Key")
+
+    def test_malformed_header_is_rejected(self):
+        self.assertEqual(self.post("no-dot-in-key").status_code, 401)
+
+    def test_revoked_key_is_rejected(self):
+        self.key.is_active = False
+        self.key.save()
+        self.assertEqual(self.post(self.raw_key).status_code, 401)
+
+    def test_revoked_elsewhere_is_rejected_once_the_cache_expires(self):
+        from .models import DeviceAPIKey
+
+        self.assertEqual(self.post(self.raw_key).status_code, 201)
+        # revoked by another worker: no signal reaches this process's cache
+        DeviceAPIKey.objects.filter(pk=self.key.pk).update(is_active=False)
+        self.assertEqual(self.post(self.raw_key).status_code, 201)
+
+        later = time.monotonic() + 61
+        with mock.patch("monitoring.authentication.time.monotonic", return_value=later):
+            self.assertEqual(self.post(self.raw_key).status_code, 401)
+
+    def test_deleted_key_is_rejected(self):
+        self.assertEqual(self.post(self.raw_key).status_code, 201)
+        self.key.delete()
+        self.assertEqual(self.post(self.raw_key).status_code, 401)
+
+    def test_plot_outside_the_key_scope_is_forbidden(self):
+        response = self.post(self.raw_key, plot=self.other_plot)
+        self.assertEqual(response.status_code, 403)
+        self.assertFalse(SensorReading.objects.filter(plot=self.other_plot).exists())
+
+    def test_batch_with_a_plot_outside_the_scope_is_forbidden(self):
+        self.client.credentials(HTTP_AUTHORIZATION=f"Api-Key {self.raw_key}")
+        body = [
+            {"plot": plot.id, "sensor_type": "moisture", "value": 30.0}
+            for plot in (self.plot, self.other_plot)
+        ]
+        response = self.client.post("/api/sensor-readings/", body, format="json")
+        self.assertEqual(response.status_code, 403)
+        self.assertFalse(SensorReading.objects.exists())
+
+    def test_scope_change_applies_immediately(self):
+        self.assertEqual(self.post(self.raw_key, plot=self.other_plot).status_code, 403)
+        self.key.plots.add(self.other_plot)
+        self.assertEqual(self.post(self.raw_key, plot=self.other_plot).status_code, 201)
+
+    def test_unknown_prefix_is_not_cached(self):
+        from . import authentication
+
+        self.assertEqual(self.post("unknown.secret").status_code, 401)
+        self.assertIsNone(authentication.get_device_key("unknown"))
+        self.assertNotIn("unknown", authentication._key_cache)
+
+
+class RoleTokenTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        from .models import UserProfile
+
+        cls.user = User.objects.create_user(username="jwt-tests", password="pw-jwt-tests")
+        cls.profile = UserProfile.objects.create(user=cls.user, role="farmer")
+        farm = FarmProfile.objects.create(owner=cls.user, name="f", location="l", size_hectares=1, crop_type="c")
+        cls.plot = FieldPlot.objects.create(farm=farm, name="p", crop_variety="v")
+
+    def setUp(self):
+        from rest_framework.test import APIClient
+
+        from . import throttling
+
+        throttling._buckets.clear()
+        self.client = APIClient()
+
+    def obtain(self):
+        response = self.client.post(
+            "/api/token/", {"username": "jwt-tests", "password": "pw-jwt-tests"}, format="json"
+        )
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()
+
+    def refresh(self, refresh):
+        return self.client.post("/api/token/refresh/", {"refresh": refresh}, format="json")
+
+    def post_reading(self, access):
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {access}")
+        reading = {"plot": self.plot.id, "sensor_type": "moisture", "value": 30.0}
+        response = self.client.post("/api/sensor-readings/", reading, format="json")
+        self.client.credentials()
+        return response
+
+    def test_tokens_carry_the_role(self):
+        from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
+
+        from .permissions import ROLE_CLAIM
+
+        tokens = self.obtain()
+        self.assertEqual(AccessToken(tokens["access"])[ROLE_CLAIM], "farmer")
+        self.assertEqual(RefreshToken(tokens["refresh"])[ROLE_CLAIM], "farmer")
+        self.assertEqual(self.post_reading(tokens["access"]).status_code, 201)
+
+    def test_refresh_reads_a_demoted_role(self):
+        from rest_framework_simplejwt.tokens import AccessToken
+
+        from .permissions import ROLE_CLAIM
+
+        tokens = self.obtain()
+        self.profile.role = "worker"
+        self.profile.save()
+
+        response = self.refresh(tokens["refresh"])
+        self.assertEqual(response.status_code, 200, response.content)
+        access = response.json()["access"]
+        self.assertEqual(AccessToken(access)[ROLE_CLAIM], "worker")
+        self.assertEqual(self.post_reading(access).status_code, 403)
+
+    def test_refresh_rejects_inactive_users(self):
+        tokens = self.obtain()
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.refresh(tokens["refresh"]).status_code, 401)
+
+    def test_refresh_rejects_deleted_users(self):
+        tokens = self.obtain()
+        User.objects.filter(pk=self.user.pk).delete()
+        self.assertEqual(self.refresh(tokens["refresh"]).status_code, 401)
+
+    def test_refresh_rejects_invalid_tokens(self):
+        self.assertEqual(self.refresh("not-a-token").status_code, 401)
+
+
+@mock.patch("monitoring.ingest._ensure_flusher")
+class WriteBehindTests(TestCase):
+    """The buffer is flushed by drain() in the test thread; no flusher thread is started."""
+
+    @classmethod
+    def setUpTestData(cls):
+        from .models import UserProfile
+
+        cls.owner = User.objects.create(username="write-behind-tests")
+        UserProfile.objects.create(user=cls.owner, role="farmer")
+        farm = FarmProfile.objects.create(owner=cls.owner, name="f", location="l", size_hectares=1, crop_type="c")
+        cls.plot = FieldPlot.objects.create(farm=farm, name="p", crop_variety="v")
+
+    def setUp(self):
+        from rest_framework.test import APIClient
+
+        from . import ingest, throttling
+
+        throttling._buckets.clear()
+        self.addCleanup(ingest._stopping.clear)
+        self.client = APIClient()
+        self.client.force_authenticate(self.owner)
+
+    def post(self, body):
+        with self.settings(INGEST_WRITE_BEHIND={"ENABLED": True, "MAX_QUEUE": 5, "BATCH_SIZE": 2}):
+            return self.client.post("/api/sensor-readings/", body, format="json")
+
+    def reading(self, seconds, **extra):
+        return {"plot": self.plot.id, "sensor_type": "moisture", "value": 30.0 + seconds,
+                "device_timestamp": (START + timedelta(seconds=seconds)).isoformat(), **extra}
+
+    def drain(self):
+        from .ingest import drain
+
+        with self.settings(INGEST_WRITE_BEHIND={"ENABLED": True, "BATCH_SIZE": 2}):
+            return drain()
+
+    def test_buffered_readings_are_stored_on_drain(self, _):
+        response = self.post([self.reading(0), self.reading(1), self.reading(2)])
+        self.assertEqual(response.status_code, 202, response.content)
+        self.assertEqual(response.json(), {"received": 3, "queued": 3})
+        self.assertEqual(self.post(self.reading(3)).status_code, 202)
+        self.assertFalse(SensorReading.objects.exists())
+
+        self.assertEqual(self.drain(), 4)
+        self.assertEqual(SensorReading.objects.count(), 4)
+        latest = LatestReading.objects.get(plot=self.plot, sensor_type="moisture")
+        self.assertEqual(latest.value, 33.0)
+
+    def test_retried_upload_is_stored_once(self, _):
+        self.assertEqual(self.post([self.reading(0), self.reading(1)]).status_code, 202)
+        self.assertEqual(self.post([self.reading(0), self.reading(1)]).status_code, 202)
+        self.assertEqual(self.drain(), 2)
+        self.assertEqual(SensorReading.objects.count(), 2)
+
+    def test_full_buffer_sheds_with_503(self, _):
+        self.assertEqual(self.post([self.reading(i) for i in range(4)]).status_code, 202)
+        response = self.post([self.reading(4), self.reading(5)])
+        self.assertEqual(response.status_code, 503)
+        self.assertIn("Retry-After", response)
+        self.assertEqual(self.drain(), 4)
+
+    def test_no_buffering_after_drain(self, _):
+        from .ingest import buffer_readings
+
+        self.drain()
+        self.assertFalse(buffer_readings([SensorReading(plot=self.plot, sensor_type="moisture", value=1.0)]))
+        self.assertEqual(self.post(self.reading(0)).status_code, 503)
+
+    def test_flush_retries_then_drops(self, _):
+        from . import ingest, metrics
+
+        readings = [SensorReading(plot=self.plot, sensor_type="moisture", value=1.0, timestamp=START)]
+        locked = OSError("database is locked")
+
+        with mock.patch("monitoring.ingest.time.sleep"), \
+                mock.patch("monitoring.ingest.insert_readings", side_effect=[locked, readings]) as insert:
+            self.assertEqual(ingest.flush_batch(readings), 1)
+        self.assertEqual(insert.call_count, 2)
+
+        dropped = metrics.snapshot()["counters"].get("ingest.dropped", 0)
+        with self.settings(INGEST_WRITE_BEHIND={"RETRIES": 2}), mock.patch("monitoring.ingest.time.sleep"), \
+                mock.patch("monitoring.ingest.insert_readings", side_effect=locked) as insert, \
+                self.assertLogs("monitoring.ingest", "ERROR"):
+            self.assertEqual(ingest.flush_batch(readings), 0)
+        self.assertEqual(insert.call_count, 3)
+        self.assertEqual(metrics.snapshot()["counters"]["ingest.dropped"], dropped + 1)
+
+
+class RingWindowTests(TestCase):
+    """
+    Detection windows read through the ring buffers match the database window.
+
+    Readings are stamped from a second after the ring is created (the ring
+    only covers what arrived after it existed); negative offsets are older
+    and only in the database.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        owner = User.objects.create(username="ring-tests")
+        farm = FarmProfile.objects.create(owner=owner, name="f", location="l", size_hectares=1, crop_type="c")
+        cls.plot = FieldPlot.objects.create(farm=farm, name="p", crop_variety="v")
+
+    def setUp(self):
+        import shutil
+        import tempfile
+
+        from . import ringbuffer
+
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        settings = self.settings(READING_RING={"DIR": directory, "SLOTS": 64})
+        settings.enable()
+        self.addCleanup(settings.disable)
+        ringbuffer._rings.clear()
+        self.addCleanup(ringbuffer._rings.clear)
+        ringbuffer.get_ring(self.plot.id)
+        self.t0 = datetime.fromtimestamp(math.floor(time.time()) + 1, dt_timezone.utc)
+
+    def insert(self, seconds, sensors=("temperature", "humidity", "moisture"), value=None):
+        from .ingest import insert_readings
+
+        readings = [
+            SensorReading(
+                plot=self.plot, sensor_type=name, timestamp=self.t0 + timedelta(seconds=s, microseconds=1000 * i),
+                value=value if value is not None else {"temperature": 20.0, "humidity": 60.0, "moisture": 30.0}[name] + s,
+            )
+            for s in seconds for i, name in enumerate(sensors)
+        ]
+        with self.captureOnCommitCallbacks(execute=True):
+            insert_readings(readings)
+
+    def assertMatchesDatabase(self):
+        """get_vectors() (ring plus database) returns the database window, partly from the ring."""
+        from mlmodule.iris_service import REQUIRED_SENSORS, get_sensor_data, get_vectors, prepare_vectors
+
+        from . import metrics
+
+        def rows(frame):
+            return [
+                (int(row.timestamp.timestamp()), *(round(getattr(row, name), 9) for name in REQUIRED_SENSORS))
+                for row in frame.itertuples()
+            ]
+
+        ring_vectors = metrics.snapshot()["counters"].get("detection.ring_vectors", 0)
+        vectors = get_vectors(self.plot.id, minutes=5)
+        expected = prepare_vectors(get_sensor_data(self.plot.id, 5))
+        self.assertTrue(len(expected))
+        self.assertEqual(rows(vectors), rows(expected))
+
+        self.assertGreater(metrics.snapshot()["counters"].get("detection.ring_vectors", 0), ring_vectors)
+
+    def test_ring_window_matches_database(self):
+        self.insert(range(0, 40))
+        self.assertMatchesDatabase()
+
+    def test_late_reading_in_an_old_second(self):
+        self.insert(range(0, 40))
+        # too far back for the ring (LOOKBACK slots): the database averages it in
+        self.insert([5], sensors=("moisture",), value=90.0)
+        self.assertMatchesDatabase()
+
+    def test_late_reading_within_lookback(self):
+        self.insert(range(0, 40), sensors=("temperature", "humidity"))
+        self.insert(range(0, 30), sensors=("moisture",))
+        # completes a vector the ring still holds
+        self.insert([35], sensors=("moisture",))
+        self.assertMatchesDatabase()
+
+    def test_late_second_without_a_slot(self):
+        self.insert(range(0, 40, 2))
+        # a whole vector for a second the ring skipped
+        self.insert([9])
+        self.assertMatchesDatabase()
+
+    def test_database_part_with_some_sensor_types(self):
+        # before the ring existed, only moisture reported
+        self.insert(range(-30, -20), sensors=("moisture",))
+        self.insert(range(0, 20))
+        self.assertMatchesDatabase()
+
+    def test_reset_ring_reads_older_readings_from_the_database(self):
+        from . import ringbuffer
+
+        self.insert(range(0, 20))
+        # flush/migrate after those readings
+        with mock.patch("monitoring.ringbuffer.time.time", return_value=self.t0.timestamp() + 20):
+            ringbuffer.clear()
+        self.insert(range(20, 30))
+        self.assertMatchesDatabase()
@@ -0,0 +1,176 @@
+"""
+Ingestion rate limiting and load shedding.
+
+IngestRateThrottle
+    Token bucket per (device or user, plot) on POST /api/sensor-readings/,
+    held in process memory. A bucket refills at RATE readings per second up
+    to BURST; an empty bucket answers 429 with Retry-After. Every reading
+    of a batch is charged: a batch larger than BURST is taken from a full
+    bucket and leaves it in debt until it has refilled.
+
+ingest_slot()
+    Caps the writes in progress across all devices at MAX_PENDING_WRITES;
+    beyond that requests get 503 with Retry-After instead of queueing on
+    the SQLite writer lock. In write-behind mode the buffer's MAX_QUEUE
+    plays the same role (monitoring/ingest.py).
+
+Both are configured by settings.INGEST_THROTTLE.
+"""
+import math
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from rest_framework import status
+from rest_framework.exceptions import APIException
+from rest_framework.throttling import BaseThrottle
+
+from . import metrics
+
+DEFAULTS = {
+    "RATE": 5.0,
+    "BURST": 30,
+    "MAX_BUCKETS": 10000,
+    "MAX_PENDING_WRITES": 64,
+    "SHED_RETRY_AFTER": 1,
+}
+
+
+def _config(name):
+    return getattr(settings, "INGEST_THROTTLE", {}).get(name, DEFAULTS[name])
+
+
+# -----------------------------------------------------------------------------
+# Token buckets
+# -----------------------------------------------------------------------------
+class TokenBucket:
+    __slots__ = ("tokens", "updated")
+
+    def __init__(self, burst, now):
+        self.tokens = float(burst)
+        self.updated = now
+
+    def take(self, cost, rate, burst, now):
+        """
+        Take cost tokens; returns 0 on success, else seconds until they are available.
+
+        A cost above burst needs a full bucket and drives it negative.
+        """
+        self.tokens = min(burst, self.tokens + (now - self.updated) * rate)
+        self.updated = now
+        needed = min(cost, burst)
+        if self.tokens >= needed:
+            self.tokens -= cost
+            return 0.0
+        return (needed - self.tokens) / rate
+
+
+_buckets = {}
+_buckets_lock = threading.Lock()
+
+
+def _prune_buckets(now, rate, burst):
+    # buckets idle long enough to be full again carry no state
+    for key in [k for k, b in _buckets.items() if b.tokens + (now - b.updated) * rate >= burst]:
+        del _buckets[key]
+
+
+def take_tokens(key, cost=1):
+    """Charge cost readings to a bucket. Returns 0 when allowed, else the wait in seconds."""
+    rate, burst = _config("RATE"), _config("BURST")
+    now = time.monotonic()
+
+    with _buckets_lock:
+        bucket = _buckets.get(key)
+        if bucket is None:
+            if len(_buckets) >= _config("MAX_BUCKETS"):
+                _prune_buckets(now, rate, burst)
+            bucket = _buckets[key] = TokenBucket(burst, now)
+        return bucket.take(cost, rate, burst, now)
+
+
+def _plots_in(data):
+    """{plot_id: reading count} for a single reading or a list of readings."""
+    items = data if isinstance(data, list) else [data]
+    counts = {}
+    for item in items:
+        plot = item.get("plot") if hasattr(item, "get") else None
+        counts[str(plot)] = counts.get(str(plot), 0) + 1
+    return counts
+
+
+class IngestRateThrottle(BaseThrottle):
+    """Per-device (or per-user) and per-plot token bucket for reading uploads."""
+
+    def get_ident(self, request):
+        key = request.auth
+        if getattr(key, "role", None) == "device":
+            return f"device:{key.prefix}"
+        if request.user and request.user.is_authenticated:
+            return f"user:{request.user.pk}"
+        return f"ip:{super().get_ident(request)}"
+
+    def allow_request(self, request, view):
+        self.wait_seconds = 0.0
+        if request.method != "POST":
+            return True
+
+        ident = self.get_ident(request)
+        for plot, count in _plots_in(request.data).items():
+            wait = take_tokens((ident, plot), count)
+            if wait:
+                self.wait_seconds = wait
+                metrics.incr("ingest.throttled")
+                return False
+        return True
+
+    def wait(self):
+        return self.wait_seconds
+
+
+# -----------------------------------------------------------------------------
+# Load shedding
+# -----------------------------------------------------------------------------
+class IngestOverloaded(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = "Ingestion is overloaded, retry later."
+    default_code = "ingest_overloaded"
+
+    def __init__(self, wait):
+        super().__init__()
+        # DRF's exception handler turns this into Retry-After
+        self.wait = wait
+
+
+def overloaded():
+    """IngestOverloaded to raise when shedding an upload (counted in ingest.shed)."""
+    metrics.incr("ingest.shed")
+    return IngestOverloaded(math.ceil(_config("SHED_RETRY_AFTER")))
+
+
+_pending_writes = 0
+_pending_lock = threading.Lock()
+
+
+def pending_writes():
+    return _pending_writes
+
+
+metrics.register_gauge("ingest.pending_writes", pending_writes)
+
+
+@contextmanager
+def ingest_slot():
+    """Hold one of MAX_PENDING_WRITES write slots, or raise IngestOverloaded (503)."""
+    global _pending_writes
+
+    with _pending_lock:
+        if _pending_writes >= _config("MAX_PENDING_WRITES"):
+            raise overloaded()
+        _pending_writes += 1
+    try:
+        yield
+    finally:
+        with _pending_lock:
+            _pending_writes -= 1
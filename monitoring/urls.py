@@ -4,14 +4,18 @@ from .views import (
     SensorReadingViewSet,
     AnomalyEventViewSet,
     AgentRecommendationViewSet,
-    UserProfileViewSet,   )
+    UserProfileViewSet,
+    FieldPlotViewSet,
+    metrics_view,   )
 
 router = DefaultRouter()
 router.register("sensor-readings", SensorReadingViewSet, basename="sensor-reading")
 router.register("anomalies", AnomalyEventViewSet, basename="anomaly")
 router.register("recommendations", AgentRecommendationViewSet, basename="recommendation")
 router.register("user-profiles", UserProfileViewSet, basename="user-profile")  
+router.register("plots", FieldPlotViewSet, basename="plot")
 
 urlpatterns = [
+    path("metrics/", metrics_view, name="metrics"),
     path("", include(router.urls)),
 ]
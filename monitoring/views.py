@@ -1,17 +1,44 @@
+import heapq
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import OuterRef, Subquery
+from django.utils import timezone
 from rest_framework import viewsets, permissions, status
-from rest_framework.decorators import action
+from rest_framework.decorators import action, api_view, permission_classes
+from rest_framework.exceptions import ValidationError
+from rest_framework.renderers import BrowsableAPIRenderer
 from rest_framework.response import Response
+from rest_framework.settings import api_settings
 
-from .models import SensorReading, AnomalyEvent, AgentRecommendation, UserProfile
+from .models import (
+    SensorReading, AnomalyEvent, AgentRecommendation, UserProfile, FieldPlot, LatestReading,
+)
 from .serializers import (
     SensorReadingSerializer,
+    SensorReadingBatchSerializer,
     AnomalyEventSerializer,
     AgentRecommendationSerializer,
     UserProfileSerializer,
+    FieldPlotSerializer,
 )
 from .permissions import *
+from . import metrics
+from .filters import parse_choice, parse_datetime_param, parse_float_param, parse_list
+from .stats import BUCKETS, reading_stats
+from .archive import archived_readings, archived_rows, archives_in
+from .ingest import (
+    assign_idempotency_key, buffer_readings, insert_readings, update_latest_readings,
+    write_behind_enabled,
+)
+from .db import ReadConnectionMixin
+from .fast_serializers import FastJSONRenderer, FastListMixin, get_row_encoder
+from .renderers import BINARY_RENDERERS
+from .authentication import DeviceAPIKeyAuthentication, check_device_plot
+from .throttling import IngestRateThrottle, ingest_slot, overloaded
 
-from mlmodule.iris_service import run_batch_detection
+from mlmodule.iris_service import run_batch_detection_cached
 
 
 class UserProfileViewSet(viewsets.ModelViewSet):
@@ -19,10 +46,15 @@ class UserProfileViewSet(viewsets.ModelViewSet):
     serializer_class = UserProfileSerializer
     permission_classes = [permissions.IsAuthenticated]
 
-class SensorReadingViewSet(viewsets.ModelViewSet):
+class SensorReadingViewSet(ReadConnectionMixin, FastListMixin, viewsets.ModelViewSet):
     queryset = SensorReading.objects.all().order_by("-timestamp")
     serializer_class = SensorReadingSerializer
     permission_classes = [ReadOnlyOrFarmer]
+    renderer_classes = [FastJSONRenderer, BrowsableAPIRenderer, *BINARY_RENDERERS]
+    # devices post with an API key; users keep the default classes
+    authentication_classes = [DeviceAPIKeyAuthentication, *api_settings.DEFAULT_AUTHENTICATION_CLASSES]
+    # POSTs only: per device/plot token bucket (429) and write cap (503)
+    throttle_classes = [IngestRateThrottle]
 
     def get_queryset(self):
         qs = super().get_queryset()
@@ -31,9 +63,244 @@ class SensorReadingViewSet(viewsets.ModelViewSet):
             qs = qs.filter(plot_id=plot_id)
         return qs
 
+    def get_device_name(self, source):
+        # the device part of the natural key: the API key, else the
+        # authenticated user and the source they report (free text, so it
+        # cannot tell users apart by itself)
+        key = self.request.auth
+        if getattr(key, "role", None) == "device":
+            return f"key:{key.prefix}"
+        return f"user:{self.request.user.pk}:{source}"
+
+    def create(self, request, *args, **kwargs):
+        """
+        POST one reading (object) or a batch (list). A reading whose
+        idempotency key is already stored is not inserted again: a single
+        POST answers 200 with the stored reading.
+
+        In write-behind mode the reading is buffered and the answer is 202
+        (no id yet; duplicates are dropped at flush time).
+        """
+        if isinstance(request.data, list):
+            return self.create_batch(request)
+
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        if write_behind_enabled():
+            data = serializer.validated_data
+            check_device_plot(request, data["plot"].id)
+            assign_idempotency_key(data, self.get_device_name(data.get("source", "simulator")))
+            reading = SensorReading(**data)
+            self.buffer([reading])
+            return Response(self.get_serializer(reading).data, status=status.HTTP_202_ACCEPTED)
+
+        try:
+            self.perform_create(serializer)
+        except IntegrityError:
+            key = serializer.validated_data.get("idempotency_key")
+            existing = SensorReading.objects.filter(idempotency_key=key).first() if key else None
+            if existing is None:
+                raise
+            metrics.incr("ingest.duplicates")
+            return Response(self.get_serializer(existing).data, status=status.HTTP_200_OK)
+
+        headers = self.get_success_headers(serializer.data)
+        return Response(serializer.data, status=status.HTTP_201_CREATED, headers=headers)
+
+    def perform_create(self, serializer):
+        data = serializer.validated_data
+        check_device_plot(self.request, data["plot"].id)
+        assign_idempotency_key(data, self.get_device_name(data.get("source", "simulator")))
 
+        # reading + latest-value upsert commit together
+        with ingest_slot(), transaction.atomic():
+            reading = serializer.save()
+            update_latest_readings([reading])
+        metrics.incr("ingest.accepted")
+
+    def create_batch(self, request):
+        """
+        Batch upload: list of readings, at most INGEST_MAX_BATCH. Answers
+        {"received", "created", "duplicates"}, or 202 {"received", "queued"}
+        in write-behind mode.
+        """
+        max_batch = getattr(settings, "INGEST_MAX_BATCH", 1000)
+        if len(request.data) > max_batch:
+            raise ValidationError({"non_field_errors": f"At most {max_batch} readings per batch."})
+
+        serializer = SensorReadingBatchSerializer(data=request.data, many=True)
+        serializer.is_valid(raise_exception=True)
+        items = serializer.validated_data
+
+        plot_ids = {item["plot_id"] for item in items}
+        unknown = plot_ids - set(FieldPlot.objects.filter(id__in=plot_ids).values_list("id", flat=True))
+        if unknown:
+            raise ValidationError({"plot": f"Unknown plot(s): {', '.join(map(str, sorted(unknown)))}"})
+        for plot_id in sorted(plot_ids):
+            check_device_plot(request, plot_id)
+
+        readings = []
+        for item in items:
+            assign_idempotency_key(item, self.get_device_name(item.get("source", "simulator")))
+            readings.append(SensorReading(**item))
+
+        if write_behind_enabled():
+            self.buffer(readings)
+            return Response(
+                {"received": len(readings), "queued": len(readings)},
+                status=status.HTTP_202_ACCEPTED,
+            )
+
+        with ingest_slot():
+            created = insert_readings(readings)
+
+        duplicates = len(readings) - len(created)
+        metrics.incr("ingest.accepted", len(created))
+        if duplicates:
+            metrics.incr("ingest.duplicates", duplicates)
+
+        return Response(
+            {"received": len(readings), "created": len(created), "duplicates": duplicates},
+            status=status.HTTP_201_CREATED,
+        )
 
-class AnomalyEventViewSet(viewsets.ReadOnlyModelViewSet):
+    def buffer(self, readings):
+        # a full buffer sheds the upload like the synchronous write cap
+        if not buffer_readings(readings):
+            raise overloaded()
+
+    @action(detail=False, methods=["get"], url_path="stats")
+    def stats(self, request):
+        """
+        GET /sensor-readings/stats/?plot=1,2&sensor_type=moisture&start=...&end=...&bucket=hour
+
+        count/min/max/avg/stddev per time bucket, computed in the database.
+        Defaults: all plots and sensor types, the last 24 hours, hourly buckets.
+        """
+        params = request.query_params
+        end = parse_datetime_param(params, "end", default=timezone.now())
+        start = parse_datetime_param(params, "start", default=end - timedelta(days=1))
+
+        results = reading_stats(
+            plot_ids=parse_list(params, "plot", cast=int),
+            sensor_types=parse_list(
+                params, "sensor_type", choices=dict(SensorReading.SENSOR_TYPES)
+            ),
+            start=start,
+            end=end,
+            bucket=parse_choice(params, "bucket", BUCKETS, "hour"),
+            using=self.get_read_alias(),
+        )
+        return Response(results)
+
+    @action(detail=False, methods=["get"], url_path="export")
+    def export(self, request):
+        """
+        GET /sensor-readings/export/?plot=1,2&sensor_type=moisture&start=...&end=...&fields=...
+
+        Bulk pull in time order, never paginated, including archived days
+        (whose readings have no id). Use Accept (or ?format=) msgpack, arrow
+        or npz for the binary formats.
+        """
+        params = request.query_params
+        qs = SensorReading.objects.using(self.get_read_alias()).order_by("timestamp", "id")
+
+        plot_ids = parse_list(params, "plot", cast=int)
+        if plot_ids:
+            qs = qs.filter(plot_id__in=plot_ids)
+
+        sensor_types = parse_list(params, "sensor_type", choices=dict(SensorReading.SENSOR_TYPES))
+        if sensor_types:
+            qs = qs.filter(sensor_type__in=sensor_types)
+
+        start = parse_datetime_param(params, "start")
+        if start is not None:
+            qs = qs.filter(timestamp__gte=start)
+
+        end = parse_datetime_param(params, "end")
+        if end is not None:
+            qs = qs.filter(timestamp__lt=end)
+
+        # days in cold storage are decoded and merged in timestamp order
+        archives = archives_in(plot_ids, sensor_types, start, end, using=self.get_read_alias())
+        has_archives = archives.exists()
+
+        if not self.use_fast_list(request):
+            readings = list(qs)
+            if has_archives:
+                readings = list(heapq.merge(
+                    (SensorReading(timestamp=ts, plot_id=plot, sensor_type=st, value=value,
+                                   source=source, device_timestamp=device_ts)
+                     for ts, plot, st, value, source, device_ts in archived_readings(archives, start, end)),
+                    readings,
+                    key=lambda r: r.timestamp,
+                ))
+            return Response(self.get_serializer(readings, many=True).data)
+
+        encoder = get_row_encoder(self.get_serializer_class(), self.get_list_fields())
+        if not has_archives:
+            return self.fast_list_response(encoder, qs.values_list(*encoder.columns))
+
+        live = ((row[0], row[1:]) for row in qs.values_list("timestamp", *encoder.columns).iterator(chunk_size=2000))
+        archived = ((row[0], row[1:]) for row in archived_rows(archives, ["timestamp", *encoder.columns], start, end))
+        rows = (row for _, row in heapq.merge(archived, live, key=lambda r: r[0]))
+        return self.fast_list_response(encoder, rows)
+
+
+
+class FieldPlotViewSet(ReadConnectionMixin, viewsets.ReadOnlyModelViewSet):
+    """
+    - GET /plots/        -> list plots
+    - GET /plots/live/   -> current value per sensor + last anomaly, per plot
+    """
+    queryset = FieldPlot.objects.all().order_by("id")
+    serializer_class = FieldPlotSerializer
+    permission_classes = [IsAdminFarmerWorker]
+
+    @action(detail=False, methods=["get"], url_path="live")
+    def live(self, request):
+        # reads the small LatestReading table, never the reading history
+        plot_ids = parse_list(request.query_params, "plot", cast=int)
+
+        last_anomaly = (
+            AnomalyEvent.objects
+            .filter(plot=OuterRef("pk"))
+            .order_by("-timestamp")
+            .values("id")[:1]
+        )
+        db = self.get_read_alias()
+        plots = FieldPlot.objects.using(db).annotate(last_anomaly_id=Subquery(last_anomaly)).order_by("id")
+        latest = LatestReading.objects.using(db)
+        if plot_ids:
+            plots = plots.filter(id__in=plot_ids)
+            latest = latest.filter(plot_id__in=plot_ids)
+
+        plots = list(plots)
+        anomalies = AnomalyEvent.objects.using(db).in_bulk(
+            [p.last_anomaly_id for p in plots if p.last_anomaly_id]
+        )
+
+        readings_by_plot = {}
+        for row in latest:
+            readings_by_plot.setdefault(row.plot_id, {})[row.sensor_type] = {
+                "value": row.value,
+                "timestamp": row.timestamp,
+            }
+
+        data = []
+        for plot in plots:
+            anomaly = anomalies.get(plot.last_anomaly_id)
+            data.append({
+                "plot": plot.id,
+                "name": plot.name,
+                "readings": readings_by_plot.get(plot.id, {}),
+                "last_anomaly": AnomalyEventSerializer(anomaly).data if anomaly else None,
+            })
+        return Response(data)
+
+
+class AnomalyEventViewSet(ReadConnectionMixin, FastListMixin, viewsets.ReadOnlyModelViewSet):
     """
     - GET /anomalies/            -> list anomaly events
     - POST /anomalies/run-ml/   -> trigger ML batch inference
@@ -41,25 +308,115 @@ class AnomalyEventViewSet(viewsets.ReadOnlyModelViewSet):
     queryset = AnomalyEvent.objects.all().order_by("-timestamp")
     serializer_class = AnomalyEventSerializer
     permission_classes = [IsAdminFarmerWorker]
+    renderer_classes = [FastJSONRenderer, BrowsableAPIRenderer, *BINARY_RENDERERS]
+
+    def get_queryset(self):
+        """
+        Filters: ?plot=1,2 &farm=1 &severity=medium,high &start=... &end=...
+        &min_confidence=0.5 (each backed by the anomaly indexes).
+        """
+        qs = super().get_queryset()
+        params = self.request.query_params
+
+        plot_ids = parse_list(params, "plot", cast=int)
+        if plot_ids:
+            qs = qs.filter(plot_id__in=plot_ids)
+
+        farm_ids = parse_list(params, "farm", cast=int)
+        if farm_ids:
+            qs = qs.filter(plot__farm_id__in=farm_ids)
+
+        severities = parse_list(params, "severity", choices=dict(AnomalyEvent.SEVERITY_LEVELS))
+        if severities:
+            qs = qs.filter(severity__in=severities)
+
+        start = parse_datetime_param(params, "start")
+        if start is not None:
+            qs = qs.filter(timestamp__gte=start)
+
+        end = parse_datetime_param(params, "end")
+        if end is not None:
+            qs = qs.filter(timestamp__lt=end)
+
+        min_confidence = parse_float_param(params, "min_confidence")
+        if min_confidence is not None:
+            qs = qs.filter(model_confidence__gte=min_confidence)
+
+        return qs
 
     @action(detail=False, methods=["post"], url_path="run-ml")
     def run_ml(self, request):
-        minutes = int(request.data.get("minutes", 60))
+        try:
+            minutes = int(request.data.get("minutes", 60))
+        except (TypeError, ValueError):
+            raise ValidationError({"minutes": "Must be an integer."})
+        if minutes < 1:
+            raise ValidationError({"minutes": "Must be at least 1."})
         plot_id = request.data.get("plot_id", None)
         create_events = bool(request.data.get("create_events", True))
 
-        results = run_batch_detection(
+        # same key for "1" and 1 so identical requests share one run
+        if plot_id not in (None, ""):
+            try:
+                plot_id = int(plot_id)
+            except (TypeError, ValueError):
+                raise ValidationError({"plot_id": "Must be an integer."})
+        else:
+            plot_id = None
+
+        results, cache_status = run_batch_detection_cached(
             plot_id=plot_id,        # None = ALL plots (your 3 models)
             minutes=minutes,
             create_events=create_events,
             no_duplicates=True,
         )
 
-        return Response(results, status=status.HTTP_200_OK)
+        response = Response(results, status=status.HTTP_200_OK)
+        response["X-Run-ML-Cache"] = cache_status
+        return response
 
 
 
-class AgentRecommendationViewSet(viewsets.ReadOnlyModelViewSet):
-    queryset = AgentRecommendation.objects.all().order_by("-timestamp")
+class AgentRecommendationViewSet(ReadConnectionMixin, viewsets.ReadOnlyModelViewSet):
+    queryset = (
+        AgentRecommendation.objects
+        .select_related("anomaly_event")
+        .order_by("-timestamp")
+    )
     serializer_class = AgentRecommendationSerializer
     permission_classes = [IsAdminFarmerWorker]
+
+    def get_queryset(self):
+        """
+        Filters: ?plot=1,2 &urgency=4,5 (or &min_urgency=4) &category=drought,water_stress
+        """
+        qs = super().get_queryset()
+        params = self.request.query_params
+
+        plot_ids = parse_list(params, "plot", cast=int)
+        if plot_ids:
+            qs = qs.filter(anomaly_event__plot_id__in=plot_ids)
+
+        urgencies = parse_list(params, "urgency", cast=int)
+        if urgencies:
+            qs = qs.filter(urgency__in=urgencies)
+
+        min_urgency = parse_float_param(params, "min_urgency")
+        if min_urgency is not None:
+            qs = qs.filter(urgency__gte=min_urgency)
+
+        categories = parse_list(params, "category")
+        if categories:
+            qs = qs.filter(category__in=categories)
+
+        return qs
+
+
+@api_view(["GET"])
+@permission_classes([IsAdminFarmerWorker])
+def metrics_view(request):
+    """
+    GET /api/metrics/ -> counters and gauges of this worker process
+    (e.g. recommendations.queue_depth).
+    """
+    return Response(metrics.snapshot())